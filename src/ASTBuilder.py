@@ -1,10 +1,9 @@
-from antlr4 import *
 import os.path
 from ASTVisitor import ASTVisitor
-from antlr.JavaLexer import JavaLexer
 from antlr.JavaParser import JavaParser
 from db import Database
 from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
+from utils import parseJavaFile
 
 
 class ASTBuilder:
@@ -15,12 +14,15 @@ class ASTBuilder:
     def getAST(self):
         return self.ast
 
-    def build(self, filePath) -> AbstractSyntaxTree:
-        inputStream = FileStream(filePath)
-        lexer = JavaLexer(inputStream)
-        tokens = CommonTokenStream(lexer)
-        parser = JavaParser(tokens)
-        parseTree = parser.compilationUnit()
+    def getName(self) -> str:
+        packageName = self.ast.getProperty("package")
+        filePath = self.ast.getProperty("filePath")
+        baseName = os.path.basename(os.path.splitext(filePath)[0])
+        return f"{packageName}.{baseName}"
+
+    def build(self, filePath, parseTree: JavaParser.CompilationUnitContext = None) -> AbstractSyntaxTree:
+        if parseTree is None:
+            parseTree = parseJavaFile(filePath)
         ast = AbstractSyntaxTree()
         ast.setProperty("filePath", filePath)
         visitor = ASTVisitor(ast)
@@ -37,8 +39,4 @@ class ASTBuilder:
 
     def dump(self):
         db = Database(self.projectConfig)
-        packageName = self.ast.getProperty("package")
-        filePath = self.ast.getProperty("filePath")
-        baseName = os.path.basename(os.path.splitext(filePath)[0])
-        qualifiedName = f"{packageName}.{baseName}"
-        db.putAST(os.path.basename(qualifiedName), self.ast)
+        db.putAST(os.path.basename(self.getName()), self.ast)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+class BuildCache:
+    """On-disk cache of serialized build results keyed by content hashes.
+
+    Every entry is a JSON file named by its key. The entries are evicted in LRU order
+    when the total size exceeds the limit, the order is kept in file modification times,
+    so it survives between runs.
+    """
+
+    def __init__(self, projectConfig):
+        self.cacheDir = projectConfig.get("cache-dir", Config.BUILD_CACHE_DIR)
+        self.maxSize = int(projectConfig.get("cache-size-mb", Config.BUILD_CACHE_SIZE_MB) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        # key -> size of the entry, from the least to the most recently used
+        self.entries = OrderedDict()
+        self.size = 0
+        if self.isEnabled():
+            self.loadEntries()
+
+    def isEnabled(self) -> bool:
+        return self.maxSize > 0
+
+    def loadEntries(self):
+        if not os.path.isdir(self.cacheDir):
+            return
+
+        found = []
+        for dirname, dirnames, filenames in os.walk(self.cacheDir):
+            for filename in filenames:
+                if not filename.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(dirname, filename))
+                found.append((stat.st_mtime, os.path.splitext(filename)[0], stat.st_size))
+
+        for mtime, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+
+    @staticmethod
+    def getFileKey(filePath: str) -> str:
+        # Путь входит в ключ, так как он сохраняется в узлах графов
+        h = hashlib.sha256()
+        h.update(Config.ANALYZER_VERSION.encode())
+        h.update(b"\0")
+        h.update(filePath.encode())
+        h.update(b"\0")
+        with open(filePath, "rb") as f:
+            h.update(f.read())
+        return h.hexdigest()
+
+    @staticmethod
+    def getKey(*parts: str) -> str:
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def getPath(self, key: str) -> str:
+        return os.path.join(self.cacheDir, key[:2], f"{key}.json")
+
+    def contains(self, key: str) -> bool:
+        return self.isEnabled() and key in self.entries
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.isEnabled() or key not in self.entries:
+            self.misses += 1
+            return None
+
+        path = self.getPath(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f"Broken cache entry {path}")
+            self.remove(key)
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: dict):
+        if not self.isEnabled():
+            return
+
+        path = self.getPath(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись через временный файл, чтобы прерванный запуск не оставил неполную запись
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(data, f)
+        os.replace(tmpPath, path)
+
+        self.size -= self.entries.pop(key, 0)
+        self.entries[key] = os.path.getsize(path)
+        self.size += self.entries[key]
+        self.evict()
+
+    def remove(self, key: str):
+        self.size -= self.entries.pop(key, 0)
+        try:
+            os.remove(self.getPath(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        while self.size > self.maxSize and len(self.entries) > 0:
+            key = next(iter(self.entries))
+            self.remove(key)
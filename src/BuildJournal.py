@@ -0,0 +1,91 @@
+import os
+from typing import Dict, Iterator, List, Tuple
+
+from GraphStream import GraphReader, GraphWriter
+
+# Отметки о завершении файла: после записей его классов, AST и CFG и после записей его DFG
+UNIT_DONE = "unitDone"
+DFGS_DONE = "dfgsDone"
+
+
+class BuildJournal:
+    """Append-only journal of the files finished by the current build.
+
+    The records of a file (serialized classes, AST, CFGs or DFGs) are followed by a marker
+    with the file path and the key of its content, and the journal is synced to disk after
+    the marker. A build that was interrupted replays the files whose markers match the
+    current keys and does not build them again. Records after the last marker belong to
+    an unfinished file and are dropped. The journal is removed once the database is committed.
+    """
+
+    def __init__(self, projectConfig):
+        self.path = projectConfig.get("journal", projectConfig["DB"] + ".journal")
+        self.stream = None
+        self.writer = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def readGroups(self) -> Iterator[Tuple[str, str, dict, int, int]]:
+        """(marker, file path, marker data, start offset, end offset) of every finished file."""
+        if not self.exists():
+            return
+        with open(self.path, "rb") as f:
+            reader = GraphReader(f)
+            start = f.tell()
+            try:
+                for collection, key, data in reader:
+                    if collection in (UNIT_DONE, DFGS_DONE):
+                        yield collection, key, data, start, f.tell()
+                        start = f.tell()
+            except ValueError:
+                # Запись, оборванная при сбое, и всё после неё не используются
+                return
+
+    def getFinished(self, marker: str) -> Dict[str, Tuple[dict, int]]:
+        """file path -> (marker data, start offset of the records) of the files finished with the marker."""
+        return {filePath: (data, start) for collection, filePath, data, start, end in self.readGroups()
+                if collection == marker}
+
+    def readRecords(self, start: int) -> List[Tuple[str, str, dict]]:
+        records = []
+        with open(self.path, "rb") as f:
+            reader = GraphReader(f)
+            f.seek(start)
+            for collection, key, data in reader:
+                if collection in (UNIT_DONE, DFGS_DONE):
+                    break
+                records.append((collection, key, data))
+        return records
+
+    def open(self):
+        if self.writer is not None:
+            return
+        # Дописывание начинается после последней отметки, хвост незавершённого файла отрезается
+        end = 0
+        for group in self.readGroups():
+            end = group[4]
+        if end == 0:
+            self.stream = open(self.path, "wb")
+            self.writer = GraphWriter(self.stream)
+        else:
+            self.stream = open(self.path, "r+b")
+            self.stream.truncate(end)
+            self.stream.seek(end)
+            self.writer = GraphWriter(self.stream, writeHeader=False)
+
+    def write(self, records: List[Tuple[str, str, dict]], marker: str, filePath: str, data: dict):
+        self.open()
+        for collection, key, value in records:
+            self.writer.write(collection, key, value)
+        self.writer.write(marker, filePath, data)
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+
+    def remove(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.writer = None
+        if self.exists():
+            os.remove(self.path)
@@ -1,12 +1,11 @@
 import logging
 from typing import Dict, List
 
-from antlr4 import *
 from CFGVisitor import CFGVisitor
-from antlr.JavaLexer import JavaLexer
 from antlr.JavaParser import JavaParser
 from db import Database
 from graphs.cfg.ControlFlowGraph import ControlFlowGraph
+from utils import parseJavaFile
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -25,12 +24,9 @@ class CFGBuilder:
     def getCFGs(self):
         return self.CFGs
 
-    def build(self, filePath: str) -> Dict[str, ControlFlowGraph]:
-        inputStream = FileStream(filePath)
-        lexer = JavaLexer(inputStream)
-        tokens = CommonTokenStream(lexer)
-        parser = JavaParser(tokens)
-        parseTree = parser.compilationUnit()
+    def build(self, filePath: str, parseTree: JavaParser.CompilationUnitContext = None) -> Dict[str, ControlFlowGraph]:
+        if parseTree is None:
+            parseTree = parseJavaFile(filePath)
         cfgs = dict()
         visitor = CFGVisitor(cfgs, filePath=filePath)
         visitor.visit(parseTree)
@@ -1,20 +1,20 @@
 import logging
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple
 
-from antlr4 import *
 from DFGVisitor import DFGVisitor
 from GremlinDriver import Gremlin
 from JavaClassExtractor import JavaClassExtractor
 from JavaStructures import MethodDefInfo
-from antlr.JavaLexer import JavaLexer
 from antlr.JavaParser import JavaParser
-from db import Database
+from db import Database, DBCollections
 from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
-from graphs.cfg.CFPathTraversal import CFPathTraversal
 from graphs.cfg.ControlFlowGraph import ControlFlowGraph
 from graphs.ddg.DFEdge import DFEdge, DFEdgeKind
+from graphs.ddg.DFNode import DFNode
 from graphs.ddg.DataFlowGraph import DataFlowGraph
-from graphs.digraph import Edge
+from graphs.ddg.ReachingDefinitions import ReachingDefinitions
+from schemas import DFNodeSchema
+from utils import parseJavaFile
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -34,12 +34,10 @@ class DFGBuilder:
     def getDFGs(self):
         return self.DFGs
 
-    def build(self, filePath: str, ast: AbstractSyntaxTree) -> Dict[str, DataFlowGraph]:
-        inputStream = FileStream(filePath)
-        lexer = JavaLexer(inputStream)
-        tokens = CommonTokenStream(lexer)
-        parser = JavaParser(tokens)
-        parseTree = parser.compilationUnit()
+    def build(self, filePath: str, ast: AbstractSyntaxTree, parseTree: JavaParser.CompilationUnitContext = None,
+              cfgs: Dict[str, ControlFlowGraph] = None) -> Dict[str, DataFlowGraph]:
+        if parseTree is None:
+            parseTree = parseJavaFile(filePath)
 
         # Extract the information of all given Java classes
         # logger.info("\nExtracting class-infos ... ")
@@ -67,24 +65,18 @@ class DFGBuilder:
         # TODO implement
         pass
 
-        logger.info("Iterative DEF-USE analysis ... ")
+        # Повторные проходы ничего не меняли: DEF-информация методов между проходами не распространяется
+        # (см. закомментированную инициализацию выше), поэтому DEF/USE всех узлов известны после первого прохода
+        logger.info("DEF-USE analysis ... ")
         dfgs = dict()
-        iteration = 0
-        while True:
-            iteration += 1
-            changed = False
-            visitor = DFGVisitor(iteration, dfgs, ast, filePath, Database(self.projectConfig), self.projectConfig)
-            visitor.visit(parseTree)
-            changed |= visitor.changed
-            logger.debug("Iteration #" + str(iteration) + ": " + ("CHANGED" if changed else "NO-CHANGE"))
-            logging.debug("========================================")
-            if not changed:
-                break
+        visitor = DFGVisitor(1, dfgs, ast, filePath, Database(self.projectConfig), self.projectConfig)
+        visitor.visit(parseTree)
         logger.info("Done.")
 
+        # CFGs built in the same pipeline run are passed in memory, otherwise they are loaded from the DB
         db = Database(self.projectConfig)
         for qn, dfg in dfgs.items():
-            cfg = db.getCFG(qn)
+            cfg = cfgs.get(qn) if cfgs is not None else db.getCFG(qn)
             dfg.attachCFG(cfg)
 
         logger.info("Adding data-flows...")
@@ -100,64 +92,67 @@ class DFGBuilder:
 
     @staticmethod
     def addDataFlowEdges(ddgs: Dict[str, DataFlowGraph]):
-        visitedDefs = set()
         for qn, ddg in ddgs.items():
-            cfg = ddg.getCFG()
             logger.info(f"Handling {qn} CFG...")
-            visitedDefs.clear()
-            entry = cfg.getEntry()
-            defTraversal = CFPathTraversal(cfg, entry)
-            while defTraversal.hasNext():
-                defCFNode = defTraversal.next()
-
-                if defCFNode.Id in visitedDefs:
-                    defTraversal.continueNextPath()
-                    continue
-                visitedDefs.add(defCFNode.Id)
+            reachingDefinitions = ReachingDefinitions(ddg.getCFG(), ddg)
 
-                defDDNode = ddg.getNodeByID(defCFNode.getSharedId())
+            # first add any self-flows of the nodes
+            for cfNode in reachingDefinitions.order:
+                defDDNode = reachingDefinitions.getDFNode(cfNode)
                 if defDDNode is None:
                     continue
-
                 if len(defDDNode.getAllDEFs()) == 0 and not defDDNode.containsIPDEFs():
                     continue
+                for flow in sorted(defDDNode.getAllSelfFlows()):
+                    ddg.addEdge(DFEdge(defDDNode, flow, defDDNode, DFEdgeKind.INTRA))
+
+            reachingDefinitions.solve()
+            for defDDNode, DEF, useDDNode in reachingDefinitions.getDefUses():
+                ddg.addEdge(DFEdge(defDDNode, DEF, useDDNode, DFEdgeKind.INTRA))
+
+    @staticmethod
+    def buildGlobalIdIndex(ddgs: Dict[str, DataFlowGraph], db: Database,
+                           globalIds: Set[int]) -> Dict[int, Tuple[str, DFNode]]:
+        # Индекс globalId -> (метод, DFG-узел) в порядке базы, как при поиске через db.getDFGNodeBySharedId.
+        # Узлы DFG, которых нет среди переданных, загружаются из базы, только если они нужны
+        index = dict()
+        nodeSchema = DFNodeSchema()
+        for qn, DFG in db.getAllSerialized(DBCollections.DFGs).items():
+            if qn in ddgs:
+                for node in ddgs[qn].nodes:
+                    if node.getGlobalId() in globalIds:
+                        index.setdefault(node.getGlobalId(), (qn, node))
+            else:
+                for node in DFG["nodes"]:
+                    if node["globalId"] in globalIds and node["globalId"] not in index:
+                        index[node["globalId"]] = (qn, nodeSchema.load(node))
 
-                # first add any self-flows of this node
-                for flow in defDDNode.getAllSelfFlows():
-                    ddg.addEdge(Edge(defDDNode, flow, defDDNode))
-
-
-                # now traverse the CFG for any USEs till a DEF
-                visitedUses = set()
-                for DEF in defDDNode.getAllDEFs():
-                    useTraversal = CFPathTraversal(cfg, defCFNode)
-                    visitedUses.clear()
-                    useCFNode = useTraversal.next()
-                    visitedUses.add(useCFNode.Id)
-                    while useTraversal.hasNext():
-                        useCFNode = useTraversal.next()
-                        useDDNode = ddg.getNodeByID(useCFNode.getSharedId())
-                        if useDDNode is None:
-                            continue
-                        if useDDNode.hasDEF(DEF):
-                            useTraversal.continueNextPath()  # no need to continue this path
-                        if useCFNode.Id in visitedUses:
-                            useTraversal.continueNextPath()  # no need to continue this path
-                        else:
-                            visitedUses.add(useCFNode.Id)
-                            if useDDNode.hasUSE(DEF):
-                                ddg.addEdge(DFEdge(defDDNode, DEF, useDDNode, DFEdgeKind.INTRA))
+        for qn, ddg in ddgs.items():
+            for node in ddg.nodes:
+                if node.getGlobalId() in globalIds:
+                    index.setdefault(node.getGlobalId(), (qn, node))
+        return index
+
+    @staticmethod
+    def linkIPDataFlows(qn: str, ddg: DataFlowGraph, index: Dict[int, Tuple[str, DFNode]]):
+        for node in ddg.nodes:
+            if node.IP_DEFs is not None:
+                IPDFTarget = None
+                if node.IP_DEFs["entryGlobalId"] in index:
+                    targetMethod, IPDFTarget = index[node.IP_DEFs["entryGlobalId"]]
+                    logger.debug(f"Inter-procedural data-flow {qn} -> {targetMethod}")
+                ddg.addEdge(DFEdge(
+                    node, "inter-procedural", IPDFTarget, DFEdgeKind.INTER)
+                )
 
     @staticmethod
     def addIPDataFlows(ddgs: Dict[str, DataFlowGraph], projectConfig):
         db = Database(projectConfig)
+        entryGlobalIds = {node.IP_DEFs["entryGlobalId"] for ddg in ddgs.values() for node in ddg.nodes
+                          if node.IP_DEFs is not None}
+        index = DFGBuilder.buildGlobalIdIndex(ddgs, db, entryGlobalIds)
         for qn, ddg in ddgs.items():
-            for node in ddg.nodes:
-                if node.IP_DEFs is not None:
-                    IPDFTarget = db.getDFGNodeBySharedId(node.IP_DEFs["entrySharedId"])
-                    ddg.addEdge(DFEdge(
-                        node, "inter-procedural", IPDFTarget, DFEdgeKind.INTER)
-                    )
+            DFGBuilder.linkIPDataFlows(qn, ddg, index)
             db.putDFG(qn, ddg)
 
     def dump(self):
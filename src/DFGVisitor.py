@@ -1,9 +1,6 @@
 import logging
-import os
 from typing import List, Dict
 
-from GremlinDriver import Gremlin
-from gremlin_python.process.graph_traversal import __
 from TypeDeterminator import TypeDeterminator
 from antlr.JavaParser import JavaParser
 from antlr.JavaParserVisitor import JavaParserVisitor
@@ -881,16 +878,16 @@ class DFGVisitor(JavaParserVisitor):
             if methodName is not None:
                 if "." in methodName:
                     if self.db.getCFG(methodName):
-                        entrySharedId = self.db.getCFG(methodName).nodes[0].getSharedId()
+                        entryGlobalId = self.db.getCFG(methodName).getEntry().getGlobalId()
                         callNode.IP_DEFs = {
-                            "entrySharedId": entrySharedId
+                            "entryGlobalId": entryGlobalId
                         }
                 else:
                     methodQN = self.packageName + "." + self.activeClasses.peek().name + "." + methodName
                     if self.db.getCFG(methodQN):
-                        entrySharedId = self.db.getCFG(methodQN).nodes[0].getSharedId()
+                        entryGlobalId = self.db.getCFG(methodQN).getEntry().getGlobalId()
                         callNode.IP_DEFs = {
-                            "entrySharedId": entrySharedId
+                            "entryGlobalId": entryGlobalId
                         }
 
             for i in range(1, len(argList)):
@@ -928,38 +925,16 @@ class DFGVisitor(JavaParserVisitor):
             methodName = calleeAndMethod[lastDot + 1:]
             callExpression = calleeAndMethod
 
-            calleeType = None
-            # поиск callee в локальных переменных
-            fileQN = self.ast.getProperty("package") + "." +\
-                     os.path.splitext(os.path.basename(self.ast.getProperty("filePath")))[0]
-            # methodQN = self.packageName + "." + self.activeClasses.peek() + "." + self.currentMethod
-            gResp = Gremlin(self.projectConfig).g.V().hasLabel("ASTNode").has("file", fileQN)\
-                .has("kind", "METHOD").out().has("kind", "NAME").has("code", str(self.currentMethod)).inE().outV()\
-                .repeat(__.out()).until(__.has("kind", "VARIABLE"))\
-                .out().has("kind", "NAME").has("code", callee)\
-                .inE().outV()\
-                .out().has("kind", "TYPE").values("code").toList()
-            if len(gResp) > 0:
-                assert(len(gResp) == 1)
-                calleeType = gResp[0]
-
-            if calleeType is None:
-                # поиск callee в свойствах класса
-                gResp = Gremlin(self.projectConfig).g.V().hasLabel("ASTNode").has("file", fileQN)\
-                    .has("kind", "FIELD").out().has("kind", "NAME").has("code", callee) \
-                    .inE().outV() \
-                    .out().has("kind", "TYPE").values("code").toList()
-                if len(gResp) > 0:
-                    assert(len(gResp) == 1)
-                    calleeType = gResp[0]
+            # поиск типа callee в локальных переменных, параметрах метода и свойствах классов
+            calleeType = self.getType(callee)
 
             # определение типа
             # тип стандартный?
             if calleeType is not None:
                 if not TypeDeterminator.checkIsBuiltin(calleeType):
-                    for qn in self.db.getAllJavaClasses().keys():
-                        if qn.split(".")[-1] == calleeType:
-                            fullCalleeAndMethod = f"{qn}.{methodName}"
+                    calleeQN = self.db.getResolutionIndex().resolveClassName(calleeType, self.getActiveClassQN())
+                    if calleeQN is not None:
+                        fullCalleeAndMethod = f"{calleeQN}.{methodName}"
             # тип это класс из проекта?
             # найти в бд джава-классов этот класс. Это и будет callee
             # сконкатенировать callee и methodName
@@ -1262,8 +1237,16 @@ class DFGVisitor(JavaParserVisitor):
     # TODO implement
     def findDefInfo(self, callee: str, methodName: str, ctx: JavaParser.ExpressionListContext) -> JavaMethod:
         # return self.methodDEFs.get(name)  # Будем пока считать, что методов с одинаковыми именами нет
-        qualifiedClassName = f"{self.packageName}.{self.activeClasses.peek().name}"
-        return self.db.getMethod(qualifiedClassName, methodName)
+        qualifiedClassName = self.getActiveClassQN()
+        if callee is not None:
+            calleeType = self.getType(callee)
+            if calleeType is None:
+                return None
+            qualifiedClassName = self.db.getResolutionIndex().resolveClassName(calleeType, qualifiedClassName)
+            if qualifiedClassName is None:
+                return None
+        arity = 0 if ctx is None else len(ctx.expression())
+        return self.db.getMethod(qualifiedClassName, methodName, arity)
         # logger.debug("METHOD NAME: " + name)
         # logger.debug("# found = " + str(0 if not lst else len(lst)))
         #
@@ -1307,25 +1290,26 @@ class DFGVisitor(JavaParserVisitor):
         ''' Return type of a given symbol
         Returns null if symbol not found
 
+        Scopes are searched from the innermost one: locals of the enclosing blocks,
+        parameters of the method, then fields of the class and of its outer classes,
+        each with the fields inherited from superclasses of the project.
+
         :param Id:
         :return:
         '''
         if isUsableExpression(Id):
+            for local in reversed(self.localVars):
+                if local.name == Id:
+                    return local.type
             for param in self.methodParams:
                 if param.name == Id:
                     return param.type
-            for local in self.localVars:
-                if local.name == Id:
-                    return local.type
             if Id.startswith("this."):
-                Id = Id[4:]
-
-            for field in self.activeClasses.peek().getAllFields():
-                if field.name == Id:
-                    return field.type
+                Id = Id[5:]
 
-            for cls in self.activeClasses:
-                for field in cls.getAllFields():
+            index = self.db.getResolutionIndex()
+            for cls in reversed(self.activeClasses.items):
+                for field in index.getFields(f"{cls.package}.{cls.name}"):
                     if field.name == Id:
                         return field.type
 
@@ -1335,5 +1319,10 @@ class DFGVisitor(JavaParserVisitor):
             logger.debug("getType(" + Id + ") : is USABLE but NOT DEFINED")
             return None
 
+    def getActiveClassQN(self):
+        if self.activeClasses.isEmpty():
+            return None
+        return f"{self.packageName}.{self.activeClasses.peek().name}"
+
     def getDFG(self, qualifiedName):
         return self.ddgs[qualifiedName]
\ No newline at end of file
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from graphs.digraph import Digraph
+
+
+class GraphCache:
+    """Identity map of the graphs loaded from the database, bounded by the number of graphs.
+
+    A repeated lookup returns the same graph object instead of deserializing it again,
+    so the graphs are shared by all callers and are changed only to be stored back.
+    The least recently used graphs are evicted, and a graph is dropped when it is stored or removed.
+    """
+
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        # (коллекция, имя графа) -> граф, от давно использованных к недавним
+        self.entries: Dict[Tuple[str, str], Digraph] = OrderedDict()
+
+    def isEnabled(self) -> bool:
+        return self.maxSize > 0
+
+    def get(self, collection: str, key: str) -> Optional[Digraph]:
+        graph = self.entries.get((collection, key))
+        if graph is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((collection, key))
+        self.hits += 1
+        return graph
+
+    def put(self, collection: str, key: str, graph: Digraph):
+        if not self.isEnabled():
+            return
+        self.entries[(collection, key)] = graph
+        self.entries.move_to_end((collection, key))
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, collection: str, key: str = None):
+        if key is not None:
+            self.entries.pop((collection, key), None)
+            return
+        for entry in [entry for entry in self.entries if entry[0] == collection]:
+            del self.entries[entry]
+
+    def clear(self):
+        self.entries.clear()
+
+    def getStats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
@@ -0,0 +1,63 @@
+import json
+import struct
+from typing import BinaryIO, Iterator, Tuple
+
+from config import Config
+
+# Заголовок: сигнатура и версия формата графов, затем записи до конца файла.
+# Запись: длины коллекции, ключа и данных, затем они сами (данные - JSON графа в формате GraphSchema)
+MAGIC = b"CPGS"
+HEADER = struct.Struct("<4sH")
+RECORD = struct.Struct("<HHI")
+
+
+class GraphWriter:
+    """Writes serialized graphs and classes one record at a time to a binary stream."""
+
+    def __init__(self, stream: BinaryIO, writeHeader: bool = True):
+        self.stream = stream
+        # При дописывании в существующий поток заголовок уже есть
+        if writeHeader:
+            self.stream.write(HEADER.pack(MAGIC, Config.GRAPH_FORMAT_VERSION))
+
+    def write(self, collection: str, key: str, data: dict):
+        collection = collection.encode()
+        key = key.encode()
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        self.stream.write(RECORD.pack(len(collection), len(key), len(payload)))
+        self.stream.write(collection)
+        self.stream.write(key)
+        self.stream.write(payload)
+
+
+class GraphReader:
+    """Reads the records of GraphWriter lazily, only the current record is kept in memory."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        header = self.stream.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("Not a graph stream: the header is truncated")
+        magic, version = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not a graph stream: wrong signature")
+        if version != Config.GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported graph format {version} (expected {Config.GRAPH_FORMAT_VERSION})")
+
+    def readExactly(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise ValueError("Graph stream is truncated")
+        return data
+
+    def __iter__(self) -> Iterator[Tuple[str, str, dict]]:
+        while True:
+            lengths = self.stream.read(RECORD.size)
+            if len(lengths) == 0:
+                return
+            if len(lengths) != RECORD.size:
+                raise ValueError("Graph stream is truncated")
+            collectionSize, keySize, payloadSize = RECORD.unpack(lengths)
+            collection = self.readExactly(collectionSize).decode()
+            key = self.readExactly(keySize).decode()
+            yield collection, key, json.loads(self.readExactly(payloadSize))
@@ -22,6 +22,7 @@ from db import Database
 from graphs.ast.ASNode import ASNode, ASNodeKind
 from graphs.cfg.CFNode import CFNode, CFNodeKind
 from graphs.ddg.DFNode import DFNode
+from NodeIdentity import parseSharedId
 from utils import preToInfix
 
 
@@ -182,51 +183,30 @@ class Gremlin(metaclass=GremlinMeta):
         return node
 
     def findASTNodeInCFG(self, sharedId: str) -> CFNode:
-        gResp = self.g.V().hasLabel("CFGNode").has("sharedId", sharedId).valueMap().toList()
+        # Ближайший узел CFG среди узла AST и его предков найден при сборке (AbstractSyntaxTree.linkFlowNodes)
+        cfgSharedIds = self.g.V().hasLabel("ASTNode").has("sharedId", sharedId).values("cfgSharedId").toList()
 
+        # Если узел вне методов
+        if len(cfgSharedIds) == 0:
+            return None
+
+        gResp = self.g.V().hasLabel("CFGNode").has("sharedId", cfgSharedIds[0]).valueMap().toList()
         if len(gResp) > 0:
             gResp = gResp[0]
             return self.deserializeCFGNode(gResp)
 
-        currentSharedId = sharedId
-        while True:
-            currentSharedId = self.g.V().hasLabel("ASTNode").has("sharedId", currentSharedId).inE().outV()\
-                                        .values("sharedId").toList()
-
-            # Если это корневой узел
-            if len(currentSharedId) == 0:
-                return None
-            else:
-                currentSharedId = currentSharedId[0]
-
-            gResp = self.g.V().hasLabel("CFGNode").has("sharedId", currentSharedId).valueMap().toList()
-            if len(gResp) > 0:
-                gResp = gResp[0]
-                return self.deserializeCFGNode(gResp)
-
     def findASTNodeInDFG(self, sharedId: str) -> CFNode:
-        gResp = self.g.V().hasLabel("DFGNode").has("sharedId", sharedId).valueMap().toList()
+        dfgSharedIds = self.g.V().hasLabel("ASTNode").has("sharedId", sharedId).values("dfgSharedId").toList()
 
+        # Если узел вне методов
+        if len(dfgSharedIds) == 0:
+            return None
+
+        gResp = self.g.V().hasLabel("DFGNode").has("sharedId", dfgSharedIds[0]).valueMap().toList()
         if len(gResp) > 0:
             gResp = gResp[0]
             return self.deserializeDFGNode(gResp), gResp["method"][0]
 
-        currentSharedId = sharedId
-        while True:
-            currentSharedId = self.g.V().hasLabel("ASTNode").has("sharedId", currentSharedId).inE().outV()\
-                                        .values("sharedId").toList()
-
-            # Если это корневой узел
-            if len(currentSharedId) == 0:
-                return None
-            else:
-                currentSharedId = currentSharedId[0]
-
-            gResp = self.g.V().hasLabel("DFGNode").has("sharedId", currentSharedId).valueMap().toList()
-            if len(gResp) > 0:
-                gResp = gResp[0]
-                return self.deserializeDFGNode(gResp), gResp["method"][0]
-
     def deserializeASTNode(self, gremlinResp) -> ASNode:
         node = ASNode(ASNodeKind[gremlinResp["kind"][0]])
         node.Id = gremlinResp["Id"][0]
@@ -234,6 +214,9 @@ class Gremlin(metaclass=GremlinMeta):
         node.setCode(gremlinResp["code"][0])
         node.sharedId = gremlinResp["sharedId"][0]
         node.setFile(gremlinResp["file"][0])
+        # Свойств без значения в графовой БД нет
+        node.cfgGlobalId = parseSharedId(gremlinResp.get("cfgSharedId", [None])[0])
+        node.dfgGlobalId = parseSharedId(gremlinResp.get("dfgSharedId", [None])[0])
         node.optionalProperties = json.loads(gremlinResp["optionalProperties"][0])
 
         # for k, v in gremlinResp.items():
@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from typing import Iterator, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from OrientDBDriver import ClassName, GraphLayer, OrientDB
+from OrientSchema import CLASSES
+from db import DBCollections
+from schemas import AbstractSyntaxTreeSchema, ControlFlowGraphSchema, DataFlowGraphSchema
+
+FORMATS = ("graphson", "graphml", "csv")
+
+# Слой, коллекция базы, схема графа, сериализация в вершины и рёбра OrientDB, класс вершин
+LAYERS = (
+    (GraphLayer.AST, DBCollections.ASTs, AbstractSyntaxTreeSchema, OrientDB.serializeAST, ClassName.ASTNode),
+    (GraphLayer.CFG, DBCollections.CFGs, ControlFlowGraphSchema, OrientDB.serializeCFG, ClassName.CFGNode),
+    (GraphLayer.DFG, DBCollections.DFGs, DataFlowGraphSchema, OrientDB.serializeDFG, ClassName.DFGNode),
+)
+NODE_CLASSES = [nodeClass for layer, collection, schemaClass, serialize, nodeClass in LAYERS]
+EDGE_CLASSES = [className for className, (superClass, properties) in CLASSES.items() if superClass == "E"]
+
+GRAPHML_TYPES = {"INTEGER": "int", "STRING": "string"}
+CSV_TYPES = {"INTEGER": "Int", "STRING": "String"}
+
+
+def getVertexId(layer: str, graphName: str, Id: int) -> str:
+    return f"{layer}:{graphName}:{Id}"
+
+
+def getPropertyTypes(classNames: List[str]) -> dict:
+    # Свойства классов в порядке объявления; списки и словари выгружаются строкой JSON
+    types = dict()
+    for className in classNames:
+        for name, propertyType in CLASSES[className][1].items():
+            types.setdefault(name, propertyType.split()[0])
+    return types
+
+
+def toText(value) -> str:
+    return json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+
+
+def iterGraphElements(db) -> Iterator[Tuple[list, list]]:
+    """Yields the vertices and edges of the stored graphs, one graph at a time.
+
+    Properties are the ones OrientDB.populate writes. Vertex IDs are made of the layer,
+    the graph name and the node Id, edge IDs of the graph and the position of the edge,
+    so exports of the same database are identical. Properties without a value are dropped.
+    """
+    for layer, collection, schemaClass, serialize, nodeClass in LAYERS:
+        names = set(db.getKeys(collection))
+        schema = schemaClass()
+        for name, data in db.iterSerialized(collection):
+            graphVertices, graphEdges = serialize(name, schema.load(data).freeze())
+            vertices = [(getVertexId(layer, name, Id), nodeClass, withoutNones(content))
+                        for Id, content in graphVertices]
+            # Межпроцедурные рёбра в графы, которых нет в базе, не выгружаются
+            edges = [(f"{layer}:{name}:e{i}", className, getVertexId(layer, name, sourceId),
+                      getVertexId(layer, targetName, targetId), withoutNones(content))
+                     for i, (className, sourceId, targetName, targetId, content) in enumerate(graphEdges)
+                     if targetName in names]
+            yield vertices, edges
+
+
+def withoutNones(content: dict) -> dict:
+    return {key: value for key, value in content.items() if value is not None}
+
+
+def toGraphSON(value):
+    if isinstance(value, int):
+        return {"@type": "g:Int32", "@value": value}
+    if isinstance(value, list):
+        return {"@type": "g:List", "@value": [toGraphSON(item) for item in value]}
+    if isinstance(value, dict):
+        return {"@type": "g:Map", "@value": [toGraphSON(item) for pair in value.items() for item in pair]}
+    return value
+
+
+def writeGraphSON(db, path: str):
+    # Список смежности GraphSON 3.0: вершина с исходящими рёбрами на строке
+    propertyId = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for vertices, edges in iterGraphElements(db):
+            outEdges = dict()
+            for edgeId, className, source, target, content in edges:
+                outEdges.setdefault(source, dict()).setdefault(className, []).append({
+                    "id": edgeId,
+                    "inV": target,
+                    "properties": {key: toGraphSON(value) for key, value in content.items()},
+                })
+            for vertexId, nodeClass, content in vertices:
+                properties = dict()
+                for key, value in content.items():
+                    properties[key] = [{"id": {"@type": "g:Int64", "@value": propertyId}, "value": toGraphSON(value)}]
+                    propertyId += 1
+                vertex = {"id": vertexId, "label": nodeClass, "properties": properties}
+                if vertexId in outEdges:
+                    vertex["outE"] = outEdges[vertexId]
+                f.write(json.dumps(vertex, ensure_ascii=False) + "\n")
+
+
+def writeGraphML(db, path: str):
+    vertexTypes = getPropertyTypes(NODE_CLASSES)
+    edgeTypes = getPropertyTypes(EDGE_CLASSES)
+
+    def getData(prefix: str, content: dict) -> str:
+        return "".join(f'<data key="{prefix}.{key}">{escape(toText(value))}</data>' for key, value in content.items())
+
+    with open(path, "w", encoding="utf-8") as f, tempfile.TemporaryFile("w+", encoding="utf-8") as edgesFile:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        f.write('<key id="labelV" for="node" attr.name="labelV" attr.type="string"/>\n')
+        f.write('<key id="labelE" for="edge" attr.name="labelE" attr.type="string"/>\n')
+        for prefix, target, types in (("v", "node", vertexTypes), ("e", "edge", edgeTypes)):
+            for name, propertyType in types.items():
+                f.write(f'<key id="{prefix}.{name}" for="{target}" attr.name="{name}" '
+                        f'attr.type="{GRAPHML_TYPES.get(propertyType, "string")}"/>\n')
+        f.write('<graph id="G" edgedefault="directed">\n')
+
+        # Рёбра пишутся после всех вершин: межпроцедурные рёбра ссылаются на вершины следующих графов
+        for vertices, edges in iterGraphElements(db):
+            for vertexId, nodeClass, content in vertices:
+                f.write(f'<node id={quoteattr(vertexId)}><data key="labelV">{nodeClass}</data>'
+                        f'{getData("v", content)}</node>\n')
+            for edgeId, className, source, target, content in edges:
+                edgesFile.write(f'<edge id={quoteattr(edgeId)} source={quoteattr(source)} target={quoteattr(target)}>'
+                                f'<data key="labelE">{className}</data>{getData("e", content)}</edge>\n')
+        edgesFile.seek(0)
+        shutil.copyfileobj(edgesFile, f)
+        f.write('</graph>\n</graphml>\n')
+
+
+def writeCSV(db, path: str):
+    # Заголовки формата загрузчиков Gremlin: ~id, ~label, ~from, ~to и свойства с типами
+    vertexTypes = getPropertyTypes(NODE_CLASSES)
+    edgeTypes = getPropertyTypes(EDGE_CLASSES)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "vertices.csv"), "w", encoding="utf-8", newline="") as verticesFile, \
+            open(os.path.join(path, "edges.csv"), "w", encoding="utf-8", newline="") as edgesFile:
+        verticesWriter = csv.writer(verticesFile)
+        edgesWriter = csv.writer(edgesFile)
+        verticesWriter.writerow(["~id", "~label"] + [f"{name}:{CSV_TYPES.get(propertyType, 'String')}"
+                                                     for name, propertyType in vertexTypes.items()])
+        edgesWriter.writerow(["~id", "~from", "~to", "~label"] + [f"{name}:{CSV_TYPES.get(propertyType, 'String')}"
+                                                                  for name, propertyType in edgeTypes.items()])
+        for vertices, edges in iterGraphElements(db):
+            for vertexId, nodeClass, content in vertices:
+                verticesWriter.writerow([vertexId, nodeClass] + [toText(content[name]) if name in content else ""
+                                                                 for name in vertexTypes])
+            for edgeId, className, source, target, content in edges:
+                edgesWriter.writerow([edgeId, source, target, className] + [toText(content[name]) if name in content
+                                                                            else "" for name in edgeTypes])
+
+
+def writeGremlinExport(db, path: str, graphFormat: str):
+    """Writes the ASTs, CFGs and DFGs of the database for a bulk load into a Gremlin server.
+
+    "graphson" and "graphml" write one file for `g.io(path).read()`, "csv" writes
+    vertices.csv and edges.csv into the directory `path` for CSV bulk loaders.
+    The graphs are read one at a time.
+    """
+    if graphFormat == "graphson":
+        writeGraphSON(db, path)
+    elif graphFormat == "graphml":
+        writeGraphML(db, path)
+    elif graphFormat == "csv":
+        writeCSV(db, path)
+    else:
+        raise ValueError(f"Unknown export format: {graphFormat}, expected one of {', '.join(FORMATS)}")
@@ -1,12 +1,10 @@
 from typing import Dict
 
-from antlr4 import *
 from JavaStructures import JavaClass, JavaMethod, JavaField
-from antlr.JavaLexer import JavaLexer
 from antlr.JavaParser import JavaParser
 from antlr.JavaParserVisitor import JavaParserVisitor
 from db import Database
-from utils import Queue, getIdByCtx, getOriginalCodeText
+from utils import Queue, getIdByCtx, getOriginalCodeText, parseJavaFile
 
 
 class JavaClassExtractor:
@@ -14,12 +12,9 @@ class JavaClassExtractor:
         self.projectConfig = projectConfig
         self.javaClasses = dict()
 
-    def extractInfo(self, filename: str):
-        inputStream = FileStream(filename)
-        lexer = JavaLexer(inputStream)
-        tokens = CommonTokenStream(lexer)
-        parser = JavaParser(tokens)
-        parseTree = parser.compilationUnit()
+    def extractInfo(self, filename: str, parseTree: JavaParser.CompilationUnitContext = None):
+        if parseTree is None:
+            parseTree = parseJavaFile(filename)
 
         javaClasses = dict()
         visitor = JavaClassVisitor(javaClasses, filename)
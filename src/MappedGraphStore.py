@@ -0,0 +1,300 @@
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+
+# Файл: заголовок, таблицы узлов и рёбер и индексы смежности каждого графа, каталог графов
+# (отсортирован по слою и имени), индекс globalId (отсортирован по globalId) и пул строк.
+# Все числа - little-endian, строки - номера в пуле, -1 - None, -2 - поля у узла нет
+MAGIC = b"CPGM"
+HEADER = struct.Struct("<4sHHqqqqqq")
+NODE = struct.Struct("<qiiiiiii")
+EDGE = struct.Struct("<iiii")
+GRAPH = struct.Struct("<iiiiiiqqqqqq")
+GLOBAL_ID = struct.Struct("<qii")
+OFFSET = struct.Struct("<q")
+INDEX = struct.Struct("<i")
+
+NONE = -1
+ABSENT = -2
+
+# Слои в порядке номеров в каталоге
+LAYERS = ("asts", "cfgs", "dfgs")
+# Поля узла с собственными колонками, остальные хранятся строкой JSON
+NODE_COLUMNS = ("Id", "kind", "line", "code", "globalId", "method", "file")
+
+
+class StringPoolWriter:
+    def __init__(self):
+        self.ids: Dict[str, int] = dict()
+        self.strings: List[bytes] = []
+
+    def add(self, value) -> int:
+        if value is None:
+            return NONE
+        stringId = self.ids.get(value)
+        if stringId is None:
+            stringId = len(self.strings)
+            self.ids[value] = stringId
+            self.strings.append(value.encode())
+        return stringId
+
+    def pack(self) -> bytes:
+        offsets = [0]
+        for string in self.strings:
+            offsets.append(offsets[-1] + len(string))
+        return struct.pack(f"<{len(offsets)}q", *offsets) + b"".join(self.strings)
+
+
+def buildCSR(count: int, endpoints: List[int], indexed: List[bool]) -> Tuple[List[int], List[int]]:
+    # Сортировка подсчётом сохраняет порядок рёбер каждого узла, как в FrozenDigraph.buildIndex
+    offsets = [0] * (count + 1)
+    for edgeId, endpoint in enumerate(endpoints):
+        if indexed[edgeId] and 0 <= endpoint < count:
+            offsets[endpoint + 1] += 1
+    for index in range(count):
+        offsets[index + 1] += offsets[index]
+    edgeIds = [0] * offsets[count]
+    positions = offsets[:count]
+    for edgeId, endpoint in enumerate(endpoints):
+        if indexed[edgeId] and 0 <= endpoint < count:
+            edgeIds[positions[endpoint]] = edgeId
+            positions[endpoint] += 1
+    return offsets, edgeIds
+
+
+def writeMappedStore(db, path: str):
+    """Writes the graphs of the database to a read-only file for MappedGraphStore.
+
+    The graphs are read serialized, one at a time, and are not deserialized. Their tables
+    are written to the file as soon as they are built, the string pool, the directory and
+    the globalId index follow them, and the header is written last.
+    """
+    from db import DBCollections
+
+    pool = StringPoolWriter()
+    directory = []
+    globalIds = []
+
+    def addColumn(node: dict, name: str) -> int:
+        return pool.add(node[name]) if name in node else ABSENT
+
+    # Файл подменяется целиком, процессы, которые уже отобразили старый, продолжают читать его
+    with open(path + ".tmp", "wb") as f:
+        f.write(bytes(HEADER.size))
+        for layerId, layer in enumerate(LAYERS):
+            for name, graph in db.iterSerialized(layer):
+                nodes = graph["nodes"] + graph["externalNodes"]
+                positions = {node["Id"]: position for position, node in enumerate(graph["nodes"])}
+                # Таблицы графа собираются в буфер и пишутся одним вызовом
+                body = bytearray()
+                offset = f.tell()
+
+                nodeTable = offset + len(body)
+                for position, node in enumerate(nodes):
+                    extras = {key: value for key, value in node.items() if key not in NODE_COLUMNS}
+                    globalId = node.get("globalId")
+                    body += NODE.pack(NONE if globalId is None else globalId, node["Id"], addColumn(node, "kind"),
+                                      node.get("line", 0), addColumn(node, "code"), addColumn(node, "method"),
+                                      addColumn(node, "file"), pool.add(json.dumps(extras, separators=(",", ":"))))
+                    if position < len(graph["nodes"]) and globalId is not None:
+                        globalIds.append((globalId, len(directory), position))
+
+                def getPosition(ref) -> int:
+                    if ref is None:
+                        return NONE
+                    return positions[ref] if ref >= 0 else len(graph["nodes"]) - 1 - ref
+
+                edgeTable = offset + len(body)
+                sources, targets, indexed = [], [], []
+                for row in graph["edges"]:
+                    source, target = getPosition(row[0]), getPosition(row[2])
+                    kind = row[3] if len(row) > 3 else None
+                    body += EDGE.pack(source, target, pool.add(row[1]), pool.add(kind))
+                    sources.append(source)
+                    targets.append(target)
+                    # В inEdges DFG попадают только внутрипроцедурные рёбра, как в DataFlowGraph.isInEdge
+                    indexed.append(layer != DBCollections.DFGs or kind == "INTRA")
+
+                tables = []
+                for endpoints, isIndexed in ((sources, [True] * len(sources)), (targets, indexed)):
+                    offsets, edgeIds = buildCSR(len(graph["nodes"]), endpoints, isIndexed)
+                    tables.append(offset + len(body))
+                    body += struct.pack(f"<{len(offsets)}i", *offsets)
+                    tables.append(offset + len(body))
+                    body += struct.pack(f"<{len(edgeIds)}i", *edgeIds)
+                f.write(body)
+
+                directory.append((layerId, name, pool.add(name), len(graph["nodes"]), len(nodes),
+                                  len(graph["edges"]), pool.add(json.dumps(graph["properties"], separators=(",", ":"))),
+                                  nodeTable, edgeTable, *tables))
+
+        # Каталог сортируется для двоичного поиска, номера графов в индексе globalId переводятся в новый порядок
+        order = sorted(range(len(directory)), key=lambda i: (directory[i][0], directory[i][1].encode()))
+        newIndexes = {old: new for new, old in enumerate(order)}
+        globalIds.sort(key=lambda entry: (entry[0], newIndexes[entry[1]], entry[2]))
+
+        directoryOffset = f.tell()
+        f.write(b"".join(GRAPH.pack(directory[old][0], *directory[old][2:]) for old in order))
+        globalIdsOffset = f.tell()
+        f.write(b"".join(GLOBAL_ID.pack(globalId, newIndexes[graph], position)
+                         for globalId, graph, position in globalIds))
+        poolOffset = f.tell()
+        f.write(pool.pack())
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, Config.GRAPH_FORMAT_VERSION, 0, poolOffset, len(pool.strings),
+                            directoryOffset, len(directory), globalIdsOffset, len(globalIds)))
+    os.replace(path + ".tmp", path)
+
+
+class MappedGraph:
+    """Read-only view of one graph of MappedGraphStore.
+
+    Nodes are addressed by their position in the node table, positions after `size()`
+    are endpoints from other graphs. Node dicts have the fields of the node schemas.
+    """
+
+    def __init__(self, store: "MappedGraphStore", layer: str, entry: tuple):
+        self.store = store
+        self.layer = layer
+        (self.nameId, self.nodeCount, self.rowCount, self.edgeCount, self.propertiesId, self.nodeTable,
+         self.edgeTable, self.outOffsets, self.outEdgeIds, self.inOffsets, self.inEdgeIds) = entry
+
+    @property
+    def name(self) -> str:
+        return self.store.getString(self.nameId)
+
+    @property
+    def properties(self) -> dict:
+        return json.loads(self.store.getString(self.propertiesId))
+
+    def size(self) -> int:
+        return self.nodeCount
+
+    def getNodeData(self, position: int) -> Optional[dict]:
+        if position < 0:
+            return None
+        (globalId, nodeId, kind, line, code, method, file,
+         extras) = NODE.unpack_from(self.store.buffer, self.nodeTable + position * NODE.size)
+        data = {"Id": nodeId, "line": line, "globalId": None if globalId == NONE else globalId}
+        for name, value in (("kind", kind), ("code", code), ("method", method), ("file", file)):
+            if value != ABSENT:
+                data[name] = self.store.getString(value)
+        data.update(json.loads(self.store.getString(extras)))
+        return data
+
+    def getPosition(self, nodeId: int) -> Optional[int]:
+        # Узлы графа упорядочены по Id
+        lo, hi = 0, self.nodeCount
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX.unpack_from(self.store.buffer, self.nodeTable + mid * NODE.size + 8)[0] < nodeId:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.nodeCount and INDEX.unpack_from(self.store.buffer, self.nodeTable + lo * NODE.size + 8)[0] == nodeId:
+            return lo
+        return None
+
+    def getNodeDataById(self, nodeId: int) -> Optional[dict]:
+        position = self.getPosition(nodeId)
+        return self.getNodeData(position) if position is not None else None
+
+    def getEdge(self, edgeId: int) -> Tuple[int, Optional[str], int, Optional[str]]:
+        """(source position, label, target position, kind) of an edge."""
+        source, target, label, kind = EDGE.unpack_from(self.store.buffer, self.edgeTable + edgeId * EDGE.size)
+        return source, self.store.getString(label), target, self.store.getString(kind)
+
+    def getAdjacentEdges(self, offsets: int, edgeIds: int, position: int) -> List[int]:
+        start, stop = struct.unpack_from("<ii", self.store.buffer, offsets + position * INDEX.size)
+        return list(struct.unpack_from(f"<{stop - start}i", self.store.buffer, edgeIds + start * INDEX.size))
+
+    def getOutEdges(self, position: int) -> List[int]:
+        return self.getAdjacentEdges(self.outOffsets, self.outEdgeIds, position)
+
+    def getInEdges(self, position: int) -> List[int]:
+        return self.getAdjacentEdges(self.inOffsets, self.inEdgeIds, position)
+
+    def outNodes(self, position: int) -> List[int]:
+        return [self.getEdge(edgeId)[2] for edgeId in self.getOutEdges(position)]
+
+    def inNodes(self, position: int) -> List[int]:
+        return [self.getEdge(edgeId)[0] for edgeId in self.getInEdges(position)]
+
+
+class MappedGraphStore:
+    """Read-only graph store over a memory-mapped file written by `writeMappedStore`.
+
+    Opening the store reads only the header, lookups touch only the pages of the tables
+    they read, so processes that open the same file share it through the page cache.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.poolOffset, self.stringCount, self.directoryOffset, self.graphCount,
+         self.globalIdsOffset, self.globalIdCount) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a mapped graph store")
+        if version != Config.GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported graph format {version} (expected {Config.GRAPH_FORMAT_VERSION})")
+        self.stringsOffset = self.poolOffset + (self.stringCount + 1) * OFFSET.size
+
+    def close(self):
+        self.buffer.close()
+
+    def getString(self, stringId: int) -> Optional[str]:
+        if stringId < 0:
+            return None
+        start, stop = struct.unpack_from("<qq", self.buffer, self.poolOffset + stringId * OFFSET.size)
+        return self.buffer[self.stringsOffset + start:self.stringsOffset + stop].decode()
+
+    def getEntry(self, index: int) -> tuple:
+        return GRAPH.unpack_from(self.buffer, self.directoryOffset + index * GRAPH.size)
+
+    def getGraphByIndex(self, index: int) -> MappedGraph:
+        entry = self.getEntry(index)
+        return MappedGraph(self, LAYERS[entry[0]], entry[1:])
+
+    def getGraph(self, layer: str, name: str) -> Optional[MappedGraph]:
+        key = (LAYERS.index(layer), name.encode())
+        lo, hi = 0, self.graphCount
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.getEntry(mid)
+            if (entry[0], self.getString(entry[1]).encode()) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.graphCount:
+            entry = self.getEntry(lo)
+            if (entry[0], self.getString(entry[1]).encode()) == key:
+                return MappedGraph(self, layer, entry[1:])
+        return None
+
+    def getGraphs(self, layer: str) -> Iterator[MappedGraph]:
+        for index in range(self.graphCount):
+            if LAYERS[self.getEntry(index)[0]] == layer:
+                yield self.getGraphByIndex(index)
+
+    def getNodesByGlobalId(self, globalId: int) -> List[Tuple[MappedGraph, int]]:
+        """(graph, node position) of every node with the global identifier in all layers."""
+        lo, hi = 0, self.globalIdCount
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if GLOBAL_ID.unpack_from(self.buffer, self.globalIdsOffset + mid * GLOBAL_ID.size)[0] < globalId:
+                lo = mid + 1
+            else:
+                hi = mid
+        results = []
+        while lo < self.globalIdCount:
+            entry = GLOBAL_ID.unpack_from(self.buffer, self.globalIdsOffset + lo * GLOBAL_ID.size)
+            if entry[0] != globalId:
+                break
+            results.append((self.getGraphByIndex(entry[1]), entry[2]))
+            lo += 1
+        return results
@@ -0,0 +1,100 @@
+from typing import Dict, Optional, Tuple
+
+from antlr4 import ParserRuleContext
+from antlr4.tree.Tree import TerminalNodeImpl
+
+from antlr.JavaParser import JavaParser
+
+# Глобальный идентификатор узла - 64-битное число из индекса файла, типа контекста
+# разбора и номеров его первой и последней лексем:
+# | 0 | файл (17) | тип контекста (8) | первая лексема (19) | последняя лексема (19) |
+# Старший бит не используется, чтобы идентификатор помещался в знаковое 64-битное целое
+FILE_BITS = 17
+KIND_BITS = 8
+TOKEN_BITS = 19
+
+MAX_FILES = 1 << FILE_BITS
+MAX_TOKENS = 1 << TOKEN_BITS
+
+# Код 0 - терминальный узел, остальные - контексты правил грамматики в порядке имён
+CONTEXT_KINDS: Dict[str, int] = {TerminalNodeImpl.__name__: 0}
+for name in sorted(name for name, cls in vars(JavaParser).items()
+                   if isinstance(cls, type) and issubclass(cls, ParserRuleContext)):
+    CONTEXT_KINDS[name] = len(CONTEXT_KINDS)
+assert len(CONTEXT_KINDS) <= 1 << KIND_BITS
+
+# Путь к файлу -> индекс, реестр хранится в базе (Database.registerFiles)
+fileIndexes: Dict[str, int] = dict()
+
+
+class TokenRangeError(ValueError):
+    """A file has more tokens than node identities can address, such a file is skipped by the build."""
+
+
+def setFileIndexes(indexes: Dict[str, int]):
+    fileIndexes.clear()
+    fileIndexes.update(indexes)
+
+
+def assignFileIndexes(indexes: Dict[str, int], filePaths) -> Dict[str, int]:
+    # Индексы никогда не переиспользуются, так что идентификаторы файла стабильны между запусками;
+    # полная сборка очищает реестр, и индексы удалённых файлов освобождаются
+    indexes = dict(indexes)
+    filePaths = set(filePaths)
+    if len(filePaths) > MAX_FILES:
+        raise ValueError(f"The project has {len(filePaths)} Java files, node identities support at most {MAX_FILES}")
+    nextIndex = max(indexes.values(), default=-1) + 1
+    for filePath in sorted(filePaths - indexes.keys()):
+        if nextIndex >= MAX_FILES:
+            raise ValueError(f"All {MAX_FILES} file indexes are taken, partly by removed files: "
+                             "run `run-static all --full` to renumber the files")
+        indexes[filePath] = nextIndex
+        nextIndex += 1
+    return indexes
+
+
+def getFileIndex(filePath: str) -> int:
+    index = fileIndexes.get(filePath)
+    if index is None:
+        raise ValueError(f"File {filePath} is not registered for node identities")
+    return index
+
+
+def checkTokenCount(filePath: str, parseTree: ParserRuleContext):
+    # Последняя лексема дерева разбора - EOF с наибольшим номером в файле
+    if parseTree.stop is not None and parseTree.stop.tokenIndex >= MAX_TOKENS:
+        raise TokenRangeError(f"{filePath} has {parseTree.stop.tokenIndex + 1} tokens, "
+                              f"node identities support at most {MAX_TOKENS}")
+
+
+def makeGlobalId(fileIndex: int, kind: int, start: int, stop: int) -> int:
+    if not 0 <= start < MAX_TOKENS or not 0 <= stop < MAX_TOKENS:
+        raise TokenRangeError(f"Token index out of range for node identities: {start}, {stop} "
+                              f"(at most {MAX_TOKENS - 1})")
+    return (((fileIndex << KIND_BITS | kind) << TOKEN_BITS | start) << TOKEN_BITS) | stop
+
+
+def splitGlobalId(globalId: int) -> Tuple[int, int, int, int]:
+    """(file index, context kind, first token, last token) of a global identifier."""
+    stop = globalId & (MAX_TOKENS - 1)
+    start = (globalId >> TOKEN_BITS) & (MAX_TOKENS - 1)
+    kind = (globalId >> 2 * TOKEN_BITS) & ((1 << KIND_BITS) - 1)
+    return globalId >> (2 * TOKEN_BITS + KIND_BITS), kind, start, stop
+
+
+def getGlobalIdByCtx(ctx) -> int:
+    if isinstance(ctx, TerminalNodeImpl):
+        start = stop = ctx.symbol
+    else:
+        start, stop = ctx.start, ctx.stop
+    fileIndex = getFileIndex(getattr(start.getInputStream(), "fileName", None))
+    return makeGlobalId(fileIndex, CONTEXT_KINDS[type(ctx).__name__], start.tokenIndex, stop.tokenIndex)
+
+
+def formatSharedId(globalId: Optional[int]) -> Optional[str]:
+    # Строковый sharedId - шестнадцатеричная запись глобального идентификатора
+    return None if globalId is None else f"{globalId:016x}"
+
+
+def parseSharedId(sharedId: Optional[str]) -> Optional[int]:
+    return None if sharedId is None else int(sharedId, 16)
@@ -0,0 +1,90 @@
+import json
+from typing import Dict, Hashable, List, Tuple
+
+
+def getRIDs(result) -> List[str]:
+    # Результат скрипта - список записей, иногда вложенный
+    rids = []
+    for item in result if isinstance(result, list) else [result]:
+        if isinstance(item, list):
+            rids.extend(getRIDs(item))
+        else:
+            rids.append(item._rid)
+    return rids
+
+
+class OrientBulkLoader:
+    """Creates vertices and edges of OrientDB in batches of SQL scripts, one transaction per batch.
+
+    Every vertex is added with a local key (e.g. graph name and node Id), and the RIDs returned
+    by the server are remembered by these keys, so an edge is created directly between two RIDs
+    instead of selecting its ends by properties. Vertices are sent before the edges that need them;
+    RIDs of vertices loaded earlier are set with `setRID`. Other commands (e.g. deletions)
+    are batched the same way.
+    """
+
+    def __init__(self, client, batchSize: int):
+        self.client = client
+        self.batchSize = batchSize
+        self.rids: Dict[Hashable, str] = dict()
+        self.vertices: List[Tuple[Hashable, str, dict]] = []
+        self.edges: List[Tuple[str, Hashable, Hashable, dict]] = []
+        self.commands: List[str] = []
+
+    def addVertex(self, key: Hashable, className: str, content: dict):
+        self.vertices.append((key, className, content))
+        if len(self.vertices) >= self.batchSize:
+            self.flushVertices()
+
+    def addEdge(self, className: str, sourceKey: Hashable, targetKey: Hashable, content: dict):
+        self.edges.append((className, sourceKey, targetKey, content))
+        if len(self.edges) >= self.batchSize:
+            self.flushEdges()
+
+    def addCommand(self, command: str):
+        self.commands.append(command)
+        if len(self.commands) >= self.batchSize:
+            self.flushCommands()
+
+    def setRID(self, key: Hashable, rid: str):
+        self.rids[key] = rid
+
+    def flushVertices(self):
+        if len(self.vertices) == 0:
+            return
+        lines = ["begin"]
+        for i, (key, className, content) in enumerate(self.vertices):
+            lines.append(f"let v{i} = CREATE VERTEX {className} CONTENT {json.dumps(content)}")
+        lines.append("commit retry 10")
+        lines.append("return [" + ", ".join(f"$v{i}" for i in range(len(self.vertices))) + "]")
+        rids = getRIDs(self.client.batch("\n".join(lines)))
+        if len(rids) != len(self.vertices):
+            raise RuntimeError(f"OrientDB returned {len(rids)} RIDs for {len(self.vertices)} vertices")
+        for (key, className, content), rid in zip(self.vertices, rids):
+            self.rids[key] = rid
+        self.vertices.clear()
+
+    def flushEdges(self):
+        if len(self.edges) == 0:
+            return
+        self.flushVertices()
+        lines = ["begin"]
+        for className, sourceKey, targetKey, content in self.edges:
+            lines.append(f"CREATE EDGE {className} FROM {self.rids[sourceKey]} TO {self.rids[targetKey]} "
+                         f"CONTENT {json.dumps(content)}")
+        lines.append("commit retry 10")
+        self.client.batch("\n".join(lines))
+        self.edges.clear()
+
+    def flushCommands(self):
+        if len(self.commands) == 0:
+            return
+        self.client.batch("\n".join(["begin"] + self.commands + ["commit retry 10"]))
+        self.commands.clear()
+
+    def finish(self):
+        # Отправляет оставшееся и забывает RID: рёбра следующего слоя их не используют
+        self.flushVertices()
+        self.flushEdges()
+        self.flushCommands()
+        self.rids.clear()
@@ -1,5 +1,9 @@
-from typing import Dict
+from typing import Callable, Dict, Tuple
+import hashlib
 import pyorient
+from OrientBulkLoader import OrientBulkLoader
+from OrientSchema import OrientSchema
+from config import Config
 from db import Database
 from graphs.ast import ASNode
 from graphs.cfg.CFNode import CFNode
@@ -14,10 +18,17 @@ class ClassName:
     CFGEdge = "CFGEdge"
     DFGNode = "DFGNode"
     DFGEdge = "DFGEdge"
+    GraphSummary = "GraphSummary"
+
+class GraphLayer:
+    AST = "AST"
+    CFG = "CFG"
+    DFG = "DFG"
 
 class OrientDB:
     def __init__(self, projectConfig):
         self.projectConfig = projectConfig
+        self.batchSize = int(projectConfig.get("orientdb-batch-size", Config.ORIENTDB_BATCH_SIZE))
         self.client = pyorient.OrientDB("localhost", 2424)
         self.client.db_open(
             self.projectConfig["orientdb-name"],
@@ -27,100 +38,128 @@ class OrientDB:
         self.checkStructure()
 
     def checkStructure(self):
-        if not self.client.command("SELECT name FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % ClassName.ASTNode):
-            self.client.command("CREATE CLASS %s EXTENDS V" % ClassName.ASTNode)
-        if not self.client.command("SELECT name FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % ClassName.ASTEdge):
-            self.client.command("CREATE CLASS %s EXTENDS E" % ClassName.ASTEdge)
-        if not self.client.command("SELECT name FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % ClassName.CFGNode):
-            self.client.command("CREATE CLASS %s EXTENDS V" % ClassName.CFGNode)
-        if not self.client.command("SELECT name FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % ClassName.CFGEdge):
-            self.client.command("CREATE CLASS %s EXTENDS E" % ClassName.CFGEdge)
-        if not self.client.command("SELECT name FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % ClassName.DFGNode):
-            self.client.command("CREATE CLASS %s EXTENDS V" % ClassName.DFGNode)
-        if not self.client.command("SELECT name FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % ClassName.DFGEdge):
-            self.client.command("CREATE CLASS %s EXTENDS E" % ClassName.DFGEdge)
-
-    def populate(self):
-        self.populateASTs()
-        self.populateCFGs()
-        self.populateDFGs()
+        # Классы, типизированные свойства и индексы, по которым ищутся узлы
+        OrientSchema(self.client).ensure()
+
+    def explainQueries(self):
+        OrientSchema(self.client).explain()
+
+    def populate(self, full: bool = False):
+        self.populateASTs(full)
+        self.populateCFGs(full)
+        self.populateDFGs(full)
 
     def clear(self):
         self.client.command("DELETE VERTEX ASTNode")
         self.client.command("DELETE VERTEX CFGNode")
         self.client.command("DELETE VERTEX DFGNode")
+        self.client.command("DELETE VERTEX GraphSummary")
 
-    def populateASTs(self):
+    def populateASTs(self, full: bool = False):
         print("Populating ASTs...")
-        self.client.command("DELETE VERTEX ASTNode")
-        ASTs = Database(self.projectConfig).getAllASTs()
-        for name, AST in ASTs.items():
-            for v in AST.nodes:
-                ASTNodeRecord = {
-                    "@ASTNode": self.serializeASTNode(v)
-                }
-
-                clusterId = self.getDefaultClusterId(ClassName.ASTNode)
-                self.client.record_create(clusterId, ASTNodeRecord)
-
-            for e in AST.allEdges:
-                source = e.source.Id
-                target = e.target.Id
-                label = "ASTNode"
-                self.client.command(f"CREATE EDGE ASTEdge FROM ( SELECT FROM ASTNode WHERE Id={source} and file='{name}' ) "
-                                    f"TO ( SELECT FROM ASTNode WHERE Id={target} and file='{name}' ) "
-                                    f"SET label='{label}'")
-
-    def populateCFGs(self):
+        ASTs = Database(self.projectConfig).getAllASTs(frozen=True)
+        self.syncGraphs(GraphLayer.AST, ClassName.ASTNode, "file", ASTs, self.serializeAST, full)
+
+    def populateCFGs(self, full: bool = False):
         print("Populating CFGs...")
-        self.client.command("DELETE VERTEX CFGNode")
-        CFGs = Database(self.projectConfig).getAllCFGs()
-        for name, CFG in CFGs.items():
-            for v in CFG.nodes:
-                CFGNodeRecord = {
-                    "@CFGNode": self.serializeCFGNode(v)
-                }
-                clusterId = self.getDefaultClusterId(ClassName.CFGNode)
-                self.client.record_create(clusterId, CFGNodeRecord)
-
-            for e in CFG.allEdges:
-                source = e.source.Id
-                target = e.target.Id
-                label = e.label
-                self.client.command(f"CREATE EDGE CFGEdge FROM ( SELECT FROM CFGNode WHERE Id={source} and method='{name}' ) "
-                               f"TO ( SELECT FROM CFGNode WHERE Id={target} and method='{name}' ) "
-                               f"SET label='{label}'")
-
-    def populateDFGs(self):
+        CFGs = Database(self.projectConfig).getAllCFGs(frozen=True)
+        self.syncGraphs(GraphLayer.CFG, ClassName.CFGNode, "method", CFGs, self.serializeCFG, full)
+
+    def populateDFGs(self, full: bool = False):
         print("Populating DFGs...")
-        self.client.command("DELETE VERTEX DFGNode")
-        DFGs = Database(self.projectConfig).getAllDFGs()
-        for name, DFG in DFGs.items():
-            for v in DFG.nodes:
-                DFGNodeRecord = {
-                    "@DFGNode": self.serializeDFGNode(v)
-                }
-                clusterId = self.getDefaultClusterId(ClassName.DFGNode)
-                self.client.record_create(clusterId, DFGNodeRecord)
-
-        for name, DFG in DFGs.items():
-            for e in DFG.allEdges:
-                sourceId = e.source.Id
-                targetId = e.target.Id
-                label = e.label
-                kind = e.kind.name
-                if e.kind == DFEdgeKind.INTRA:
-                    self.client.command(f"CREATE EDGE DFGEdge FROM ( SELECT FROM DFGNode WHERE Id={sourceId} and method='{name}' ) "
-                                    f"TO ( SELECT FROM DFGNode WHERE Id={targetId} and method='{name}' ) "
-                                    f"SET label='{label}', kind='{kind}'")
-                else:
-                    targetMethodName = e.target.method
-                    self.client.command(
-                        f"CREATE EDGE DFGEdge FROM ( SELECT FROM DFGNode WHERE Id={sourceId} and method='{name}' ) "
-                        f"TO ( SELECT FROM DFGNode WHERE Id={targetId} and method='{targetMethodName}' ) "
-                        f"SET label='{label}', kind='{kind}'")
-
-    def serializeASTNode(self, node: ASNode) -> Dict[str, str]:
+        DFGs = Database(self.projectConfig).getAllDFGs(frozen=True)
+        self.syncGraphs(GraphLayer.DFG, ClassName.DFGNode, "method", DFGs, self.serializeDFG, full)
+
+    @staticmethod
+    def serializeAST(name, AST) -> Tuple[list, list]:
+        vertices = [(v.Id, OrientDB.serializeASTNode(v)) for v in AST.nodes]
+        edges = [(ClassName.ASTEdge, e.source.Id, name, e.target.Id, {"label": "ASTNode"}) for e in AST.allEdges]
+        return vertices, edges
+
+    @staticmethod
+    def serializeCFG(name, CFG) -> Tuple[list, list]:
+        vertices = [(v.Id, OrientDB.serializeCFGNode(v)) for v in CFG.nodes]
+        edges = [(ClassName.CFGEdge, e.source.Id, name, e.target.Id, {"label": str(e.label)}) for e in CFG.allEdges]
+        return vertices, edges
+
+    @staticmethod
+    def serializeDFG(name, DFG) -> Tuple[list, list]:
+        vertices = [(v.Id, OrientDB.serializeDFGNode(v)) for v in DFG.nodes]
+        edges = []
+        for e in DFG.allEdges:
+            # Межпроцедурное ребро без найденного вызываемого метода не связывает вершины
+            if e.target is None:
+                continue
+            targetMethodName = name if e.kind == DFEdgeKind.INTRA else e.target.method
+            edges.append((ClassName.DFGEdge, e.source.Id, targetMethodName, e.target.Id,
+                          {"label": str(e.label), "kind": e.kind.name}))
+        return vertices, edges
+
+    def getGraphSummaries(self, layer: str) -> Dict[str, str]:
+        records = self.client.command(f"SELECT name, hash FROM {ClassName.GraphSummary} WHERE layer = '{layer}'")
+        return {record.oRecordData["name"]: record.oRecordData["hash"] for record in records}
+
+    def loadRIDs(self, loader: OrientBulkLoader, nodeClass: str, graphColumn: str, name: str):
+        records = self.client.command(f"SELECT @rid AS rid, Id FROM {nodeClass} WHERE {graphColumn} = {json.dumps(name)}")
+        for record in records:
+            loader.setRID((name, record.oRecordData["Id"]), str(record.oRecordData["rid"]))
+
+    def syncGraphs(self, layer: str, nodeClass: str, graphColumn: str, graphs: Dict[str, object],
+                   serialize: Callable, full: bool):
+        """Brings the vertices of one layer in line with the graphs of the database.
+
+        Every loaded graph has a summary vertex with the hash of its serialized vertices and edges,
+        only graphs with another hash are deleted and loaded again, and summaries of graphs
+        that are gone are deleted with their vertices. Edges between a changed and an unchanged
+        graph (interprocedural flows) are recreated from the RIDs of the unchanged vertices.
+        """
+        summaries = dict() if full else self.getGraphSummaries(layer)
+        if len(summaries) == 0:
+            # Без сводок неизвестно, какие графы уже загружены, поэтому слой загружается заново
+            self.client.command(f"DELETE VERTEX {nodeClass}")
+            self.client.command(f"DELETE VERTEX {ClassName.GraphSummary} WHERE layer = '{layer}'")
+
+        hashes = dict()
+        for name, graph in graphs.items():
+            content = json.dumps(serialize(name, graph), sort_keys=True)
+            hashes[name] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        changed = {name for name, graphHash in hashes.items() if summaries.get(name) != graphHash}
+        removed = set(summaries.keys()) - set(graphs.keys())
+        print(f"{len(changed)} of {len(graphs)} graphs changed, {len(removed)} removed")
+
+        loader = OrientBulkLoader(self.client, self.batchSize)
+        for name in sorted(changed | removed):
+            loader.addCommand(f"DELETE VERTEX {nodeClass} WHERE {graphColumn} = {json.dumps(name)}")
+            loader.addCommand(f"DELETE VERTEX {ClassName.GraphSummary} WHERE layer = '{layer}' AND name = {json.dumps(name)}")
+        loader.flushCommands()
+
+        edges = []
+        for name, graph in graphs.items():
+            graphVertices, graphEdges = serialize(name, graph)
+            if name in changed:
+                for Id, content in graphVertices:
+                    loader.addVertex((name, Id), nodeClass, content)
+            edges.extend((name,) + edge for edge in graphEdges if name in changed or edge[2] in changed)
+
+        resolved = set()
+        for name, className, sourceId, targetName, targetId, content in edges:
+            if targetName not in graphs:
+                continue
+            for graphName in (name, targetName):
+                if graphName not in changed and graphName not in resolved:
+                    self.loadRIDs(loader, nodeClass, graphColumn, graphName)
+                    resolved.add(graphName)
+            loader.addEdge(className, (name, sourceId), (targetName, targetId), content)
+        loader.flushEdges()
+
+        # Сводки записываются последними: прерванная синхронизация повторится для графов без сводок
+        for name in sorted(changed):
+            summary = {"layer": layer, "name": name, "hash": hashes[name]}
+            loader.addCommand(f"CREATE VERTEX {ClassName.GraphSummary} CONTENT {json.dumps(summary)}")
+        loader.finish()
+
+    @staticmethod
+    def serializeASTNode(node: ASNode) -> Dict[str, str]:
         serialized = {
             "Id": node.Id,
             "kind": node.kind.name,
@@ -128,12 +167,15 @@ class OrientDB:
             "code": node.code,
             "sharedId": node.sharedId,
             "file": node.file,
+            "cfgSharedId": node.cfgSharedId,
+            "dfgSharedId": node.dfgSharedId,
             "optionalProperties": json.dumps(node.optionalProperties)
         }
 
         return serialized
 
-    def serializeCFGNode(self, node: CFNode) -> Dict[str, str]:
+    @staticmethod
+    def serializeCFGNode(node: CFNode) -> Dict[str, str]:
         serialized = {
             "Id": node.Id,
             "kind": node.kind.name,
@@ -147,7 +189,8 @@ class OrientDB:
 
         return serialized
 
-    def serializeDFGNode(self, node: DFNode) -> Dict[str, str]:
+    @staticmethod
+    def serializeDFGNode(node: DFNode) -> Dict[str, str]:
         serialized = {
             "Id": node.Id,
             "line": node.line,
@@ -155,20 +198,12 @@ class OrientDB:
             "sharedId": node.sharedId,
             "method": node.method,
             "file": node.file,
-            "DEFs": node.DEFs,
-            "USEs": node.USEs,
-            "selfFlows": node.selfFlows,
+            # Множества переменных упорядочены, чтобы хэш графа не зависел от порядка обхода множества
+            "DEFs": sorted(node.getAllDEFs()),
+            "USEs": sorted(node.getAllUSEs()),
+            "selfFlows": sorted(node.getAllSelfFlows()),
             "IP_DEFs": node.IP_DEFs,
             "optionalProperties": json.dumps(node.optionalProperties)
         }
 
         return serialized
-
-    def getDefaultClusterId(self, className: ClassName):
-        oRecords = self.client.command(
-            "SELECT defaultClusterId FROM (SELECT expand(classes) FROM metadata:schema) WHERE name='%s'" % className
-        )
-        oRecord = oRecords[0]
-        oRecordData = oRecord.oRecordData
-        return oRecordData["defaultClusterId"]
-
@@ -0,0 +1,123 @@
+from typing import Dict, List, Tuple
+
+# Свойства вершин и рёбер с типами OrientDB, как их записывает OrientDB.serialize*Node
+NODE_PROPERTIES = {
+    "Id": "INTEGER",
+    "line": "INTEGER",
+    "code": "STRING",
+    "sharedId": "STRING",
+    "file": "STRING",
+    "optionalProperties": "STRING",
+}
+CLASSES: Dict[str, Tuple[str, Dict[str, str]]] = {
+    "ASTNode": ("V", dict(NODE_PROPERTIES, kind="STRING", cfgSharedId="STRING", dfgSharedId="STRING")),
+    "ASTEdge": ("E", {"label": "STRING"}),
+    "CFGNode": ("V", dict(NODE_PROPERTIES, kind="STRING", method="STRING")),
+    "CFGEdge": ("E", {"label": "STRING"}),
+    "DFGNode": ("V", dict(NODE_PROPERTIES, method="STRING", DEFs="EMBEDDEDLIST STRING", USEs="EMBEDDEDLIST STRING",
+                          selfFlows="EMBEDDEDLIST STRING", IP_DEFs="EMBEDDEDMAP")),
+    "DFGEdge": ("E", {"label": "STRING", "kind": "STRING"}),
+    "GraphSummary": ("V", {"layer": "STRING", "name": "STRING", "hash": "STRING"}),
+}
+TYPE_NAMES = {1: "INTEGER", 7: "STRING", 10: "EMBEDDEDLIST", 12: "EMBEDDEDMAP"}
+
+# Индексы: имя -> (класс, свойства, тип). sharedId не уникален: узлы AST делят его с узлами,
+# из которых построены, а у служебных узлов CFG его нет. Id уникален в пределах файла (AST) или метода
+INDEXES: Dict[str, Tuple[str, List[str], str]] = {
+    "ASTNode.sharedId": ("ASTNode", ["sharedId"], "NOTUNIQUE_HASH_INDEX"),
+    "ASTNode.kind": ("ASTNode", ["kind"], "NOTUNIQUE_HASH_INDEX"),
+    "ASTNode.code": ("ASTNode", ["code"], "NOTUNIQUE_HASH_INDEX"),
+    "ASTNode.Id_file": ("ASTNode", ["Id", "file"], "UNIQUE_HASH_INDEX"),
+    "ASTNode.file": ("ASTNode", ["file"], "NOTUNIQUE_HASH_INDEX"),
+    "CFGNode.sharedId": ("CFGNode", ["sharedId"], "NOTUNIQUE_HASH_INDEX"),
+    "CFGNode.kind": ("CFGNode", ["kind"], "NOTUNIQUE_HASH_INDEX"),
+    "CFGNode.Id_method": ("CFGNode", ["Id", "method"], "UNIQUE_HASH_INDEX"),
+    "CFGNode.method": ("CFGNode", ["method"], "NOTUNIQUE_HASH_INDEX"),
+    "DFGNode.sharedId": ("DFGNode", ["sharedId"], "NOTUNIQUE_HASH_INDEX"),
+    "DFGNode.code": ("DFGNode", ["code"], "NOTUNIQUE_HASH_INDEX"),
+    "DFGNode.Id_method": ("DFGNode", ["Id", "method"], "UNIQUE_HASH_INDEX"),
+    "DFGNode.method": ("DFGNode", ["method"], "NOTUNIQUE_HASH_INDEX"),
+    "GraphSummary.layer_name": ("GraphSummary", ["layer", "name"], "UNIQUE_HASH_INDEX"),
+}
+
+# Запросы, которым нужны индексы: поиск узлов по sharedId (Gremlin.find*), по виду и коду узла
+# (шаблоны источников и стоков), концов рёбер по Id в файле или методе и узлов графа при синхронизации
+QUERIES = [
+    "SELECT FROM ASTNode WHERE sharedId = '0'",
+    "SELECT FROM CFGNode WHERE sharedId = '0'",
+    "SELECT FROM DFGNode WHERE sharedId = '0'",
+    "SELECT FROM ASTNode WHERE kind = 'CALL'",
+    "SELECT FROM ASTNode WHERE code = 'execute'",
+    "SELECT FROM ASTNode WHERE Id = 0 AND file = ''",
+    "SELECT FROM CFGNode WHERE Id = 0 AND method = ''",
+    "SELECT FROM DFGNode WHERE Id = 0 AND method = ''",
+    "SELECT FROM ASTNode WHERE file = ''",
+    "SELECT FROM CFGNode WHERE method = ''",
+    "SELECT FROM DFGNode WHERE method = ''",
+    "SELECT FROM GraphSummary WHERE layer = 'AST' AND name = ''",
+]
+
+
+class OrientSchema:
+    """Classes, typed properties and indexes of the graph database.
+
+    `ensure()` runs on every connection: it creates whatever is missing and reports
+    properties and indexes that exist with another type, `explain()` prints the plans
+    of the queries that rely on the indexes.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def select(self, query: str) -> List[dict]:
+        return [record.oRecordData for record in self.client.command(query)]
+
+    def getClasses(self) -> Dict[str, dict]:
+        return {data["name"]: data for data in self.select("SELECT name FROM (SELECT expand(classes) FROM metadata:schema)")}
+
+    def getProperties(self, className: str) -> Dict[str, str]:
+        properties = self.select(
+            "SELECT name, type FROM (SELECT expand(properties) FROM "
+            f"(SELECT expand(classes) FROM metadata:schema) WHERE name = '{className}')"
+        )
+        # OrientDB 2.x хранит в схеме номер типа, 3.x - его имя
+        return {data["name"]: TYPE_NAMES.get(data.get("type"), str(data.get("type"))) for data in properties}
+
+    def getIndexes(self) -> Dict[str, str]:
+        return {data["name"]: data.get("type")
+                for data in self.select("SELECT name, type FROM (SELECT expand(indexes) FROM metadata:indexmanager)")}
+
+    def ensure(self):
+        classes = self.getClasses()
+        for className, (superClass, properties) in CLASSES.items():
+            if className not in classes:
+                self.client.command(f"CREATE CLASS {className} EXTENDS {superClass}")
+
+            existing = self.getProperties(className)
+            for name, propertyType in properties.items():
+                if name not in existing:
+                    self.client.command(f"CREATE PROPERTY {className}.{name} {propertyType}")
+                elif existing[name].upper() != propertyType.split()[0]:
+                    print(f"Property {className}.{name} is {existing[name]}, expected {propertyType}")
+
+        indexes = self.getIndexes()
+        for name, (className, properties, indexType) in INDEXES.items():
+            if name in indexes and indexes[name] != indexType:
+                print(f"Index {name} is {indexes[name]}, expected {indexType}, recreating it")
+                self.client.command(f"DROP INDEX `{name}`")
+            if name not in indexes or indexes[name] != indexType:
+                print(f"Creating index {name}...")
+                self.client.command(f"CREATE INDEX `{name}` ON {className} ({', '.join(properties)}) {indexType} "
+                                    "METADATA {ignoreNullValues: true}")
+
+    def explain(self):
+        for query in QUERIES:
+            print(query)
+            for plan in self.select("EXPLAIN " + query):
+                # 2.x сообщает использованные индексы, 3.x - план выполнения текстом
+                if "executionPlanAsString" in plan:
+                    print(plan["executionPlanAsString"])
+                elif plan.get("involvedIndexes"):
+                    print(f"  indexes: {', '.join(plan['involvedIndexes'])}")
+                else:
+                    print("  full scan, no index is used")
@@ -0,0 +1,475 @@
+import json
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import NodeIdentity
+from ASTBuilder import ASTBuilder
+from BuildCache import BuildCache
+from BuildJournal import BuildJournal, DFGS_DONE, UNIT_DONE
+from CFGBuilder import CFGBuilder
+from DFGBuilder import DFGBuilder
+from JavaClassExtractor import JavaClassExtractor
+from JavaStructures import JavaClass
+from antlr.JavaParser import JavaParser
+from config import Config
+from db import Database, DBCollections
+from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
+from graphs.cfg.ControlFlowGraph import ControlFlowGraph
+from graphs.ddg.DFEdge import DFEdgeKind
+from graphs.ddg.DataFlowGraph import DataFlowGraph
+from schemas import AbstractSyntaxTreeSchema, ControlFlowGraphSchema, DataFlowGraphSchema, JavaClassSchema
+from utils import parseJavaFile
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+class FileUnit:
+    def __init__(self, filePath: str, parseTree: JavaParser.CompilationUnitContext,
+                 javaClasses: Dict[str, JavaClass], astName: str, ast: AbstractSyntaxTree,
+                 cfgs: Dict[str, ControlFlowGraph]):
+        self.filePath = filePath
+        self.parseTree = parseTree
+        self.javaClasses = javaClasses
+        self.astName = astName
+        self.ast = ast
+        self.cfgs = cfgs
+        self.dfgs: Dict[str, DataFlowGraph] = dict()
+
+    def serialize(self) -> dict:
+        return {
+            "filePath": self.filePath,
+            "javaClasses": {qn: JavaClassSchema().dump(jc) for qn, jc in self.javaClasses.items()},
+            "astName": self.astName,
+            "ast": AbstractSyntaxTreeSchema().dump(self.ast),
+            "cfgs": {qn: ControlFlowGraphSchema().dump(cfg) for qn, cfg in self.cfgs.items()},
+            "dfgs": {qn: DataFlowGraphSchema().dump(dfg) for qn, dfg in self.dfgs.items()},
+        }
+
+    @staticmethod
+    def deserialize(data: dict) -> "FileUnit":
+        unit = FileUnit(
+            data["filePath"],
+            None,
+            {qn: JavaClassSchema().load(jc) for qn, jc in data["javaClasses"].items()},
+            data["astName"],
+            AbstractSyntaxTreeSchema().load(data["ast"]),
+            {qn: ControlFlowGraphSchema().load(cfg) for qn, cfg in data["cfgs"].items()}
+        )
+        unit.dfgs = {qn: DataFlowGraphSchema().load(dfg) for qn, dfg in data["dfgs"].items()}
+        return unit
+
+
+def buildFileUnit(projectConfig, filePath: str) -> Optional[FileUnit]:
+    parseTree = parseJavaFile(filePath)
+    try:
+        NodeIdentity.checkTokenCount(filePath, parseTree)
+    except NodeIdentity.TokenRangeError as e:
+        # Узлы такого файла нельзя пронумеровать, файл пропускается, а не прерывает сборку
+        logger.warning(f"Skipped: {e}")
+        return None
+
+    javaClassExtractor = JavaClassExtractor(projectConfig)
+    javaClassExtractor.extractInfo(filePath, parseTree)
+
+    astBuilder = ASTBuilder(projectConfig)
+    astBuilder.build(filePath, parseTree)
+    ast = astBuilder.getAST()
+    ast.exportNew(astBuilder.getName())
+
+    cfgBuilder = CFGBuilder(projectConfig)
+    cfgBuilder.build(filePath, parseTree)
+    cfgs = cfgBuilder.getCFGs()
+    for qn, CFG in cfgs.items():
+        CFG.exportNew(filename=qn)
+
+    return FileUnit(filePath, parseTree, javaClassExtractor.javaClasses, astBuilder.getName(), ast, cfgs)
+
+
+def buildUnitDFGs(projectConfig, unit: FileUnit):
+    logger.info(f"Building DFGs for {unit.filePath}...")
+    # Если нет функций и их CFG, то следовательно нет и DFG
+    if len(unit.cfgs) != 0:
+        if unit.parseTree is None:
+            unit.parseTree = parseJavaFile(unit.filePath)
+        dfgBuilder = DFGBuilder(projectConfig)
+        dfgBuilder.build(unit.filePath, unit.ast, unit.parseTree, unit.cfgs)
+        unit.dfgs = dfgBuilder.getDFGs()
+        for qn, DFG in unit.dfgs.items():
+            DFG.exportNew(filename=qn)
+
+    # The parse tree is the largest object of a unit and is not needed anymore
+    unit.parseTree = None
+
+
+# Worker functions get and return serialized units, because parse trees and graphs with
+# object references are expensive to pickle between processes
+def buildSerializedFileUnit(projectConfig, filePath: str) -> Optional[dict]:
+    unit = buildFileUnit(projectConfig, filePath)
+    return None if unit is None else unit.serialize()
+
+
+def buildSerializedUnitDFGs(projectConfig, data: dict) -> dict:
+    unit = FileUnit.deserialize(data)
+    buildUnitDFGs(projectConfig, unit)
+    return {qn: DataFlowGraphSchema().dump(dfg) for qn, dfg in unit.dfgs.items()}
+
+
+def initWorker(projectConfig):
+    # Load the database with classes and CFGs of the whole project, DFGVisitor resolves callees against them
+    db = Database(projectConfig)
+    NodeIdentity.setFileIndexes(db.getFileIndexes())
+
+
+def mapOrdered(executor: ProcessPoolExecutor, fn, items: Iterable, window: int) -> Iterator:
+    # Как executor.map, но в работе не больше window задач, и входные данные готовятся по мере надобности
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while len(pending) != 0:
+        yield pending.popleft().result()
+
+
+class PipelineBuilder:
+    """Builds Java classes, AST, CFGs and DFGs of every file from a single parse tree.
+
+    DFG construction resolves callees against the classes and CFGs of the whole project,
+    so it runs as a second step. A serial run keeps the units it built with their parse trees
+    for that step, other units are loaded from the database one at a time and parsed again.
+    With more than one job the files are handled by a process pool, and the results are
+    stored in the order of the file list, so the database is the same as after a serial run.
+    The results of both steps are kept in the build cache: a unit is reused while the file
+    is unchanged, and its DFGs are reused while the classes and CFGs of the project are unchanged too.
+
+    Every file is stored as soon as it is built and written to the build journal, and an interrupted
+    run is resumed from the journal. With "keep-parse-trees" turned off the serial run keeps only
+    the file records in memory too, at the cost of parsing every file again in the DFG step.
+    The file records in the database are replaced only after the DFG step, so a run that was
+    interrupted after the database was committed for the workers finds the same changed files again.
+
+    If the database has records of a previous run, only the changed files are rebuilt, and the DFGs
+    of files that depend on them through imports, superclasses, packages or inter-procedural flows.
+    """
+
+    def __init__(self, projectConfig, jobs: int = 1):
+        self.projectConfig = projectConfig
+        self.jobs = jobs
+        self.cache = BuildCache(projectConfig)
+        self.journal = BuildJournal(projectConfig)
+        # Units built by the serial run keep their parse trees for the DFG step
+        self.keepParseTrees = projectConfig.get("keep-parse-trees", Config.KEEP_PARSE_TREES)
+        self.parsedUnits: Dict[str, FileUnit] = dict()
+        # Records of the files rebuilt by this run, they are stored after inter-procedural linking
+        self.records: Dict[str, dict] = dict()
+        # file path -> names of the DFGs built by this run
+        self.dfgNames: Dict[str, List[str]] = dict()
+        self.removedFiles: List[str] = []
+        # Files with too many tokens for node identities, they are handled as removed ones
+        self.skippedFiles: List[str] = []
+        self.incremental = False
+
+    def getAffectedFiles(self) -> Set[str]:
+        return set(self.records.keys())
+
+    def build(self, filePaths: List[str]):
+        db = Database(self.projectConfig)
+        fileIndexes = db.registerFiles(filePaths)
+        records = db.getAllFileRecords()
+        self.incremental = len(records) != 0
+        # Индекс файла входит в идентификаторы его узлов, поэтому и в ключ кэша
+        fileKeys = {filePath: BuildCache.getKey(BuildCache.getFileKey(filePath), str(fileIndexes[filePath]))
+                    for filePath in filePaths}
+        changedFiles = [filePath for filePath in filePaths
+                        if filePath not in records or records[filePath]["hash"] != fileKeys[filePath]]
+        self.removedFiles = [filePath for filePath in records if filePath not in fileKeys]
+        if self.incremental:
+            print(f"{len(changedFiles)} changed and {len(self.removedFiles)} removed files")
+
+        changedClasses = set()
+        for filePath in changedFiles + self.removedFiles:
+            if filePath in records:
+                changedClasses.update(records[filePath]["javaClasses"])
+                self.removeFile(filePath, records[filePath])
+
+        for filePath, record in self.buildUnits(changedFiles, [fileKeys[filePath] for filePath in changedFiles]):
+            self.records[filePath] = record
+            changedClasses.update(record["javaClasses"])
+
+        changed = set(changedFiles + self.removedFiles)
+        for filePath in filePaths:
+            record = records.get(filePath)
+            if filePath in changed or not self.dependsOn(record, changed, changedClasses):
+                continue
+            for qn in record["cfgs"]:
+                db.remove(DBCollections.DFGs, qn)
+            self.records[filePath] = dict(record)
+        if self.incremental:
+            print(f"{len(self.records)} files are affected")
+
+        affectedFiles = [filePath for filePath in filePaths if filePath in self.records]
+        self.buildDFGs(affectedFiles, [fileKeys[filePath] for filePath in affectedFiles])
+        logger.info(f"Build cache: {self.cache.hits} hits, {self.cache.misses} misses")
+
+    def getResumed(self, marker: str, filePaths: List[str], keys: List[str]) -> Dict[int, Tuple[dict, int]]:
+        # Файлы, которые прерванный запуск успел записать в журнал с теми же ключами:
+        # индекс -> (данные отметки, смещение записей)
+        finished = self.journal.getFinished(marker)
+        resumed = dict()
+        for i, filePath in enumerate(filePaths):
+            if filePath in finished and finished[filePath][0]["hash"] == keys[i]:
+                resumed[i] = finished[filePath]
+        if len(resumed) != 0:
+            print(f"Resuming: {len(resumed)} of {len(filePaths)} files are in the journal")
+        return resumed
+
+    def buildUnits(self, filePaths: List[str], fileKeys: List[str]) -> Iterator[Tuple[str, dict]]:
+        resumed = self.getResumed(UNIT_DONE, filePaths, fileKeys)
+        missing = [i for i, key in enumerate(fileKeys) if i not in resumed and not self.cache.contains(key)]
+        count = len(filePaths) - len(resumed)
+        if count != 0:
+            print(f"Build cache: {count - len(missing)} of {count} files are unchanged")
+
+        built = self.mapUnits([filePaths[i] for i in missing])
+        missingIndexes = set(missing)
+        for i, filePath in enumerate(filePaths):
+            if i in resumed:
+                record, start = resumed[i]
+                self.storeRecords(self.journal.readRecords(start))
+                yield filePath, record
+                continue
+
+            data = self.cache.get(fileKeys[i])
+            if data is None:
+                # Запись кэша могла быть вытеснена, пока строились предыдущие файлы
+                data = next(built) if i in missingIndexes else buildSerializedFileUnit(self.projectConfig, filePath)
+                if data is None:
+                    self.skippedFiles.append(filePath)
+                    continue
+                self.cache.put(fileKeys[i], data)
+            record = self.makeRecord(fileKeys[i], data)
+            records = self.getUnitRecords(data)
+            self.storeRecords(records)
+            self.journal.write(records, UNIT_DONE, filePath, record)
+            yield filePath, record
+
+    def buildDFGs(self, filePaths: List[str], fileKeys: List[str]):
+        print("Building DFGs...")
+        symbolsKey = self.getSymbolsKey()
+        dfgKeys = [BuildCache.getKey(fileKey, symbolsKey) for fileKey in fileKeys]
+        resumed = self.getResumed(DFGS_DONE, filePaths, dfgKeys)
+        missing = [i for i, key in enumerate(dfgKeys) if i not in resumed and not self.cache.contains(key)]
+
+        built = self.mapDFGs([filePaths[i] for i in missing])
+        missingIndexes = set(missing)
+        for i, filePath in enumerate(filePaths):
+            if i in resumed:
+                records = self.journal.readRecords(resumed[i][1])
+                self.storeRecords(records)
+                self.dfgNames[filePath] = [qn for collection, qn, dfg in records]
+                continue
+
+            data = self.cache.get(dfgKeys[i])
+            if data is None:
+                data = next(built) if i in missingIndexes else self.buildSerializedDFGs(filePath)
+                self.cache.put(dfgKeys[i], data)
+            records = [(DBCollections.DFGs, qn, dfg) for qn, dfg in data.items()]
+            self.storeRecords(records)
+            self.journal.write(records, DFGS_DONE, filePath, {"hash": dfgKeys[i]})
+            self.dfgNames[filePath] = list(data.keys())
+
+        self.parsedUnits.clear()
+
+    def mapUnits(self, filePaths: List[str]) -> Iterator[Optional[dict]]:
+        if self.jobs > 1:
+            if len(filePaths) == 0:
+                return
+            with ProcessPoolExecutor(max_workers=self.jobs, initializer=NodeIdentity.setFileIndexes,
+                                     initargs=(dict(NodeIdentity.fileIndexes),)) as executor:
+                results = mapOrdered(executor, partial(buildSerializedFileUnit, self.projectConfig), filePaths,
+                                     self.jobs * 2)
+                for filePath, data in zip(filePaths, results):
+                    print("Handled: " + filePath)
+                    yield data
+        else:
+            for filePath in filePaths:
+                print("Handling: " + filePath)
+                unit = buildFileUnit(self.projectConfig, filePath)
+                if unit is not None and self.keepParseTrees:
+                    self.parsedUnits[filePath] = unit
+                yield None if unit is None else unit.serialize()
+
+    def mapDFGs(self, filePaths: List[str]) -> Iterator[Dict[str, dict]]:
+        if self.jobs > 1:
+            if len(filePaths) == 0:
+                return
+            # Единицы загружаются из базы по одной, когда до них доходит очередь
+            units = (self.loadUnit(filePath, self.records[filePath]) for filePath in filePaths)
+            # Workers of the DFG step read the classes and CFGs from the database file
+            Database(self.projectConfig).commit()
+            with ProcessPoolExecutor(max_workers=self.jobs, initializer=initWorker,
+                                     initargs=(self.projectConfig,)) as executor:
+                yield from mapOrdered(executor, partial(buildSerializedUnitDFGs, self.projectConfig), units,
+                                      self.jobs * 2)
+        else:
+            for filePath in filePaths:
+                yield self.buildSerializedDFGs(filePath)
+
+    def buildSerializedDFGs(self, filePath: str) -> Dict[str, dict]:
+        unit = self.parsedUnits.pop(filePath, None)
+        if unit is None:
+            return buildSerializedUnitDFGs(self.projectConfig, self.loadUnit(filePath, self.records[filePath]))
+        buildUnitDFGs(self.projectConfig, unit)
+        return {qn: DataFlowGraphSchema().dump(dfg) for qn, dfg in unit.dfgs.items()}
+
+    def linkDFGs(self):
+        """Adds inter-procedural data flows to the DFGs built by this run, one graph at a time."""
+        db = Database(self.projectConfig)
+        entryGlobalIds = set()
+        for qns in self.dfgNames.values():
+            for qn in qns:
+                entryGlobalIds.update(node["IP_DEFs"]["entryGlobalId"]
+                                      for node in db.getSerialized(DBCollections.DFGs, qn)["nodes"]
+                                      if node["IP_DEFs"] is not None)
+        index = DFGBuilder.buildGlobalIdIndex(dict(), db, entryGlobalIds)
+
+        for filePath, qns in self.dfgNames.items():
+            calls = set()
+            for qn in qns:
+                dfg = db.getDFG(qn)
+                DFGBuilder.linkIPDataFlows(qn, dfg, index)
+                db.putDFG(qn, dfg)
+                for edge in dfg.allEdges:
+                    if edge.kind == DFEdgeKind.INTER and edge.target is not None:
+                        calls.add(edge.target.getFile())
+            calls.discard(filePath)
+            self.records[filePath]["calls"] = sorted(calls)
+
+    def linkFlowNodes(self):
+        """Stores on the AST nodes of the files built by this run their enclosing CFG and DFG nodes."""
+        db = Database(self.projectConfig)
+        for filePath, qns in self.dfgNames.items():
+            cfgGlobalIds = {node.globalId for cfg in db.getCFGsByFilePath(filePath).values() for node in cfg.nodes}
+            dfgGlobalIds = {node.globalId for qn in qns for node in db.getDFG(qn).nodes}
+            for name in db.getNamesByFilePath(DBCollections.ASTs, filePath):
+                ast = db.getAST(name)
+                if ast.linkFlowNodes(cfgGlobalIds, dfgGlobalIds):
+                    db.putAST(name, ast)
+
+    def complete(self):
+        # The database is committed, the journal of the run is not needed anymore
+        self.journal.remove()
+
+    def getSymbolsKey(self) -> str:
+        # DFGVisitor смотрит в классы всего проекта и во входные узлы CFG вызываемых методов
+        db = Database(self.projectConfig)
+        entries = {qn: cfg["nodes"][0]["globalId"] for qn, cfg in db.getAllSerialized(DBCollections.CFGs).items()}
+        return BuildCache.getKey(json.dumps(db.getAllSerialized(DBCollections.JavaClasses), sort_keys=True),
+                                 json.dumps(entries, sort_keys=True))
+
+    @staticmethod
+    def makeRecord(fileKey: str, data: dict) -> dict:
+        javaClasses = data["javaClasses"].values()
+        return {
+            "hash": fileKey,
+            "astName": data["astName"],
+            "javaClasses": list(data["javaClasses"].keys()),
+            "cfgs": list(data["cfgs"].keys()),
+            "packages": sorted({jc["package"] for jc in javaClasses}),
+            "imports": sorted({imp for jc in javaClasses for imp in jc["imports"]}),
+            "names": sorted({name for jc in javaClasses for name in [jc["extends"]] + jc["implementations"]
+                             if name is not None}),
+            # Files with methods that are called by this file, they are known after inter-procedural linking
+            "calls": [],
+        }
+
+    @staticmethod
+    def dependsOn(record: dict, changedFiles: Set[str], changedClasses: Set[str]) -> bool:
+        if any(filePath in changedFiles for filePath in record["calls"]):
+            return True
+
+        for qn in changedClasses:
+            package, _, name = qn.rpartition(".")
+            if package in record["packages"] or name in record["names"]:
+                return True
+            # Импорт класса, пакета (через *) или статического члена класса
+            for imp in record["imports"]:
+                if imp == qn or qn.startswith(imp + ".") or imp.startswith(qn + "."):
+                    return True
+
+        return False
+
+    def loadUnit(self, filePath: str, record: dict) -> dict:
+        db = Database(self.projectConfig)
+        return {
+            "filePath": filePath,
+            "javaClasses": {qn: db.getSerialized(DBCollections.JavaClasses, qn) for qn in record["javaClasses"]},
+            "astName": record["astName"],
+            "ast": db.getSerialized(DBCollections.ASTs, record["astName"]),
+            "cfgs": {qn: db.getSerialized(DBCollections.CFGs, qn) for qn in record["cfgs"]},
+            "dfgs": dict(),
+        }
+
+    def removeFile(self, filePath: str, record: dict):
+        db = Database(self.projectConfig)
+        for qn in record["javaClasses"]:
+            db.remove(DBCollections.JavaClasses, qn)
+        db.remove(DBCollections.ASTs, record["astName"])
+        for qn in record["cfgs"]:
+            db.remove(DBCollections.CFGs, qn)
+            db.remove(DBCollections.DFGs, qn)
+
+    def storeFileRecords(self):
+        db = Database(self.projectConfig)
+        # Записи изменённых и удалённых файлов заменяются только здесь: база, сохранённая для
+        # процессов шага DFG, ещё хранит старые записи, и после сбоя тот же набор файлов снова
+        # определяется как изменённый и затронутый
+        for filePath in self.removedFiles + self.skippedFiles:
+            db.remove(DBCollections.Files, filePath)
+        for filePath, record in self.records.items():
+            db.putFileRecord(filePath, record)
+
+    def getTaintAffectedFiles(self) -> Optional[Set[str]]:
+        """Files whose sources may have changed taint flows, None after a full build.
+
+        Data flows only from callers to callees, so a flow from an unaffected file can pass
+        through an affected one only if the file calls it, directly or not.
+        """
+        if not self.incremental:
+            return None
+
+        affectedFiles = self.getAffectedFiles() | set(self.removedFiles) | set(self.skippedFiles)
+        callers = dict()
+        for filePath, record in Database(self.projectConfig).getAllFileRecords().items():
+            for callee in record["calls"]:
+                callers.setdefault(callee, []).append(filePath)
+
+        worklist = list(affectedFiles)
+        while len(worklist) != 0:
+            for caller in callers.get(worklist.pop(), []):
+                if caller not in affectedFiles:
+                    affectedFiles.add(caller)
+                    worklist.append(caller)
+        return affectedFiles
+
+    @staticmethod
+    def getUnitRecords(data: dict) -> List[Tuple[str, str, dict]]:
+        records = [(DBCollections.JavaClasses, qn, jc) for qn, jc in data["javaClasses"].items()]
+        records.append((DBCollections.ASTs, data["astName"], data["ast"]))
+        records.extend((DBCollections.CFGs, qn, cfg) for qn, cfg in data["cfgs"].items())
+        return records
+
+    def storeRecords(self, records: List[Tuple[str, str, dict]]):
+        db = Database(self.projectConfig)
+        for collection, key, data in records:
+            db.putSerialized(collection, key, data)
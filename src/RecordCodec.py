@@ -0,0 +1,97 @@
+import re
+import struct
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+# Сжатая запись: номер кодека и номер словаря (0 - без словаря), затем сжатый JSON
+HEADER = struct.Struct("<BI")
+CODEC_IDS = {"zlib": 1, "zstd": 2}
+# Предельный размер словаря zlib - окно DEFLATE
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+ZSTD_DICTIONARY_SIZE = 112 * 1024
+# Строки JSON: ключи, пути к файлам, имена, фрагменты кода
+JSON_STRING = re.compile(rb'"(?:[^"\\]|\\.){3,}?"')
+
+
+class RecordCodec:
+    """Compression of single records with an optional dictionary trained on samples of the database.
+
+    Records are small and similar: the same keys, file paths, names and code fragments
+    repeat in every graph, so a shared dictionary gives most of the ratio that whole-file
+    compression would, while every record is still decompressed on its own.
+    zlib is always available, zstd needs the zstandard package.
+    """
+
+    def __init__(self, name: str, level: Optional[int] = None):
+        if name not in CODEC_IDS:
+            raise ValueError(f"Unknown compression: {name}")
+        self.name = name
+        self.id = CODEC_IDS[name]
+        if name == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("zstd compression needs the zstandard package")
+            self.zstandard = zstandard
+            self.level = 3 if level is None else level
+            # Подготовленные по словарю (де)компрессоры, словарь zstd дорого загружать на каждую запись
+            self.compressors = dict()
+            self.decompressors = dict()
+        else:
+            self.level = 6 if level is None else level
+
+    @staticmethod
+    def byId(codecId: int) -> "RecordCodec":
+        for name, value in CODEC_IDS.items():
+            if value == codecId:
+                return RecordCodec(name)
+        raise ValueError(f"Unknown compression id: {codecId}")
+
+    def train(self, samples: List[bytes]) -> bytes:
+        if self.name == "zstd":
+            return self.zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, samples).as_bytes()
+
+        # Словарь zlib - просто предшествующий данным текст: в него попадают повторяющиеся строки
+        # с наибольшим выигрышем, самые выгодные в конце, ближе всего к сжимаемым данным
+        counts = Counter()
+        for sample in samples:
+            counts.update(JSON_STRING.findall(sample))
+        strings = sorted((string for string, count in counts.items() if count > 1),
+                         key=lambda string: (counts[string] * len(string), string), reverse=True)
+        selected = []
+        size = 0
+        for string in strings:
+            if size + len(string) > ZLIB_DICTIONARY_SIZE:
+                break
+            selected.append(string)
+            size += len(string)
+        return b"".join(reversed(selected))
+
+    def compress(self, payload: bytes, dictionary: Optional[bytes]) -> bytes:
+        if self.name == "zstd":
+            compressor = self.compressors.get(dictionary)
+            if compressor is None:
+                dictData = self.zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+                compressor = self.zstandard.ZstdCompressor(level=self.level, dict_data=dictData)
+                self.compressors[dictionary] = compressor
+            return compressor.compress(payload)
+        if dictionary:
+            compressor = zlib.compressobj(self.level, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(self.level)
+        return compressor.compress(payload) + compressor.flush()
+
+    def decompress(self, payload: bytes, dictionary: Optional[bytes]) -> bytes:
+        if self.name == "zstd":
+            decompressor = self.decompressors.get(dictionary)
+            if decompressor is None:
+                dictData = self.zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+                decompressor = self.zstandard.ZstdDecompressor(dict_data=dictData)
+                self.decompressors[dictionary] = decompressor
+            return decompressor.decompress(payload)
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
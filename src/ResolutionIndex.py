@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional, Tuple
+
+from JavaStructures import JavaClass, JavaField, JavaMethod
+
+
+class ResolutionIndex:
+    """Project-wide index of Java classes for name resolution.
+
+    Built once from the classes of the database and shared by all analysis stages:
+    simple name -> qualified class names, (class QN, method name, arity) -> methods
+    and class QN -> fields, including the inherited ones.
+    """
+
+    def __init__(self, javaClasses: Dict[str, JavaClass]):
+        self.javaClasses = javaClasses
+        self.classQNs: Dict[str, List[str]] = dict()
+        self.methods: Dict[Tuple[str, str, int], List[JavaMethod]] = dict()
+        self.methodsByName: Dict[Tuple[str, str], List[JavaMethod]] = dict()
+        self.fields: Dict[str, List[JavaField]] = dict()
+
+        for qn, jc in javaClasses.items():
+            self.classQNs.setdefault(qn.split(".")[-1], []).append(qn)
+            for mtd in jc.methods:
+                self.methods.setdefault((qn, mtd.name, len(mtd.args)), []).append(mtd)
+                self.methodsByName.setdefault((qn, mtd.name), []).append(mtd)
+
+    def getJavaClass(self, qualifiedName: str) -> Optional[JavaClass]:
+        return self.javaClasses.get(qualifiedName)
+
+    def getAllJavaClasses(self) -> Dict[str, JavaClass]:
+        return self.javaClasses
+
+    def getClassQNs(self, simpleName: str) -> List[str]:
+        return self.classQNs.get(simpleName, [])
+
+    def resolveClassName(self, name: str, contextClassQN: str = None) -> Optional[str]:
+        # Аргументы типа и размерности массивов не влияют на класс
+        name = name.split("<")[0].split("[")[0]
+        if name in self.javaClasses:
+            return name
+
+        candidates = self.getClassQNs(name.split(".")[-1])
+        if len(candidates) == 0:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+
+        # Неоднозначное простое имя: импорт класса, тот же пакет, импорт пакета
+        context = self.javaClasses.get(contextClassQN)
+        if context is not None:
+            for qn in candidates:
+                if qn in context.imports:
+                    return qn
+            for qn in candidates:
+                if qn.rpartition(".")[0] == context.package:
+                    return qn
+            for qn in candidates:
+                if qn.rpartition(".")[0] in context.imports:
+                    return qn
+
+        return candidates[-1]
+
+    def getSuperClassQN(self, qualifiedName: str) -> Optional[str]:
+        jc = self.javaClasses.get(qualifiedName)
+        if jc is None or jc.extends is None:
+            return None
+        return self.resolveClassName(jc.extends, qualifiedName)
+
+    def getClassHierarchy(self, qualifiedName: str) -> List[str]:
+        # Класс и его суперклассы из проекта, начиная с самого класса
+        hierarchy = []
+        current = qualifiedName
+        while current is not None and current in self.javaClasses and current not in hierarchy:
+            hierarchy.append(current)
+            current = self.getSuperClassQN(current)
+        return hierarchy
+
+    def getMethodCandidates(self, qualifiedClassName: str, methodName: str, arity: int = None) -> List[JavaMethod]:
+        for qn in self.getClassHierarchy(qualifiedClassName):
+            candidates = self.methodsByName.get((qn, methodName), [])
+            if arity is not None and len(candidates) > 1:
+                candidates = self.methods.get((qn, methodName, arity), candidates)
+            if len(candidates) > 0:
+                return candidates
+        return []
+
+    def getMethod(self, qualifiedClassName: str, methodName: str, arity: int = None) -> Optional[JavaMethod]:
+        candidates = self.getMethodCandidates(qualifiedClassName, methodName, arity)
+        return candidates[0] if len(candidates) > 0 else None
+
+    def getFields(self, qualifiedClassName: str) -> List[JavaField]:
+        # Поля класса, затем унаследованные
+        fields = self.fields.get(qualifiedClassName)
+        if fields is None:
+            fields = []
+            for qn in self.getClassHierarchy(qualifiedClassName):
+                fields.extend(self.javaClasses[qn].getAllFields())
+            self.fields[qualifiedClassName] = fields
+        return fields
@@ -0,0 +1,265 @@
+import json
+import os
+import sqlite3
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Tuple
+
+from RecordCodec import HEADER, RecordCodec
+
+# Индексируемые колонки записи: путь к файлу и пакет
+INDEXED_COLUMNS = ("filePath", "package")
+# Словарь сжатия обучается, когда в базе набирается столько записей, на выборке из не более чем SAMPLES записей
+DICTIONARY_MIN_RECORDS = 32
+DICTIONARY_SAMPLES = 512
+
+
+def getIndexedColumns(key: str, data) -> Dict[str, Optional[str]]:
+    # Графы хранят путь и пакет в properties, классы - в собственных полях
+    if not isinstance(data, dict):
+        return {column: None for column in INDEXED_COLUMNS}
+    properties = data.get("properties") if isinstance(data.get("properties"), dict) else data
+    package = properties.get("package")
+    if package is None and "className" in properties and "methodName" in properties:
+        # Имя CFG и DFG - <пакет>.<класс>.<метод>
+        suffix = f".{properties['className']}.{properties['methodName']}"
+        if key.endswith(suffix):
+            package = key[:-len(suffix)]
+    return {"filePath": properties.get("filePath"), "package": package}
+
+
+class SQLiteCollection(Mapping):
+    """Read-only view of a dict collection of SQLiteStore, values are decoded on access."""
+
+    def __init__(self, store: "SQLiteStore", name: str):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self, key: str):
+        row = self.store.execute("SELECT data FROM records WHERE collection = ? AND key = ?",
+                                 (self.name, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.store.decode(row[0])
+
+    def __contains__(self, key) -> bool:
+        return self.store.execute("SELECT 1 FROM records WHERE collection = ? AND key = ?",
+                                  (self.name, key)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        keys = self.store.execute("SELECT key FROM records WHERE collection = ? ORDER BY rowid", (self.name,))
+        return iter([key for key, in keys])
+
+    def __len__(self) -> int:
+        return self.store.execute("SELECT COUNT(*) FROM records WHERE collection = ?", (self.name,)).fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, object]]:
+        # Записи читаются курсором по одной, а не всей коллекцией
+        for key, data in self.store.execute("SELECT key, data FROM records WHERE collection = ? ORDER BY rowid",
+                                            (self.name,)):
+            yield key, self.store.decode(data)
+
+    def values(self) -> Iterator[object]:
+        for key, value in self.items():
+            yield value
+
+
+class SQLiteStore:
+    """SQLite storage with the subset of the pickledb interface that Database uses.
+
+    Every AST, CFG, DFG, Java class and file record is a row of its own, keyed by the collection
+    and the qualified name, with indexed columns for the file path and the package. Rows are
+    decoded only when they are read, writes go to the open transaction and `dump()` commits it,
+    so a commit writes only the changed rows. Insertion order of the keys is kept like in pickledb.
+
+    With compression every row is compressed on its own, so reading a graph still decompresses
+    only that graph. The dictionary for the repeated strings is trained on the first commit
+    with enough rows, and the rows written before it are compressed again with it.
+    Uncompressed rows are JSON text and compressed ones are blobs, both are readable in any mode.
+    """
+
+    def __init__(self, location: str, compression: Optional[str] = None):
+        self.location = os.path.expanduser(location)
+        self.codec = RecordCodec(compression) if compression is not None else None
+        self.codecs: Dict[int, RecordCodec] = dict()
+        # номер словаря -> словарь, 0 - без словаря
+        self.dictionaries: Dict[int, bytes] = {0: b""}
+        self.dictionaryId = 0
+        self.connection = None
+        self.pid = None
+        self.connect()
+
+    def connect(self):
+        self.connection = sqlite3.connect(self.location, check_same_thread=False)
+        self.pid = os.getpid()
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS collections (name TEXT PRIMARY KEY, kind TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS records (
+                collection TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data TEXT NOT NULL,
+                filePath TEXT,
+                package TEXT,
+                PRIMARY KEY (collection, key)
+            );
+            CREATE INDEX IF NOT EXISTS recordsByFilePath ON records (collection, filePath);
+            CREATE INDEX IF NOT EXISTS recordsByPackage ON records (collection, package);
+            CREATE TABLE IF NOT EXISTS dictionaries (id INTEGER PRIMARY KEY, codec TEXT NOT NULL, data BLOB NOT NULL);
+        """)
+        for dictionaryId, codec, data in self.connection.execute("SELECT id, codec, data FROM dictionaries ORDER BY id"):
+            self.dictionaries[dictionaryId] = data
+            if self.codec is not None and codec == self.codec.name:
+                self.dictionaryId = dictionaryId
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        # Соединение не переживает fork: процесс-обработчик открывает своё
+        if self.pid != os.getpid():
+            self.connect()
+        return self.connection.execute(sql, parameters)
+
+    def dump(self):
+        if self.pid == os.getpid():
+            trained = self.codec is not None and self.dictionaryId == 0 and self.trainDictionary()
+            self.connection.commit()
+            if trained:
+                # Пересжатые записи меньше прежних, освободившиеся страницы возвращаются файлу
+                try:
+                    self.connection.execute("VACUUM")
+                except sqlite3.OperationalError:
+                    # Не выполняется, пока открыт курсор чтения; страницы займут следующие записи
+                    pass
+        return True
+
+    def encode(self, value) -> object:
+        data = json.dumps(value)
+        if self.codec is None:
+            return data
+        dictionary = self.dictionaries[self.dictionaryId]
+        return HEADER.pack(self.codec.id, self.dictionaryId) + self.codec.compress(data.encode(), dictionary)
+
+    def decode(self, data):
+        if isinstance(data, str):
+            return json.loads(data)
+        codecId, dictionaryId = HEADER.unpack_from(data)
+        codec = self.codecs.get(codecId)
+        if codec is None:
+            codec = self.codecs[codecId] = RecordCodec.byId(codecId)
+        return json.loads(codec.decompress(data[HEADER.size:], self.dictionaries[dictionaryId]))
+
+    def trainDictionary(self) -> bool:
+        count = self.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        if count < DICTIONARY_MIN_RECORDS:
+            return False
+
+        # Равномерная выборка по порядку записей, чтобы словарь не зависел от случая
+        step = max(1, count // DICTIONARY_SAMPLES)
+        samples = [json.dumps(self.decode(data)).encode() for index, (data,) in
+                   enumerate(self.execute("SELECT data FROM records ORDER BY rowid")) if index % step == 0]
+        dictionary = self.codec.train(samples)
+        if len(dictionary) == 0:
+            return False
+        cursor = self.execute("INSERT INTO dictionaries (codec, data) VALUES (?, ?)", (self.codec.name, dictionary))
+        self.dictionaryId = cursor.lastrowid
+        self.dictionaries[self.dictionaryId] = dictionary
+
+        # Записи пересжимаются порциями, вся база в памяти не держится
+        last = 0
+        while True:
+            rows = self.execute("SELECT rowid, data FROM records WHERE rowid > ? ORDER BY rowid LIMIT 256",
+                                (last,)).fetchall()
+            if len(rows) == 0:
+                break
+            for rowid, data in rows:
+                self.execute("UPDATE records SET data = ? WHERE rowid = ?", (self.encode(self.decode(data)), rowid))
+            last = rows[-1][0]
+        return True
+
+    def getKind(self, name: str) -> Optional[str]:
+        row = self.execute("SELECT kind FROM collections WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def exists(self, name: str) -> bool:
+        return self.getKind(name) is not None
+
+    def create(self, name: str, kind: str):
+        self.rem(name)
+        self.execute("INSERT INTO collections (name, kind) VALUES (?, ?)", (name, kind))
+
+    def dcreate(self, name: str):
+        self.create(name, "dict")
+        return True
+
+    def lcreate(self, name: str):
+        self.create(name, "list")
+        return True
+
+    def get(self, name: str):
+        kind = self.getKind(name)
+        if kind is None:
+            return False
+        if kind == "list":
+            return [self.decode(data) for data, in
+                    self.execute("SELECT data FROM records WHERE collection = ? ORDER BY rowid", (name,))]
+        return SQLiteCollection(self, name)
+
+    def set(self, name: str, value):
+        if isinstance(value, list):
+            self.lcreate(name)
+            for item in value:
+                self.ladd(name, item)
+        else:
+            self.dcreate(name)
+            for key, item in value.items():
+                self.dadd(name, (key, item))
+        return True
+
+    def rem(self, name: str):
+        self.execute("DELETE FROM records WHERE collection = ?", (name,))
+        self.execute("DELETE FROM collections WHERE name = ?", (name,))
+        return True
+
+    def deldb(self):
+        self.execute("DELETE FROM records")
+        self.execute("DELETE FROM collections")
+        return True
+
+    def dadd(self, name: str, pair: tuple):
+        key, value = pair
+        columns = getIndexedColumns(key, value)
+        # UPSERT сохраняет rowid, и перезаписанный ключ остаётся на своём месте, как в dict
+        self.execute("""
+            INSERT INTO records (collection, key, data, filePath, package) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (collection, key) DO UPDATE
+            SET data = excluded.data, filePath = excluded.filePath, package = excluded.package
+        """, (name, key, self.encode(value), columns["filePath"], columns["package"]))
+        return True
+
+    def dget(self, name: str, key: str):
+        return SQLiteCollection(self, name)[key]
+
+    def dgetall(self, name: str):
+        return SQLiteCollection(self, name)
+
+    def dexists(self, name: str, key: str) -> bool:
+        return key in SQLiteCollection(self, name)
+
+    def dpop(self, name: str, key: str):
+        value = self.dget(name, key)
+        self.execute("DELETE FROM records WHERE collection = ? AND key = ?", (name, key))
+        return value
+
+    def ladd(self, name: str, value):
+        count = self.execute("SELECT COUNT(*) FROM records WHERE collection = ?", (name,)).fetchone()[0]
+        self.execute("INSERT INTO records (collection, key, data) VALUES (?, ?, ?)",
+                     (name, str(count), self.encode(value)))
+        return True
+
+    def dcolumns(self, name: str) -> Iterator[Tuple[str, Dict[str, Optional[str]]]]:
+        # Индексируемые колонки записей без чтения самих данных
+        for row in self.execute(f"SELECT key, {', '.join(INDEXED_COLUMNS)} FROM records WHERE collection = ? "
+                                f"ORDER BY rowid", (name,)):
+            yield row[0], dict(zip(INDEXED_COLUMNS, row[1:]))
@@ -0,0 +1,62 @@
+from typing import Dict, List, Tuple
+
+
+class StoreIndex:
+    """Secondary indexes of the database records, updated on every write.
+
+    Every record has a list of (column, value) pairs, e.g. the file path of a graph or the package
+    of a class, and the index maps (collection, column, value) to the keys of the records.
+    The keys of an entry are kept in the order of the records in the database,
+    like the results of the full-collection scans that the indexes replace.
+    """
+
+    def __init__(self):
+        self.nextPosition = 0
+        # (коллекция, ключ) -> (позиция записи в базе, элементы индекса с этой записью)
+        self.records: Dict[Tuple[str, str], Tuple[int, List[tuple]]] = dict()
+        # (коллекция, колонка, значение) -> {ключ: позиция}
+        self.entries: Dict[tuple, Dict[str, int]] = dict()
+
+    def add(self, collection: str, key: str, columns: List[Tuple[str, str]]):
+        entries = [(collection, column, value) for column, value in columns]
+        record = self.records.get((collection, key))
+        if record is None:
+            # Новый ключ записывается в конец коллекции
+            position = self.nextPosition
+            self.nextPosition += 1
+        else:
+            # Перезаписанный ключ остаётся на своём месте
+            position = record[0]
+            for entry in record[1]:
+                if entry not in entries:
+                    self.removeEntry(entry, key)
+        self.records[(collection, key)] = (position, entries)
+
+        for entry in entries:
+            keys = self.entries.setdefault(entry, dict())
+            if key in keys:
+                continue
+            outOfOrder = len(keys) != 0 and next(reversed(keys.values())) > position
+            keys[key] = position
+            if outOfOrder:
+                self.entries[entry] = dict(sorted(keys.items(), key=lambda item: item[1]))
+
+    def remove(self, collection: str, key: str):
+        record = self.records.pop((collection, key), None)
+        if record is not None:
+            for entry in record[1]:
+                self.removeEntry(entry, key)
+
+    def removeEntry(self, entry: tuple, key: str):
+        keys = self.entries.get(entry)
+        if keys is not None:
+            keys.pop(key, None)
+            if len(keys) == 0:
+                del self.entries[entry]
+
+    def clear(self, collection: str):
+        for recordCollection, key in [record for record in self.records if record[0] == collection]:
+            self.remove(recordCollection, key)
+
+    def getKeys(self, collection: str, column: str, value: str) -> List[str]:
+        return list(self.entries.get((collection, column, value), dict()).keys())
@@ -1,24 +1,36 @@
+import gc
 import json
 import os
 import sys
+import tempfile
+import time
+import tracemalloc
 
 from ASTBuilder import ASTBuilder
 from CFGBuilder import CFGBuilder
 from DFGBuilder import DFGBuilder
 from GremlinDriver import Gremlin
+from GremlinExport import writeGremlinExport
 from gremlin_python.process.graph_traversal import __
 from JavaClassExtractor import JavaClassExtractor
+from NodeIdentity import TokenRangeError
+from MappedGraphStore import writeMappedStore
 from OrientDBDriver import OrientDB
+from PipelineBuilder import PipelineBuilder
+from RecordCodec import RecordCodec
+from SQLiteStore import SQLiteStore
 from TaintFlow.SinksManager import SinksManager
 from TaintFlow.SourcesManager import SourcesManager
 from TaintFlow.utils import checkDFReachability, deleteDuplicateTaintFlows
 from config import Config
-from db import Database, DBCollections
+from db import Database, DBCollections, NODE_INDEX_LAYERS, STREAMED_COLLECTIONS
+from utils import findJavaFiles
 from web.app import runWebApp
 
 
 def runJClassesExtracting(projectConfig):
     db = Database(projectConfig)
+    db.registerFiles(findJavaFiles(projectConfig["target-dir"]))
     db.clear(DBCollections.JavaClasses)
     print("Obtaining Java classes info...")
     for dirname, dirnames, filenames in os.walk(projectConfig["target-dir"]):
@@ -38,6 +50,7 @@ def runJClassesExtracting(projectConfig):
 
 def runASTBuilding(projectConfig):
     db = Database(projectConfig)
+    db.registerFiles(findJavaFiles(projectConfig["target-dir"]))
     db.clear(DBCollections.ASTs)
     print("Building graphs...")
     for dirname, dirnames, filenames in os.walk(projectConfig["target-dir"]):
@@ -48,7 +61,11 @@ def runASTBuilding(projectConfig):
             print("Handling: " + filePath)
             print("Building AST...")
             astBuilder = ASTBuilder(projectConfig)
-            astBuilder.build(filePath)
+            try:
+                astBuilder.build(filePath)
+            except TokenRangeError as e:
+                print(f"Skipped: {e}")
+                continue
             astBuilder.dump()
             ast = astBuilder.getAST()
             packageName = ast.getProperty("package")
@@ -62,6 +79,7 @@ def runASTBuilding(projectConfig):
 
 def runCFGBuilding(projectConfig):
     db = Database(projectConfig)
+    db.registerFiles(findJavaFiles(projectConfig["target-dir"]))
     db.clear(DBCollections.CFGs)
     print("Building graphs...")
     for dirname, dirnames, filenames in os.walk(projectConfig["target-dir"]):
@@ -72,7 +90,11 @@ def runCFGBuilding(projectConfig):
             print("Handling: " + filePath)
             print("Building CFGs...")
             cfgBuilder = CFGBuilder(projectConfig)
-            cfgBuilder.build(filePath)
+            try:
+                cfgBuilder.build(filePath)
+            except TokenRangeError as e:
+                print(f"Skipped: {e}")
+                continue
             cfgBuilder.dump()
             cfgs = cfgBuilder.getCFGs()
             for qn, CFG in cfgs.items():
@@ -85,6 +107,7 @@ def runCFGBuilding(projectConfig):
 
 def runDFGBuilding(projectConfig):
     db = Database(projectConfig)
+    db.registerFiles(findJavaFiles(projectConfig["target-dir"]))
     db.clear(DBCollections.DFGs)
     print("Building graphs...")
     for dirname, dirnames, filenames in os.walk(projectConfig["target-dir"]):
@@ -107,6 +130,9 @@ def runDFGBuilding(projectConfig):
             dfgs = dfgBuilder.getDFGs()
             for qn, DFG in dfgs.items():
                 DFG.exportNew(filename=qn)
+            ast.linkFlowNodes({node.globalId for cfg in cfgs.values() for node in cfg.nodes},
+                              {node.globalId for dfg in dfgs.values() for node in dfg.nodes})
+            db.putAST(db.getNamesByFilePath(DBCollections.ASTs, filePath)[0], ast)
     dfgs = db.getAllDFGs()
     DFGBuilder.addIPDataFlows(dfgs, projectConfig)
     print("Done")
@@ -115,10 +141,50 @@ def runDFGBuilding(projectConfig):
     OrientDB(projectConfig).populateDFGs()
 
 
-def runTaintFlowAnalysis(projectConfig):
+def runPipelineBuilding(projectConfig, jobs=1, full=False):
+    db = Database(projectConfig)
+    # Без записей о файлах предыдущего запуска изменения определить нельзя
+    if full or len(db.getAllFileRecords()) == 0:
+        db.clear(DBCollections.JavaClasses)
+        db.clear(DBCollections.ASTs)
+        db.clear(DBCollections.CFGs)
+        db.clear(DBCollections.DFGs)
+        db.clear(DBCollections.Files)
+        db.clear(DBCollections.FileIndexes)
+    print("Building graphs...")
+    pipeline = PipelineBuilder(projectConfig, jobs)
+    pipeline.build(findJavaFiles(projectConfig["target-dir"]))
+    pipeline.linkDFGs()
+    pipeline.linkFlowNodes()
+    pipeline.storeFileRecords()
+    print("Done")
+    print("Dumping database...")
+    db.commit()
+    pipeline.complete()
+    if projectConfig.get("mapped-store"):
+        print("Writing mapped graph store...")
+        writeMappedStore(db, projectConfig["mapped-store"])
+    OrientDB(projectConfig).populate(full)
+    return pipeline.getTaintAffectedFiles()
+
+
+def runTaintFlowAnalysis(projectConfig, affectedFiles=None):
     astSources = SourcesManager(projectConfig).getSources()
     astSinks = SinksManager(projectConfig).getSinks()
 
+    db = Database(projectConfig)
+    taintFlows = []
+    if affectedFiles is not None:
+        # Потоки из источников в незатронутых файлах не изменились
+        taintFlows = [tf for tf in db.getAllTaintFlows() if tf["source"].getFile() not in affectedFiles]
+        # Файл узла AST - имя AST (пакет и имя файла), а не путь: путь берётся из записи файла.
+        # Источник из файла без записи пересчитывается
+        filePaths = {record["astName"]: filePath for filePath, record in db.getAllFileRecords().items()}
+        astSources = [astSource for astSource in astSources
+                      if filePaths.get(astSource.getFile()) in affectedFiles or astSource.getFile() not in filePaths]
+        db.setAllTaintFlows(taintFlows)
+        db.commit()
+
     print(f"Found {len(astSources)} sources")
     if len(astSources) == 0:
         return
@@ -128,10 +194,8 @@ def runTaintFlowAnalysis(projectConfig):
         return
 
     gremlin = Gremlin(projectConfig)
-    db = Database(projectConfig)
     db.clear(DBCollections.TaintFlows)
 
-    taintFlows = []
     for astSink in astSinks:
         print(astSink.getOptionalProperty("sinkText") + " in file " + astSink.getFile() + " at line " + str(
             astSink.getLineOfCode()) + " (sharedId: " + astSink.getSharedId() + ")")
@@ -181,9 +245,73 @@ def runCallgraphAnalysis(projectConfig):
     db.commit()
 
 
+def runMemoryBenchmark(projectConfig):
+    db = Database(projectConfig)
+    for layer, getAllGraphs in (("AST", db.getAllASTs), ("CFG", db.getAllCFGs), ("DFG", db.getAllDFGs)):
+        for frozen in (False, True):
+            gc.collect()
+            tracemalloc.start()
+            graphs = getAllGraphs(frozen=frozen)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            nodes = sum(graph.size() for graph in graphs.values())
+            del graphs
+            print(f"{layer}{' (frozen)' if frozen else ''}: {nodes} nodes, {size} bytes, "
+                  f"{size // max(nodes, 1)} bytes per node")
+
+
+def runStorageBenchmark(projectConfig):
+    # Копии базы в SQLite без сжатия и с каждым доступным сжатием: размер, запись, чтение всех графов
+    # и чтение отдельных графов
+    db = Database(projectConfig)
+    print(f"Source database: {os.path.getsize(projectConfig['DB'])} bytes")
+    compressions = [None, "zlib"]
+    try:
+        RecordCodec("zstd")
+        compressions.append("zstd")
+    except ValueError as e:
+        print(f"zstd is skipped: {e}")
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for compression in compressions:
+            path = os.path.join(tmpDir, f"{compression or 'none'}.db")
+            start = time.perf_counter()
+            store = SQLiteStore(path, compression)
+            for collection in STREAMED_COLLECTIONS:
+                store.dcreate(collection)
+                for key, data in db.iterSerialized(collection):
+                    store.dadd(collection, (key, data))
+            store.dump()
+            store.close()
+            writeTime = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = SQLiteStore(path, compression)
+            keys = []
+            for collection in NODE_INDEX_LAYERS:
+                for key, data in store.dgetall(collection).items():
+                    keys.append((collection, key))
+            loadTime = time.perf_counter() - start
+
+            sample = keys[::max(1, len(keys) // 200)]
+            start = time.perf_counter()
+            for collection, key in sample:
+                store.dget(collection, key)
+            readTime = (time.perf_counter() - start) / max(len(sample), 1)
+            store.close()
+
+            print(f"{compression or 'none'}: {os.path.getsize(path)} bytes, write {writeTime:.2f} s, "
+                  f"load {len(keys)} graphs {loadTime:.2f} s, {readTime * 1000:.2f} ms per graph")
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python %s <command> [options]" % sys.argv[0])
+        print("       python %s run-static all [--jobs N] [--full]" % sys.argv[0])
+        print("       python %s benchmark memory|storage" % sys.argv[0])
+        print("       python %s db export|import|map <file>" % sys.argv[0])
+        print("       python %s db gremlin graphson|graphml|csv <path>" % sys.argv[0])
+        print("       python %s orientdb schema" % sys.argv[0])
         return
 
     command = sys.argv[1]
@@ -213,12 +341,13 @@ def main():
             projectConfig = json.load(f)
 
         subcommand = sys.argv[2]
+        jobs = 1
+        if "--jobs" in sys.argv:
+            jobs = int(sys.argv[sys.argv.index("--jobs") + 1])
+
         if subcommand == "all":
-            runJClassesExtracting(projectConfig)
-            runASTBuilding(projectConfig)
-            runCFGBuilding(projectConfig)
-            runDFGBuilding(projectConfig)
-            runTaintFlowAnalysis(projectConfig)
+            affectedFiles = runPipelineBuilding(projectConfig, jobs, "--full" in sys.argv)
+            runTaintFlowAnalysis(projectConfig, affectedFiles)
             runCallgraphAnalysis(projectConfig)
         elif subcommand == "classes":
             runJClassesExtracting(projectConfig)
@@ -233,6 +362,47 @@ def main():
         elif subcommand == "callgraph":
             runCallgraphAnalysis(projectConfig)
 
+        stats = Database(projectConfig).getGraphCacheStats()
+        print(f"Graph cache: {stats['hits']} hits, {stats['misses']} misses")
+
+    elif command == "benchmark":
+        with open(Config.PROJECT_CONFIG_FILENAME) as f:
+            projectConfig = json.load(f)
+
+        if len(sys.argv) > 2 and sys.argv[2] == "memory":
+            runMemoryBenchmark(projectConfig)
+        elif len(sys.argv) > 2 and sys.argv[2] == "storage":
+            runStorageBenchmark(projectConfig)
+
+    elif command == "db":
+        with open(Config.PROJECT_CONFIG_FILENAME) as f:
+            projectConfig = json.load(f)
+
+        if len(sys.argv) < 4:
+            print("Usage: python %s db export|import|map <file>" % sys.argv[0])
+            return
+
+        db = Database(projectConfig)
+        if sys.argv[2] == "export":
+            db.exportGraphs(sys.argv[3])
+        elif sys.argv[2] == "import":
+            db.importGraphs(sys.argv[3])
+            db.commit()
+        elif sys.argv[2] == "map":
+            writeMappedStore(db, sys.argv[3])
+        elif sys.argv[2] == "gremlin":
+            if len(sys.argv) < 5:
+                print("Usage: python %s db gremlin graphson|graphml|csv <path>" % sys.argv[0])
+                return
+            writeGremlinExport(db, sys.argv[4], sys.argv[3])
+
+    elif command == "orientdb":
+        with open(Config.PROJECT_CONFIG_FILENAME) as f:
+            projectConfig = json.load(f)
+
+        if len(sys.argv) > 2 and sys.argv[2] == "schema":
+            OrientDB(projectConfig).explainQueries()
+
     elif command == "web":
         with open(Config.PROJECT_CONFIG_FILENAME) as f:
             projectConfig = json.load(f)
@@ -9,5 +9,20 @@ class Config:
     CFG_PLOTS_DIR = os.path.join(PLOTS_DIR, "CFG")
     DFG_PLOTS_DIR = os.path.join(PLOTS_DIR, "DFG")
 
+    # Меняется при любом изменении анализатора, которое влияет на строящиеся графы:
+    # записи кэша сборки с другой версией не используются
+    ANALYZER_VERSION = "8"
+    # Версия формата сериализованных графов (schemas.GraphSchema), графы другой версии не загружаются
+    GRAPH_FORMAT_VERSION = 3
+    BUILD_CACHE_DIR = "cache"
+    BUILD_CACHE_SIZE_MB = 1024
+    # Последовательный запуск держит деревья разбора до шага DFG, чтобы не разбирать файлы дважды
+    # (False - файлы разбираются заново, зато в памяти не остаются деревья всего проекта)
+    KEEP_PARSE_TREES = True
+    # Число загруженных графов, которые Database держит в памяти (0 - без кэша)
+    GRAPH_CACHE_SIZE = 256
+    # Число вершин или рёбер в одном скрипте (транзакции) загрузки в OrientDB
+    ORIENTDB_BATCH_SIZE = 500
+
     VIEW_DATA_FILE = "viewData.json"
     ROUTE_DATA_FILE = "routeData.json"
@@ -1,10 +1,17 @@
 import os
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
 
 import pickledb
 from pymongo import MongoClient
 
+import NodeIdentity
+from NodeIdentity import parseSharedId
 from JavaStructures import JavaClass, JavaMethod
+from ResolutionIndex import ResolutionIndex
+from GraphCache import GraphCache
+from GraphStream import GraphReader, GraphWriter
+from SQLiteStore import SQLiteStore, getIndexedColumns
+from StoreIndex import StoreIndex
 from config import Config
 from graphs.ast.ASNode import ASNode
 from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
@@ -12,6 +19,7 @@ from graphs.cfg.CFNode import CFNode
 from graphs.cfg.ControlFlowGraph import ControlFlowGraph
 from graphs.ddg.DFNode import DFNode
 from graphs.ddg.DataFlowGraph import DataFlowGraph
+from graphs.digraph import Digraph, Node
 from schemas import ControlFlowGraphSchema, DataFlowGraphSchema, AbstractSyntaxTreeSchema, JavaClassSchema, \
     JavaMethodSchema, TaintFlowSchema
 
@@ -23,6 +31,61 @@ class DBCollections:
     JavaClasses = "javaClasses"
     TaintFlows = "taintFlows"
     CallGraph = "callGraph"
+    Files = "files"
+    FileIndexes = "fileIndexes"
+    NodeIndex = "nodeIndex"
+
+
+# Слои, узлы которых попадают в индекс globalId
+NODE_INDEX_LAYERS = (DBCollections.ASTs, DBCollections.CFGs, DBCollections.DFGs)
+# Коллекции, которые выгружаются в поток графов; индекс узлов при загрузке строится заново
+STREAMED_COLLECTIONS = (DBCollections.FileIndexes, DBCollections.Files, DBCollections.JavaClasses,
+                        DBCollections.ASTs, DBCollections.CFGs, DBCollections.DFGs, DBCollections.CallGraph)
+
+
+# Коллекции, по записям которых ведутся вторичные индексы (StoreIndex)
+INDEXED_COLLECTIONS = (DBCollections.ASTs, DBCollections.CFGs, DBCollections.DFGs, DBCollections.JavaClasses)
+
+
+def getIndexedNodeIds(data: Optional[dict]) -> Dict[int, int]:
+    # globalId -> Id первого узла сериализованного графа с ним
+    nodeIds = dict()
+    if data is not None:
+        for node in data["nodes"]:
+            if node["globalId"] is not None:
+                nodeIds.setdefault(node["globalId"], node["Id"])
+    return nodeIds
+
+
+def getIndexEntries(collection: str, key: str, columns: Dict[str, Optional[str]]) -> List[Tuple[str, str]]:
+    # Графы индексируются по пути к файлу, классы - по пакету и простому имени
+    if collection == DBCollections.JavaClasses:
+        entries = [("name", key.split(".")[-1])]
+        if columns["package"] is not None:
+            entries.append(("package", columns["package"]))
+        return entries
+    return [("filePath", columns["filePath"])] if columns["filePath"] is not None else []
+
+
+class PickleStore(pickledb.PickleDB):
+    # Весь документ в памяти, индексируемые колонки вычисляются по записям
+    def dcolumns(self, name: str) -> Iterator[Tuple[str, Dict[str, Optional[str]]]]:
+        for key, data in self.dgetall(name).items():
+            yield key, getIndexedColumns(key, data)
+
+
+def openStore(projectConfig):
+    # Хранилище выбирается в config.json: "db-backend": "pickledb" (по умолчанию) или "sqlite",
+    # записи SQLite сжимаются, если задано "db-compression": "zlib" или "zstd"
+    backend = projectConfig.get("db-backend", "pickledb")
+    compression = projectConfig.get("db-compression")
+    if backend == "sqlite":
+        return SQLiteStore(projectConfig["DB"], compression)
+    if backend == "pickledb":
+        if compression is not None:
+            raise ValueError("Compression of the database needs the sqlite backend")
+        return PickleStore(projectConfig["DB"], False, True)
+    raise ValueError(f"Unknown database backend: {backend}")
 
 
 class DatabaseMeta(type):
@@ -37,13 +100,24 @@ class DatabaseMeta(type):
 class Database(metaclass=DatabaseMeta):
     def __init__(self, projectConfig):
         self.projectConfig = projectConfig
-        self.db = pickledb.load(self.projectConfig["DB"], False)
+        self.db = openStore(self.projectConfig)
+        # Индекс разрешения имён строится по классам базы при первом обращении и сбрасывается при их изменении
+        self.resolutionIndex = None
+        # Индекс узлов обновляется при каждой записи графа и строится заново целиком,
+        # только если его нет или слой очищен
+        self.nodeIndexDirty = not self.db.exists(DBCollections.NodeIndex)
+        # Загруженные AST, CFG и DFG по имени, повторное обращение не десериализует граф заново
+        self.graphCache = GraphCache(int(projectConfig.get("graph-cache-size", Config.GRAPH_CACHE_SIZE)))
+        # Вторичные индексы строятся по колонкам записей при первом обращении и обновляются при записи
+        self.storeIndex = None
         self.checkStructure()
 
     def commit(self):
         if not os.path.exists(self.projectConfig["DB"]):
             open(self.projectConfig["DB"], "tw").close()
 
+        if self.nodeIndexDirty:
+            self.buildNodeIndex()
         self.db.dump()
 
     def checkStructure(self):
@@ -59,113 +133,227 @@ class Database(metaclass=DatabaseMeta):
             self.db.lcreate(DBCollections.TaintFlows)
         if not self.db.exists(DBCollections.CallGraph):
             self.db.dcreate(DBCollections.CallGraph)
+        if not self.db.exists(DBCollections.Files):
+            self.db.dcreate(DBCollections.Files)
+        if not self.db.exists(DBCollections.FileIndexes):
+            self.db.dcreate(DBCollections.FileIndexes)
+        if not self.db.exists(DBCollections.NodeIndex):
+            self.db.dcreate(DBCollections.NodeIndex)
 
     def clear(self, dbName=None):
         if dbName is None:
             self.db.deldb()
         else:
             self.db.rem(dbName)
+        if dbName is None or dbName == DBCollections.JavaClasses:
+            self.resolutionIndex = None
+        if dbName is None or dbName in NODE_INDEX_LAYERS:
+            self.nodeIndexDirty = True
+        if dbName is None or dbName == DBCollections.FileIndexes:
+            NodeIdentity.setFileIndexes(dict())
+        if dbName is None:
+            self.graphCache.clear()
+            self.storeIndex = None
+        else:
+            self.graphCache.invalidate(dbName)
+            if self.storeIndex is not None:
+                self.storeIndex.clear(dbName)
         self.checkStructure()
 
+    # Stores a graph or a class that is already serialized with its schema, e.g. by a worker process
+    def putSerialized(self, collection: str, key: str, data: dict):
+        if collection == DBCollections.JavaClasses:
+            self.resolutionIndex = None
+        if collection in NODE_INDEX_LAYERS:
+            self.updateNodeIndex(collection, key, data)
+            self.graphCache.invalidate(collection, key)
+        self.indexRecord(collection, key, data)
+        self.db.dadd(collection, (key, data))
+
+    def getSerialized(self, collection: str, key: str) -> dict:
+        if not self.db.dexists(collection, key):
+            return None
+        return self.db.dget(collection, key)
+
+    def getAllSerialized(self, collection: str) -> dict:
+        return dict(self.db.dgetall(collection).items())
+
+    def iterSerialized(self, collection: str) -> Iterator[Tuple[str, dict]]:
+        # Записи по одной, без копии всей коллекции
+        return iter(self.db.dgetall(collection).items())
+
+    def getKeys(self, collection: str) -> List[str]:
+        return list(self.db.dgetall(collection))
+
+    def loadGraph(self, collection: str, key: str, schemaClass) -> Optional[Digraph]:
+        graph = self.graphCache.get(collection, key)
+        if graph is None:
+            if not self.db.dexists(collection, key):
+                return None
+            graph = schemaClass().load(self.db.dget(collection, key))
+            self.graphCache.put(collection, key, graph)
+        return graph
+
+    def getGraphCacheStats(self) -> Dict[str, int]:
+        return self.graphCache.getStats()
+
+    def getStoreIndex(self) -> StoreIndex:
+        if self.storeIndex is None:
+            index = StoreIndex()
+            for collection in INDEXED_COLLECTIONS:
+                for key, columns in self.db.dcolumns(collection):
+                    index.add(collection, key, getIndexEntries(collection, key, columns))
+            self.storeIndex = index
+        return self.storeIndex
+
+    def indexRecord(self, collection: str, key: str, data: dict):
+        if self.storeIndex is not None and collection in INDEXED_COLLECTIONS:
+            self.storeIndex.add(collection, key, getIndexEntries(collection, key, getIndexedColumns(key, data)))
+
+    def getNamesByFilePath(self, collection: str, filePath: str) -> List[str]:
+        # Имена AST, CFG или DFG файла в порядке базы
+        return self.getStoreIndex().getKeys(collection, "filePath", filePath)
+
+    def getClassQNsByPackage(self, package: str) -> List[str]:
+        return self.getStoreIndex().getKeys(DBCollections.JavaClasses, "package", package)
+
+    def getClassQNsByName(self, name: str) -> List[str]:
+        return self.getStoreIndex().getKeys(DBCollections.JavaClasses, "name", name)
+
+    def remove(self, collection: str, key: str):
+        if self.db.dexists(collection, key):
+            if collection == DBCollections.JavaClasses:
+                self.resolutionIndex = None
+            if collection in NODE_INDEX_LAYERS:
+                self.updateNodeIndex(collection, key, None)
+                self.graphCache.invalidate(collection, key)
+            if self.storeIndex is not None:
+                self.storeIndex.remove(collection, key)
+            self.db.dpop(collection, key)
+
+    # Records of analyzed files: content hash, built graphs and dependencies for incremental runs
+    def putFileRecord(self, filePath: str, record: dict):
+        self.db.dadd(DBCollections.Files, (filePath, record))
+
+    def getFileRecord(self, filePath: str) -> dict:
+        return self.getSerialized(DBCollections.Files, filePath)
+
+    def getAllFileRecords(self) -> Dict[str, dict]:
+        return dict(self.db.dgetall(DBCollections.Files).items())
+
+    def registerFiles(self, filePaths: List[str]) -> Dict[str, int]:
+        # Индексы файлов входят в глобальные идентификаторы узлов, реестр хранится в базе
+        indexes = NodeIdentity.assignFileIndexes(self.getFileIndexes(), filePaths)
+        for filePath, index in indexes.items():
+            self.db.dadd(DBCollections.FileIndexes, (filePath, index))
+        NodeIdentity.setFileIndexes(indexes)
+        return indexes
+
+    def getFileIndexes(self) -> Dict[str, int]:
+        return dict(self.db.dgetall(DBCollections.FileIndexes))
+
     def putAST(self, filename: str, ast: AbstractSyntaxTree):
-        self.db.dadd(DBCollections.ASTs, (filename, AbstractSyntaxTreeSchema().dump(ast)))
+        self.graphCache.invalidate(DBCollections.ASTs, filename)
+        data = AbstractSyntaxTreeSchema().dump(ast)
+        self.updateNodeIndex(DBCollections.ASTs, filename, data)
+        self.indexRecord(DBCollections.ASTs, filename, data)
+        self.db.dadd(DBCollections.ASTs, (filename, data))
 
     def getAST(self, qualifiedName: str) -> AbstractSyntaxTree:
-        schema = AbstractSyntaxTreeSchema()
-        return schema.load(self.db.dget(DBCollections.ASTs, qualifiedName))
+        return self.loadGraph(DBCollections.ASTs, qualifiedName, AbstractSyntaxTreeSchema)
 
     def getASTByFilePath(self, filePath: str) -> AbstractSyntaxTree:
-        for pkg, AST in self.db.dgetall(DBCollections.ASTs).items():
-            if AST["properties"]["filePath"] == filePath:
-                return AbstractSyntaxTreeSchema().load(AST)
+        for name in self.getNamesByFilePath(DBCollections.ASTs, filePath):
+            return self.getAST(name)
 
-    def getAllASTs(self) -> Dict[str, AbstractSyntaxTree]:
+    def getAllASTs(self, frozen: bool = False) -> Dict[str, AbstractSyntaxTree]:
         schema = AbstractSyntaxTreeSchema()
         ASTs = self.db.get(DBCollections.ASTs)
         results = dict()
         for filename, AST in ASTs.items():
-            results[filename] = schema.load(AST)
+            graph = schema.load(AST)
+            # Замороженный граф занимает в разы меньше памяти, но только для чтения
+            results[filename] = graph.freeze() if frozen else graph
         return results
 
     def putCFG(self, qualifiedName: str, cfg: ControlFlowGraph):
-        self.db.dadd(DBCollections.CFGs, (qualifiedName, ControlFlowGraphSchema().dump(cfg)))
+        self.graphCache.invalidate(DBCollections.CFGs, qualifiedName)
+        data = ControlFlowGraphSchema().dump(cfg)
+        self.updateNodeIndex(DBCollections.CFGs, qualifiedName, data)
+        self.indexRecord(DBCollections.CFGs, qualifiedName, data)
+        self.db.dadd(DBCollections.CFGs, (qualifiedName, data))
 
     def getCFG(self, qualifiedName: str) -> ControlFlowGraph:
-        if not self.db.dexists(DBCollections.CFGs, qualifiedName):
-            return None
+        return self.loadGraph(DBCollections.CFGs, qualifiedName, ControlFlowGraphSchema)
 
-        CFG = self.db.dget(DBCollections.CFGs, qualifiedName)
-        if CFG is not None:
-            return ControlFlowGraphSchema().load(CFG)
-        return None
-
-    def getAllCFGs(self) -> Dict[str, ControlFlowGraph]:
+    def getAllCFGs(self, frozen: bool = False) -> Dict[str, ControlFlowGraph]:
         schema = ControlFlowGraphSchema()
         CFGs = self.db.get(DBCollections.CFGs)
         results = dict()
         for qn, CFG in CFGs.items():
-            results[qn] = schema.load(CFG)
+            graph = schema.load(CFG)
+            results[qn] = graph.freeze() if frozen else graph
         return results
 
     def getCFGsByFilePath(self, filePath: str) -> Dict[str, ControlFlowGraph]:
-        schema = ControlFlowGraphSchema()
-        results = dict()
-        for qn, CFG in self.db.dgetall(DBCollections.CFGs).items():
-            if CFG["properties"]["filePath"] == filePath:
-                results[qn] = schema.load(CFG)
-        return results
+        return {qn: self.getCFG(qn) for qn in self.getNamesByFilePath(DBCollections.CFGs, filePath)}
 
     def putDFG(self, qualifiedName: str, dfg: DataFlowGraph):
-        self.db.dadd(DBCollections.DFGs, (qualifiedName, DataFlowGraphSchema().dump(dfg)))
+        self.graphCache.invalidate(DBCollections.DFGs, qualifiedName)
+        data = DataFlowGraphSchema().dump(dfg)
+        self.updateNodeIndex(DBCollections.DFGs, qualifiedName, data)
+        self.indexRecord(DBCollections.DFGs, qualifiedName, data)
+        self.db.dadd(DBCollections.DFGs, (qualifiedName, data))
 
     def getDFG(self, qualifiedName: str) -> DataFlowGraph:
-        DFG = self.db.dget(DBCollections.DFGs, qualifiedName)
-        if DFG is not None:
-            return DataFlowGraphSchema().load(DFG)
-        return None
+        return self.loadGraph(DBCollections.DFGs, qualifiedName, DataFlowGraphSchema)
 
-    def getAllDFGs(self) -> Dict[str, DataFlowGraph]:
+    def getAllDFGs(self, frozen: bool = False) -> Dict[str, DataFlowGraph]:
         schema = DataFlowGraphSchema()
         DFGs = self.db.get(DBCollections.DFGs)
         results = dict()
         for qn, DFG in DFGs.items():
-            results[qn] = schema.load(DFG)
+            graph = schema.load(DFG)
+            results[qn] = graph.freeze() if frozen else graph
         return results
 
     def putJavaClass(self, qualifiedName: str, javaClass: JavaClass):
-        self.db.dadd(DBCollections.JavaClasses, (qualifiedName, JavaClassSchema().dump(javaClass)))
+        self.resolutionIndex = None
+        data = JavaClassSchema().dump(javaClass)
+        self.indexRecord(DBCollections.JavaClasses, qualifiedName, data)
+        self.db.dadd(DBCollections.JavaClasses, (qualifiedName, data))
+
+    def getResolutionIndex(self) -> ResolutionIndex:
+        if self.resolutionIndex is None:
+            schema = JavaClassSchema()
+            javaClasses = dict()
+            for qn, jc in self.db.get(DBCollections.JavaClasses).items():
+                javaClasses[qn] = schema.load(jc)
+            self.resolutionIndex = ResolutionIndex(javaClasses)
+        return self.resolutionIndex
 
     def getJavaClass(self, qualifiedName: str) -> JavaClass:
-        javaClass = self.db.dget(DBCollections.JavaClasses, qualifiedName)
-        if javaClass is not None:
-            return JavaClassSchema().load(javaClass)
+        return self.getResolutionIndex().getJavaClass(qualifiedName)
 
     def getJavaClassByName(self, name: str) -> JavaClass:
-        for jc in self.db.get(DBCollections.JavaClasses):
-            if jc["properties"]["name"] == name:
-                return JavaClassSchema().load(jc)
-
-        return None
+        qualifiedNames = self.getClassQNsByName(name)
+        if len(qualifiedNames) == 0:
+            return None
+        return self.getJavaClass(qualifiedNames[0])
 
     def getAllJavaClasses(self) -> Dict[str, JavaClass]:
-        schema = JavaClassSchema()
-        results = dict()
-        for qn, jc in self.db.get(DBCollections.JavaClasses).items():
-            results[qn] = schema.load(jc)
-        return results
+        return dict(self.getResolutionIndex().getAllJavaClasses())
 
-    def getAllMethods(self) -> Dict[str, JavaMethod]:
+    def getAllMethods(self) -> Dict[str, List[JavaMethod]]:
+        # Qualified method name -> overloads
         methods = dict()
-        for jc in self.getAllJavaClasses():
+        for qn, jc in self.getAllJavaClasses().items():
             for mtd in jc.methods:
-                methods[mtd.name] = mtd
+                methods.setdefault(f"{qn}.{mtd.name}", []).append(mtd)
         return methods
 
-    def getMethod(self, qualifiedClassName: str, methodName: str):
-        cls = self.getJavaClass(qualifiedClassName)
-        for method in cls.methods:
-            if method.name == methodName:
-                return method
+    def getMethod(self, qualifiedClassName: str, methodName: str, arity: int = None) -> JavaMethod:
+        return self.getResolutionIndex().getMethod(qualifiedClassName, methodName, arity)
 
     def getAllTaintFlows(self):
         schema = TaintFlowSchema()
@@ -189,26 +377,87 @@ class Database(metaclass=DatabaseMeta):
     def getCallees(self, methodQN):
         return self.db.dget(DBCollections.CallGraph, methodQN)
 
-    def getASTNodeBySharedId(self, sharedId: str) -> ASNode:
-        for AST in self.getAllASTs().values():
-            for node in AST.nodes:
-                if node.getSharedId() == sharedId:
-                    return node
+    def buildNodeIndex(self):
+        # globalId -> {слой: [[имя графа, Id узла], ...]} по сериализованным графам, без их загрузки,
+        # одна запись на globalId. Графы слоя перечислены в порядке базы, поиск берёт первый
+        index = dict()
+        for collection in NODE_INDEX_LAYERS:
+            for name, graph in self.db.dgetall(collection).items():
+                for globalId, nodeId in getIndexedNodeIds(graph).items():
+                    index.setdefault(str(globalId), dict()).setdefault(collection, []).append([name, nodeId])
+        self.db.set(DBCollections.NodeIndex, index)
+        self.nodeIndexDirty = False
+
+    def updateNodeIndex(self, collection: str, name: str, data: Optional[dict]):
+        # Вызывается до записи графа (data) или его удаления (None): меняются только записи
+        # globalId прежней и новой версии графа. Новый граф встаёт в конец, как в базе
+        if self.nodeIndexDirty:
+            return
+        oldNodeIds = getIndexedNodeIds(self.getSerialized(collection, name))
+        newNodeIds = getIndexedNodeIds(data)
+        index = self.db.dgetall(DBCollections.NodeIndex)
+        for globalId in oldNodeIds.keys() | newNodeIds.keys():
+            key = str(globalId)
+            entry = index.get(key) or dict()
+            locations = [location for location in entry.get(collection, []) if location[0] != name]
+            if globalId in newNodeIds:
+                position = next((i for i, location in enumerate(entry.get(collection, []))
+                                 if location[0] == name), len(locations))
+                locations.insert(position, [name, newNodeIds[globalId]])
+            if len(locations) != 0:
+                entry[collection] = locations
+            else:
+                entry.pop(collection, None)
+            if len(entry) != 0:
+                self.db.dadd(DBCollections.NodeIndex, (key, entry))
+            elif key in index:
+                self.db.dpop(DBCollections.NodeIndex, key)
+
+    def getNodeLocations(self, globalId: int) -> Dict[str, list]:
+        # Положение узла во всех слоях: {DBCollections.ASTs: [имя графа, Id узла], ...}
+        if self.nodeIndexDirty:
+            self.buildNodeIndex()
+        entry = self.db.dgetall(DBCollections.NodeIndex).get(str(globalId)) or dict()
+        return {collection: locations[0] for collection, locations in entry.items()}
+
+    def getIndexedNode(self, collection: str, globalId: int) -> Tuple[Optional[Digraph], Optional[Node]]:
+        location = self.getNodeLocations(globalId).get(collection)
+        if location is None:
+            return None, None
+        name, nodeId = location
+        if collection == DBCollections.ASTs:
+            graph = self.getAST(name)
+        elif collection == DBCollections.CFGs:
+            graph = self.getCFG(name)
+        else:
+            graph = self.getDFG(name)
+        return graph, graph.getNodeById(nodeId)
+
+    def exportGraphs(self, path: str):
+        # Записи пишутся по одной, без загрузки графов
+        with open(path, "wb") as f:
+            writer = GraphWriter(f)
+            for collection in STREAMED_COLLECTIONS:
+                for key, data in self.db.dgetall(collection).items():
+                    writer.write(collection, key, data)
+            for index, taintFlow in enumerate(self.db.get(DBCollections.TaintFlows)):
+                writer.write(DBCollections.TaintFlows, str(index), taintFlow)
+
+    def importGraphs(self, path: str):
+        self.clear()
+        with open(path, "rb") as f:
+            for collection, key, data in GraphReader(f):
+                if collection == DBCollections.TaintFlows:
+                    self.db.ladd(DBCollections.TaintFlows, data)
+                else:
+                    self.putSerialized(collection, key, data)
+        NodeIdentity.setFileIndexes(self.getFileIndexes())
 
-        return None
+    def getASTNodeBySharedId(self, sharedId: str) -> ASNode:
+        return self.getIndexedNode(DBCollections.ASTs, parseSharedId(sharedId))[1]
 
     def getCFGNodeBySharedId(self, sharedId: str) -> CFNode:
-        for CFG in self.getAllCFGs().values():
-            for node in CFG.nodes:
-                if node.getSharedId() == sharedId:
-                    return node
-
-        return None
+        return self.getIndexedNode(DBCollections.CFGs, parseSharedId(sharedId))[1]
 
     def getDFGNodeBySharedId(self, sharedId: str) -> DFNode:
-        for DFG in self.getAllDFGs().values():
-            for node in DFG.nodes:
-                if node.getSharedId() == sharedId:
-                    return node
-
-        return None
+        return self.getIndexedNode(DBCollections.DFGs, parseSharedId(sharedId))[1]
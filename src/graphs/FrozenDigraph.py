@@ -0,0 +1,302 @@
+import copy
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional
+
+from NodeIdentity import parseSharedId
+from graphs.digraph import Digraph, Edge, Node
+
+
+class FrozenAdjacency(Mapping):
+    """Read-only `inEdges`/`outEdges` view of a frozen graph: node Id -> list of edges."""
+
+    def __init__(self, graph: "FrozenDigraph", offsets: array, edgeIds: array):
+        self.graph = graph
+        self.offsets = offsets
+        self.edgeIds = edgeIds
+
+    def __getitem__(self, nodeId: int) -> List[Edge]:
+        index = self.graph.getIndex(nodeId)
+        if index is None:
+            raise KeyError(nodeId)
+        return [self.graph.getEdge(e) for e in self.edgeIds[self.offsets[index]:self.offsets[index + 1]]]
+
+    def __iter__(self):
+        return iter(self.graph.nodeIds[:self.graph.nodeCount])
+
+    def __len__(self):
+        return self.graph.nodeCount
+
+
+class FrozenDigraph:
+    """Compact read-only form of a finished `Digraph`, see `Digraph.freeze()`.
+
+    Node attributes are kept in parallel arrays with the strings, kinds and labels interned
+    in a single table of values, the edges in an edge table with two compressed sparse row
+    indexes over it, one by source and one by target. Attributes without their own column
+    are stored only when they are not empty. Endpoints of edges that lead out of the graph
+    (e.g. inter-procedural data flows) are kept as extra rows after the nodes of the graph.
+
+    The traversal helpers return node and edge objects of the original classes, they are
+    created on every call, so they compare by value but never by identity.
+    """
+
+    # Атрибуты узлов и рёбер, хранимые в отдельных массивах
+    NODE_COLUMNS = ("Id", "kind", "line", "code", "globalId", "file", "method")
+    EDGE_COLUMNS = ("source", "label", "target", "kind")
+
+    def __init__(self, graph: Digraph):
+        self.graphType = type(graph)
+        self.properties = getattr(graph, "properties", None)
+        self.values: List[Any] = []
+        self.valueIds: Dict[Any, int] = dict()
+        # Класс узла или ребра -> имена его атрибутов и их пустые значения
+        self.layouts: Dict[type, tuple] = dict()
+        self.empties: Dict[type, Dict[str, Any]] = dict()
+
+        self.nodeCount = len(graph.nodes)
+        self.nodeTypes = array("i")
+        self.nodeIds = array("q")
+        self.kinds = array("i")
+        self.lines = array("i")
+        self.codes = array("i")
+        # Глобальные идентификаторы, -1 у узлов без него
+        self.globalIds = array("q")
+        self.files = array("i")
+        self.methods = array("i")
+        self.nodeExtras: Dict[int, Dict[str, Any]] = dict()
+        # globalId -> последний узел с ним, как в Digraph.getNodeByGlobalId
+        self.nodesByGlobalId: Dict[int, int] = dict()
+
+        self.edgeTypes = array("i")
+        self.edgeSources = array("i")
+        self.edgeTargets = array("i")
+        self.edgeLabels = array("i")
+        self.edgeKinds = array("i")
+        self.edgeExtras: Dict[int, Dict[str, Any]] = dict()
+
+        for node in graph.nodes:
+            self.addNode(node)
+        for index in range(self.nodeCount):
+            self.nodesByGlobalId[self.globalIds[index]] = index
+
+        foreignNodes: Dict[int, int] = dict()
+        inIndexed = []
+        for edge in graph.allEdges:
+            self.addEdge(edge, graph, foreignNodes)
+            inIndexed.append(graph.isInEdge(edge))
+
+        self.outOffsets, self.outEdgeIds = self.buildIndex(self.edgeSources, [True] * len(inIndexed))
+        self.inOffsets, self.inEdgeIds = self.buildIndex(self.edgeTargets, inIndexed)
+        self.outEdges = FrozenAdjacency(self, self.outOffsets, self.outEdgeIds)
+        self.inEdges = FrozenAdjacency(self, self.inOffsets, self.inEdgeIds)
+
+    def intern(self, value) -> int:
+        valueId = self.valueIds.get(value)
+        if valueId is None:
+            valueId = len(self.values)
+            self.values.append(value)
+            self.valueIds[value] = valueId
+        return valueId
+
+    @staticmethod
+    def getAttributeNames(obj) -> tuple:
+        cls = type(obj)
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name in getattr(klass, "__slots__", ()):
+                # Слот, скрытый за свойством, читается и пишется через свойство
+                public = name[1:] if name.startswith("_") else name
+                names.append(public if isinstance(getattr(cls, public, None), property) else name)
+        if hasattr(obj, "__dict__"):
+            names.extend(vars(obj))
+        return tuple(names)
+
+    def addLayout(self, obj, columns: tuple) -> Optional[Dict[str, Any]]:
+        cls = type(obj)
+        if cls not in self.layouts:
+            self.layouts[cls] = FrozenDigraph.getAttributeNames(obj)
+            self.empties[cls] = dict()
+
+        extras = None
+        empties = self.empties[cls]
+        for name in self.layouts[cls]:
+            if name in columns:
+                continue
+            value = getattr(obj, name)
+            if not value:
+                empty = empties.setdefault(name, value)
+                if type(empty) is type(value) and empty == value:
+                    continue
+            if extras is None:
+                extras = dict()
+            extras[name] = copy.copy(value)
+        return extras
+
+    def addNode(self, node: Node) -> int:
+        index = len(self.nodeIds)
+        extras = self.addLayout(node, FrozenDigraph.NODE_COLUMNS)
+        if extras is not None:
+            self.nodeExtras[index] = extras
+        self.nodeTypes.append(self.intern(type(node)))
+        self.nodeIds.append(node.Id)
+        self.kinds.append(self.intern(getattr(node, "kind", None)))
+        self.lines.append(getattr(node, "line", 0))
+        self.codes.append(self.intern(getattr(node, "code", None)))
+        globalId = getattr(node, "globalId", None)
+        self.globalIds.append(-1 if globalId is None else globalId)
+        self.files.append(self.intern(getattr(node, "file", None)))
+        self.methods.append(self.intern(getattr(node, "method", None)))
+        return index
+
+    def getEndpoint(self, node: Optional[Node], graph: Digraph, foreignNodes: Dict[int, int]) -> int:
+        if node is None:
+            return -1
+        # У загруженного графа концы рёбер - копии узлов, поэтому сравнение по значению
+        local = graph.getNodeById(node.Id)
+        if local is node or (local is not None and local == node):
+            return self.getIndex(node.Id)
+        index = foreignNodes.get(id(node))
+        if index is None:
+            index = self.addNode(node)
+            foreignNodes[id(node)] = index
+        return index
+
+    def addEdge(self, edge, graph: Digraph, foreignNodes: Dict[int, int]):
+        index = len(self.edgeSources)
+        extras = self.addLayout(edge, FrozenDigraph.EDGE_COLUMNS)
+        if extras is not None:
+            self.edgeExtras[index] = extras
+        self.edgeTypes.append(self.intern(type(edge)))
+        self.edgeSources.append(self.getEndpoint(edge.source, graph, foreignNodes))
+        self.edgeTargets.append(self.getEndpoint(edge.target, graph, foreignNodes))
+        self.edgeLabels.append(self.intern(edge.label))
+        self.edgeKinds.append(self.intern(getattr(edge, "kind", None)))
+
+    def buildIndex(self, endpoints: array, indexed: List[bool]):
+        # Сортировка подсчётом сохраняет порядок рёбер каждого узла
+        offsets = array("i", [0] * (self.nodeCount + 1))
+        for edgeId, endpoint in enumerate(endpoints):
+            if indexed[edgeId] and 0 <= endpoint < self.nodeCount:
+                offsets[endpoint + 1] += 1
+        for index in range(self.nodeCount):
+            offsets[index + 1] += offsets[index]
+
+        edgeIds = array("i", [0] * offsets[self.nodeCount])
+        positions = array("i", offsets[:self.nodeCount])
+        for edgeId, endpoint in enumerate(endpoints):
+            if indexed[edgeId] and 0 <= endpoint < self.nodeCount:
+                edgeIds[positions[endpoint]] = edgeId
+                positions[endpoint] += 1
+        return offsets, edgeIds
+
+    def getIndex(self, nodeId: int) -> Optional[int]:
+        index = bisect_left(self.nodeIds, nodeId, 0, self.nodeCount)
+        if index < self.nodeCount and self.nodeIds[index] == nodeId:
+            return index
+        return None
+
+    def restore(self, cls: type, columns: Dict[str, Any], extras: Optional[Dict[str, Any]]):
+        obj = cls.__new__(cls)
+        empties = self.empties[cls]
+        for name in self.layouts[cls]:
+            if name in columns:
+                value = columns[name]
+            elif extras is not None and name in extras:
+                value = copy.copy(extras[name])
+            else:
+                value = copy.copy(empties[name])
+            setattr(obj, name, value)
+        return obj
+
+    def getNode(self, index: int) -> Optional[Node]:
+        if index < 0:
+            return None
+        values = self.values
+        columns = {
+            "Id": self.nodeIds[index],
+            "kind": values[self.kinds[index]],
+            "line": self.lines[index],
+            "code": values[self.codes[index]],
+            "globalId": self.globalIds[index] if self.globalIds[index] >= 0 else None,
+            "file": values[self.files[index]],
+            "method": values[self.methods[index]],
+        }
+        return self.restore(values[self.nodeTypes[index]], columns, self.nodeExtras.get(index))
+
+    def getEdge(self, edgeId: int, nodes: List[Node] = None):
+        getNode = self.getNode if nodes is None else nodes.__getitem__
+        values = self.values
+        source, target = self.edgeSources[edgeId], self.edgeTargets[edgeId]
+        columns = {
+            "source": getNode(source) if source >= 0 else None,
+            "label": values[self.edgeLabels[edgeId]],
+            "target": getNode(target) if target >= 0 else None,
+            "kind": values[self.edgeKinds[edgeId]],
+        }
+        return self.restore(values[self.edgeTypes[edgeId]], columns, self.edgeExtras.get(edgeId))
+
+    @property
+    def nodes(self) -> List[Node]:
+        return [self.getNode(index) for index in range(self.nodeCount)]
+
+    @property
+    def allEdges(self) -> List[Edge]:
+        return [self.getEdge(edgeId) for edgeId in range(len(self.edgeSources))]
+
+    def getNodeById(self, nodeId: int) -> Optional[Node]:
+        index = self.getIndex(nodeId)
+        return self.getNode(index) if index is not None else None
+
+    def getNodeByGlobalId(self, globalId: int) -> Optional[Node]:
+        index = self.nodesByGlobalId.get(-1 if globalId is None else globalId)
+        return self.getNode(index) if index is not None else None
+
+    def getNodeBySharedId(self, sharedId: str) -> Optional[Node]:
+        return self.getNodeByGlobalId(parseSharedId(sharedId))
+
+    def getNodesByKind(self, kind) -> List[Node]:
+        valueId = self.valueIds.get(kind)
+        if valueId is None:
+            return []
+        return [self.getNode(index) for index in range(self.nodeCount) if self.kinds[index] == valueId]
+
+    def outNodes(self, n: Node) -> List[Node]:
+        index = self.getIndex(n.Id)
+        return [self.getNode(self.edgeTargets[e]) for e in self.outEdgeIds[self.outOffsets[index]:self.outOffsets[index + 1]]]
+
+    def inNodes(self, n: Node) -> List[Node]:
+        index = self.getIndex(n.Id)
+        return [self.getNode(self.edgeSources[e]) for e in self.inEdgeIds[self.inOffsets[index]:self.inOffsets[index + 1]]]
+
+    def getOutDegree(self, v: Node) -> int:
+        index = self.getIndex(v.Id)
+        return self.outOffsets[index + 1] - self.outOffsets[index]
+
+    def getInDegree(self, v: Node) -> int:
+        index = self.getIndex(v.Id)
+        return self.inOffsets[index + 1] - self.inOffsets[index]
+
+    def size(self) -> int:
+        return self.nodeCount
+
+    def edgeCount(self) -> int:
+        return len(self.edgeSources)
+
+    def thaw(self) -> Digraph:
+        # Граф собирается как в схемах: узлы и рёбра присваиваются напрямую
+        nodes = [self.getNode(index) for index in range(len(self.nodeIds))]
+        edges = [self.getEdge(edgeId, nodes) for edgeId in range(len(self.edgeSources))]
+        graph = self.graphType()
+        graph.nodes = nodes[:self.nodeCount]
+        graph.allEdges = edges
+        graph.inEdges = dict()
+        graph.outEdges = dict()
+        for index, node in enumerate(graph.nodes):
+            graph.outEdges[node.Id] = [edges[e] for e in self.outEdgeIds[self.outOffsets[index]:self.outOffsets[index + 1]]]
+            graph.inEdges[node.Id] = [edges[e] for e in self.inEdgeIds[self.inOffsets[index]:self.inOffsets[index + 1]]]
+        graph.reindex()
+        if self.properties is not None:
+            graph.properties = self.properties
+        return graph
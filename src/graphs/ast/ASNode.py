@@ -4,7 +4,8 @@ from typing import Dict, Any
 from antlr4 import ParserRuleContext
 from antlr4.tree.Tree import TerminalNodeImpl
 
-from graphs.digraph import Node
+from NodeIdentity import formatSharedId, getGlobalIdByCtx, parseSharedId
+from graphs.digraph import Node, internString
 
 
 class ASNodeKind(Enum):
@@ -70,14 +71,47 @@ class ASNodeKind(Enum):
 
 
 class ASNode(Node):
+    __slots__ = ("kind", "line", "code", "globalId", "file", "cfgGlobalId", "dfgGlobalId", "_optionalProperties")
+
     def __init__(self, kind: ASNodeKind):
         super().__init__()
         self.kind = kind
         self.line = 0
         self.code = ""
-        self.sharedId = None
+        self.globalId: int = None
         self.file = None
-        self.optionalProperties = dict()
+        # Ближайшие узлы CFG и DFG среди самого узла и его предков, см. AbstractSyntaxTree.linkFlowNodes
+        self.cfgGlobalId: int = None
+        self.dfgGlobalId: int = None
+        self._optionalProperties = None
+
+    # Строковый sharedId - производное представление глобального идентификатора
+    @property
+    def sharedId(self) -> str:
+        return formatSharedId(self.globalId)
+
+    @sharedId.setter
+    def sharedId(self, value: str) -> None:
+        self.globalId = parseSharedId(value)
+
+    @property
+    def cfgSharedId(self) -> str:
+        return formatSharedId(self.cfgGlobalId)
+
+    @property
+    def dfgSharedId(self) -> str:
+        return formatSharedId(self.dfgGlobalId)
+
+    # Словарь создаётся при первом обращении и сохраняется в узле, записи в него не теряются
+    @property
+    def optionalProperties(self) -> Dict[str, Any]:
+        if self._optionalProperties is None:
+            self._optionalProperties = dict()
+        return self._optionalProperties
+
+    @optionalProperties.setter
+    def optionalProperties(self, value: Dict[str, Any]) -> None:
+        self._optionalProperties = value if value else None
 
     def getKind(self) -> ASNodeKind:
         return self.kind
@@ -100,24 +134,30 @@ class ASNode(Node):
     def getSharedId(self) -> str:
         return self.sharedId
 
+    def getGlobalId(self) -> int:
+        return self.globalId
+
     def setSharedId(self, ctx: ParserRuleContext) -> None:
-        from utils import getIdByCtx
-        self.sharedId = getIdByCtx(ctx)
+        self.globalId = getGlobalIdByCtx(ctx)
 
     def getFile(self) -> str:
         return self.file
 
     def setFile(self, file: str) -> None:
-        self.file = file
+        self.file = internString(file)
 
     def getOptionalProperties(self) -> Dict[str, Any]:
         return self.optionalProperties
 
     def getOptionalProperty(self, key: str) -> Any:
-        return self.optionalProperties.get(key)
+        if self._optionalProperties is None:
+            return None
+        return self._optionalProperties.get(key)
 
     def setOptionalProperty(self, key: str, value: Any) -> None:
-        self.optionalProperties[key] = value
+        if self._optionalProperties is None:
+            self._optionalProperties = dict()
+        self._optionalProperties[key] = value
 
     def __eq__(self, other):
         if self.Id != other.Id:
@@ -132,7 +172,7 @@ class ASNode(Node):
         if self.code != other.code:
             return False
 
-        if self.sharedId != other.sharedId:
+        if self.globalId != other.globalId:
             return False
 
         if self.file != other.file:
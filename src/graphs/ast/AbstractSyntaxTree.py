@@ -5,9 +5,10 @@ import networkx as nx
 from antlr4 import ParserRuleContext
 from networkx.drawing.nx_pydot import write_dot
 import os.path
-from typing import Optional
+from typing import Optional, Set
 
 from graphs.ast.ASNode import ASNode, ASNodeKind
+from NodeIdentity import getGlobalIdByCtx
 from graphs.digraph import Digraph
 
 from config import Config
@@ -21,22 +22,13 @@ class AbstractSyntaxTree(Digraph):
         self.addVertex(root)
 
     def getRoot(self):
-        return self.nodes[0]
+        return next(iter(self.nodes))
 
     def getNodeByCtx(self, ctx: ParserRuleContext) -> ASNode:
-        from utils import getIdByCtx
-        node = None
-        for n in self.nodes:
-            if n.sharedId == getIdByCtx(ctx):
-                node = n
-        return node
+        return self.getNodeByGlobalId(getGlobalIdByCtx(ctx))
 
     def getNodeByID(self, _id) -> ASNode:
-        node = None
-        for n in self.nodes:
-            if n.sharedId == _id:
-                node = n
-        return node
+        return self.getNodeBySharedId(_id)
 
     def getParentOf(self, node: ASNode) -> Optional[ASNode]:
         inEdges = list(self.inEdges.get(node.Id))
@@ -45,6 +37,25 @@ class AbstractSyntaxTree(Digraph):
         else:
             return None  # node is a root
 
+    def linkFlowNodes(self, cfgGlobalIds: Set[int], dfgGlobalIds: Set[int]) -> bool:
+        """Sets cfgGlobalId and dfgGlobalId of every node to the nearest of the node and its ancestors
+        that is a node of a CFG or a DFG of the file. Returns whether any node was changed."""
+        changed = False
+        stack = [(root, None, None) for root in self.nodes if len(self.inEdges[root.Id]) == 0]
+        while len(stack) != 0:
+            node, cfgGlobalId, dfgGlobalId = stack.pop()
+            # У служебных узлов (входа и выхода CFG) globalId нет
+            if node.globalId is not None and node.globalId in cfgGlobalIds:
+                cfgGlobalId = node.globalId
+            if node.globalId is not None and node.globalId in dfgGlobalIds:
+                dfgGlobalId = node.globalId
+            if node.cfgGlobalId != cfgGlobalId or node.dfgGlobalId != dfgGlobalId:
+                node.cfgGlobalId = cfgGlobalId
+                node.dfgGlobalId = dfgGlobalId
+                changed = True
+            stack.extend((edge.target, cfgGlobalId, dfgGlobalId) for edge in self.outEdges[node.Id])
+        return changed
+
     def toNx(self):
         from utils import escapeForHtml
         G = nx.DiGraph()
@@ -120,7 +131,7 @@ class AbstractSyntaxTree(Digraph):
         nx.write_graphml(G, os.path.join(Config.AST_GRAPHML_DIR, f"ast-{filename}.xml"))
 
     def getAllNodesByKind(self, kind: ASNodeKind):
-        return [n for n in self.nodes if n.kind == kind]
+        return self.getNodesByKind(kind)
 
     def putDotTogether(self, rightNode: ASNode) -> str:
         from utils import Stack
@@ -3,7 +3,8 @@ from typing import Dict, Any
 
 from antlr4 import ParserRuleContext
 
-from graphs.digraph import Node
+from NodeIdentity import formatSharedId, getGlobalIdByCtx, parseSharedId
+from graphs.digraph import Node, internString
 
 
 class CFNodeKind(Enum):
@@ -40,15 +41,37 @@ class CFNodeKind(Enum):
 
 
 class CFNode(Node):
+    __slots__ = ("kind", "line", "code", "globalId", "method", "file", "_optionalProperties")
+
     def __init__(self, kind: CFNodeKind):
         super().__init__()
         self.kind = kind
         self.line = 0
         self.code = ""
-        self.sharedId = None
+        self.globalId: int = None
         self.method = None
         self.file = None
-        self.optionalProperties = dict()
+        self._optionalProperties = None
+
+    # Строковый sharedId - производное представление глобального идентификатора
+    @property
+    def sharedId(self) -> str:
+        return formatSharedId(self.globalId)
+
+    @sharedId.setter
+    def sharedId(self, value: str) -> None:
+        self.globalId = parseSharedId(value)
+
+    # Словарь создаётся при первом обращении и сохраняется в узле, записи в него не теряются
+    @property
+    def optionalProperties(self) -> Dict[str, Any]:
+        if self._optionalProperties is None:
+            self._optionalProperties = dict()
+        return self._optionalProperties
+
+    @optionalProperties.setter
+    def optionalProperties(self, value: Dict[str, Any]) -> None:
+        self._optionalProperties = value if value else None
 
     def getKind(self) -> CFNodeKind:
         return self.kind
@@ -71,30 +94,36 @@ class CFNode(Node):
     def getSharedId(self) -> str:
         return self.sharedId
 
+    def getGlobalId(self) -> int:
+        return self.globalId
+
     def setSharedId(self, ctx: ParserRuleContext) -> None:
-        from utils import getIdByCtx
-        self.sharedId = getIdByCtx(ctx)
+        self.globalId = getGlobalIdByCtx(ctx)
 
     def getMethod(self) -> str:
         return self.method
 
     def setMethod(self, method: str) -> None:
-        self.method = method
+        self.method = internString(method)
 
     def getFile(self) -> str:
         return self.file
 
     def setFile(self, file: str) -> None:
-        self.file = file
+        self.file = internString(file)
 
     def getOptionalProperties(self) -> Dict[str, Any]:
         return self.optionalProperties
 
     def setOptionalProperty(self, key: str, value) -> None:
-        self.optionalProperties[key] = value
+        if self._optionalProperties is None:
+            self._optionalProperties = dict()
+        self._optionalProperties[key] = value
 
     def getOptionalProperty(self, key):
-        return self.optionalProperties.get(key)
+        if self._optionalProperties is None:
+            return None
+        return self._optionalProperties.get(key)
 
     def __eq__(self, other):
         if self.Id != other.Id:
@@ -109,7 +138,7 @@ class CFNode(Node):
         if self.code != other.code:
             return False
 
-        if self.sharedId != other.sharedId:
+        if self.globalId != other.globalId:
             return False
 
         if self.method != other.method:
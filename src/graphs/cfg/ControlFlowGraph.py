@@ -9,6 +9,7 @@ import os.path
 from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
 from graphs.cfg.CFNode import CFNodeKind, CFNode
 
+from NodeIdentity import getGlobalIdByCtx
 from graphs.digraph import Digraph
 from config import Config
 
@@ -26,25 +27,16 @@ class ControlFlowGraph(Digraph):
         self.properties[prop] = value
 
     def getEntry(self):
-        return self.nodes[0]
+        return next(iter(self.nodes))
 
     def attachAST(self, ast: AbstractSyntaxTree):
         self.ast = ast
 
     def getNodeByCtx(self, ctx: ParserRuleContext) -> CFNode:
-        from utils import getIdByCtx
-        node = None
-        for n in self.nodes:
-            if n.sharedId == getIdByCtx(ctx):
-                node = n
-        return node
-
-    def getNodeByID(self, _id):
-        node = None
-        for n in self.nodes:
-            if n.sharedId == _id:
-                node = n
-        return node
+        return self.getNodeByGlobalId(getGlobalIdByCtx(ctx))
+
+    def getNodeByID(self, _id) -> CFNode:
+        return self.getNodeBySharedId(_id)
 
     def toNx(self):
         from utils import escapeForHtml
@@ -118,7 +110,7 @@ class ControlFlowGraph(Digraph):
 
 
     def getAllNodesByKind(self, kind: CFNodeKind):
-        return [n for n in self.nodes if n.kind == kind]
+        return self.getNodesByKind(kind)
 
     def getMethodsToCFG(self):
         from graphs.cfg.CFPathTraversal import CFPathTraversal
@@ -145,18 +137,18 @@ class ControlFlowGraph(Digraph):
         return methodsToCFG
 
     def __eq__(self, other):
-        if len(self.nodes) != len(other.nodes):
+        if self.size() != other.size():
             return False
 
-        for i in range(len(self.nodes)):
-            if self.nodes[i] != other.nodes[i]:
+        for node, otherNode in zip(self.nodes, other.nodes):
+            if node != otherNode:
                 return False
 
-        if len(self.allEdges) != len(other.allEdges):
+        if self.edgeCount() != other.edgeCount():
             return False
 
-        for i in range(len(self.allEdges)):
-            if self.allEdges[i] != other.allEdges[i]:
+        for e, otherEdge in zip(self.allEdges, other.allEdges):
+            if e != otherEdge:
                 return False
         
         if self.inEdges.keys() != other.inEdges.keys():
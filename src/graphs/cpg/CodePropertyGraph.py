@@ -1,7 +1,7 @@
 from copy import copy
 from typing import Set, Dict
 
-from db import Database
+from db import Database, DBCollections
 from graphs.ast.ASNode import ASNodeKind
 from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
 from graphs.cfg.CFEdge import CFEdge
@@ -40,19 +40,18 @@ class CodePropertyGraph:
         return results
 
     def findDataFlowParent(self, call: Call):
-        for dfg in Database().getAllDFGs().values():
-            current = call.AST.getNodeByID(call.sharedId)
-            while True:
-                if len(call.AST.inEdges[current.Id]) == 0:
-                    break
-
-                # AST is not a multigraph, therefore self.ast.inEdges[current] set length is always 1 or 0 (root)
-                parent = list(call.AST.inEdges[current.Id])[0].source
-                if dfg.getNodeByID(parent.sharedId):
-                    return dfg.getNodeByID(parent.sharedId), dfg
-                current = parent
-
-        return None, None
+        db = Database()
+        current = call.AST.getNodeByID(call.sharedId)
+        # AST is not a multigraph, therefore self.ast.inEdges[current] set length is always 1 or 0 (root)
+        if len(call.AST.inEdges[current.Id]) == 0:
+            return None, None
+
+        # Ближайший узел DFG среди предков найден при сборке, DFG с ним - по индексу узлов
+        parent = list(call.AST.inEdges[current.Id])[0].source
+        if parent.dfgGlobalId is None:
+            return None, None
+        dfg, dfNode = db.getIndexedNode(DBCollections.DFGs, parent.dfgGlobalId)
+        return dfNode, dfg
 
     def getDataFlowsForSource(self, dataFlowSource: DFNode) -> Set[Edge]:
         for dfg in self.dfgs.values():
@@ -199,8 +198,8 @@ class CodePropertyGraph:
 
         for i in range(1, initialSubgraph.size()):
             for edge in fullCFG.inEdges[i + cfSource.Id]:
-                source = initialSubgraph.nodes[edge.source.Id - cfSource.Id]
-                target = initialSubgraph.nodes[edge.target.Id - cfSource.Id]
+                source = initialSubgraph.getNodeById(edge.source.Id - cfSource.Id + 1)
+                target = initialSubgraph.getNodeById(edge.target.Id - cfSource.Id + 1)
                 newCFEdge = CFEdge(source, edge.label, target)
                 initialSubgraph.addEdge(newCFEdge)
 
@@ -1,23 +1,72 @@
-from typing import List, Set, Any
+from typing import List, FrozenSet, Any, Dict, Iterable
 
 from antlr4 import ParserRuleContext
 
-from graphs.digraph import Node
+from NodeIdentity import formatSharedId, getGlobalIdByCtx, parseSharedId
+from graphs.digraph import Node, internString, internStrings
 
 
 class DFNode(Node):
+    __slots__ = ("line", "code", "globalId", "method", "file", "_DEFs", "_USEs", "_selfFlows", "IP_DEFs",
+                 "_optionalProperties")
+
     def __init__(self):
         super().__init__()
         self.line = 0
         self.code = ""
-        self.sharedId = None
+        self.globalId: int = None
         self.method = None
         self.file = None
-        self.DEFs: Set[str] = set()
-        self.USEs: Set[str] = set()
-        self.selfFlows: Set[str] = set()
+        # Множества переменных неизменяемые, пустое множество общее для всех узлов
+        self._DEFs: FrozenSet[str] = frozenset()
+        self._USEs: FrozenSet[str] = frozenset()
+        self._selfFlows: FrozenSet[str] = frozenset()
         self.IP_DEFs = None
-        self.optionalProperties = dict()
+        self._optionalProperties = None
+
+    # Строковый sharedId - производное представление глобального идентификатора
+    @property
+    def sharedId(self) -> str:
+        return formatSharedId(self.globalId)
+
+    @sharedId.setter
+    def sharedId(self, value: str) -> None:
+        self.globalId = parseSharedId(value)
+
+    @property
+    def DEFs(self) -> FrozenSet[str]:
+        return self._DEFs
+
+    @DEFs.setter
+    def DEFs(self, value: Iterable[str]) -> None:
+        self._DEFs = internStrings(value)
+
+    @property
+    def USEs(self) -> FrozenSet[str]:
+        return self._USEs
+
+    @USEs.setter
+    def USEs(self, value: Iterable[str]) -> None:
+        self._USEs = internStrings(value)
+
+    @property
+    def selfFlows(self) -> FrozenSet[str]:
+        return self._selfFlows
+
+    @selfFlows.setter
+    def selfFlows(self, value: Iterable[str]) -> None:
+        self._selfFlows = internStrings(value)
+
+    # Словарь создаётся при первом обращении и сохраняется в узле, записи в него не теряются
+    @property
+    def optionalProperties(self) -> Dict[str, Any]:
+        if self._optionalProperties is None:
+            self._optionalProperties = dict()
+        return self._optionalProperties
+
+    @optionalProperties.setter
+    def optionalProperties(self, value: Dict[str, Any]) -> None:
+        self._optionalProperties = value if value else None
 
     def getLineOfCode(self) -> int:
         return self.line
@@ -34,27 +83,29 @@ class DFNode(Node):
     def getSharedId(self):
         return self.sharedId
 
+    def getGlobalId(self) -> int:
+        return self.globalId
+
     def setSharedId(self, ctx: ParserRuleContext):
-        from utils import getIdByCtx
-        self.sharedId = getIdByCtx(ctx)
+        self.globalId = getGlobalIdByCtx(ctx)
 
     def getMethod(self) -> str:
         return self.method
 
     def setMethod(self, method: str) -> None:
-        self.method = method
+        self.method = internString(method)
 
     def getFile(self) -> str:
         return self.file
 
     def setFile(self, file: str) -> None:
-        self.file = file
+        self.file = internString(file)
 
     def addDEF(self, var: str) -> bool:
         if self.hasDEF(var):
             return False
         else:
-            self.DEFs.add(var)
+            self._DEFs = internStrings(self._DEFs | {var})
             return True
 
     def hasDEF(self, var) -> bool:
@@ -67,7 +118,7 @@ class DFNode(Node):
         if self.hasUSE(var):
             return False
         else:
-            self.USEs.add(var)
+            self._USEs = internStrings(self._USEs | {var})
             return True
 
     def hasUSE(self, var: str) -> bool:
@@ -80,7 +131,7 @@ class DFNode(Node):
         if self.hasSelfFlow(var):
             return False
         else:
-            self.selfFlows.add(var)
+            self._selfFlows = internStrings(self._selfFlows | {var})
             return True
 
     def hasSelfFlow(self, var: str) -> bool:
@@ -96,10 +147,14 @@ class DFNode(Node):
         return self.optionalProperties
 
     def getOptionalProperty(self, key: str) -> Any:
-        return self.optionalProperties.get(key.lower())
+        if self._optionalProperties is None:
+            return None
+        return self._optionalProperties.get(key.lower())
 
     def setOptionalProperty(self, key: str, value: Any) -> None:
-        self.optionalProperties[key.lower()] = value
+        if self._optionalProperties is None:
+            self._optionalProperties = dict()
+        self._optionalProperties[key.lower()] = value
 
     def __eq__(self, other):
         if self.Id != other.Id:
@@ -111,7 +166,7 @@ class DFNode(Node):
         if self.code != other.code:
             return False
 
-        if self.sharedId != other.sharedId:
+        if self.globalId != other.globalId:
             return False
 
         if self.method != other.method:
@@ -11,6 +11,7 @@ from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
 from graphs.cfg.ControlFlowGraph import ControlFlowGraph
 from graphs.ddg.DFEdge import DFEdgeKind, DFEdge
 from graphs.ddg.DFNode import DFNode
+from NodeIdentity import getGlobalIdByCtx
 from graphs.digraph import Digraph
 from config import Config
 
@@ -23,30 +24,17 @@ class DataFlowGraph(Digraph):
         self.properties = dict()
 
     def getEntry(self):
-        return self.nodes[0]
+        return next(iter(self.nodes))
 
     # Если межпроцедурный поток данных, то в inEdges ничего не добавляем
-    def addEdge(self, e: DFEdge):
-        if e not in self.allEdges:
-            self.allEdges.append(e)
-            if e.kind == DFEdgeKind.INTRA:
-                self.inEdges.get(e.target.Id).append(e)
-            self.outEdges.get(e.source.Id).append(e)
+    def isInEdge(self, e: DFEdge) -> bool:
+        return e.kind == DFEdgeKind.INTRA
 
     def getNodeByCtx(self, ctx: ParserRuleContext) -> DFNode:
-        from utils import getIdByCtx
-        node = None
-        for n in self.nodes:
-            if n.sharedId == getIdByCtx(ctx):
-                node = n
-        return node
+        return self.getNodeByGlobalId(getGlobalIdByCtx(ctx))
 
     def getNodeByID(self, _id):
-        node = None
-        for n in self.nodes:
-            if n.sharedId == _id:
-                node = n
-        return node
+        return self.getNodeBySharedId(_id)
 
     def attachCFG(self, cfg: ControlFlowGraph) -> None:
         self.cfg = cfg
@@ -93,8 +81,8 @@ class DataFlowGraph(Digraph):
             # Отображать межпроцедурные потоки данных пока не надо
             if edge.kind == DFEdgeKind.INTER:
                 continue
-            source = self.cfg.getNodeByID(edge.source.sharedId)
-            target = self.cfg.getNodeByID(edge.target.sharedId)
+            source = self.cfg.getNodeByGlobalId(edge.source.globalId)
+            target = self.cfg.getNodeByGlobalId(edge.target.globalId)
             G.add_edge(source.Id, target.Id, label=edge.label, color="#239da8", fontcolor="#239da8")
 
         return G
@@ -139,8 +127,8 @@ class DataFlowGraph(Digraph):
             # Отображать межпроцедурные потоки данных пока не надо
             if edge.kind == DFEdgeKind.INTER:
                 continue
-            source = self.cfg.getNodeByID(edge.source.sharedId)
-            target = self.cfg.getNodeByID(edge.target.sharedId)
+            source = self.cfg.getNodeByGlobalId(edge.source.globalId)
+            target = self.cfg.getNodeByGlobalId(edge.target.globalId)
             dot.edge(str(source.Id), str(target.Id), label=edge.label, color="#239da8", fontcolor="#239da8")
         dot.render(directory=Config.DFG_PLOTS_DIR, filename=f"dfg-{filename}")
 
@@ -0,0 +1,134 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+from graphs.cfg.CFNode import CFNode
+from graphs.cfg.ControlFlowGraph import ControlFlowGraph
+from graphs.ddg.DFNode import DFNode
+from graphs.ddg.DataFlowGraph import DataFlowGraph
+
+
+class ReachingDefinitions:
+    """Reaching definitions over the CFG of a method, solved by a worklist in reverse post-order.
+
+    A definition is a pair of a CFG node and a variable that its DFG node DEFs. Sets of definitions
+    are bit vectors in Python integers, with the bits of every variable interned in a mask,
+    so a node kills all definitions of its variables with a single operation.
+    Only nodes reachable from the entry are analyzed.
+    """
+
+    def __init__(self, cfg: ControlFlowGraph, dfg: DataFlowGraph):
+        self.cfg = cfg
+        self.dfg = dfg
+        # Для CFG-узла берётся последний DFG-узел с тем же globalId, как в DataFlowGraph.getNodeByID
+        self.dfNodes: Dict[int, DFNode] = {node.getGlobalId(): node for node in dfg.nodes}
+        self.order: List[CFNode] = self.getReversePostOrder()
+        self.varIds: Dict[str, int] = dict()
+        self.varDefs: List[int] = []
+        # def bit -> (CFG node, variable)
+        self.defs: List[Tuple[CFNode, str]] = []
+        self.gen: Dict[int, int] = dict()
+        self.kill: Dict[int, int] = dict()
+        self.IN: Dict[int, int] = dict()
+        self.OUT: Dict[int, int] = dict()
+
+    def getDFNode(self, cfNode: CFNode) -> DFNode:
+        return self.dfNodes.get(cfNode.getGlobalId())
+
+    def getReversePostOrder(self) -> List[CFNode]:
+        entry = self.cfg.getEntry()
+        visited = {entry.Id}
+        postOrder = []
+        stack = [(entry, iter(self.cfg.outEdges[entry.Id]))]
+        while len(stack) != 0:
+            node, edges = stack[-1]
+            for edge in edges:
+                if edge.target.Id not in visited:
+                    visited.add(edge.target.Id)
+                    stack.append((edge.target, iter(self.cfg.outEdges[edge.target.Id])))
+                    break
+            else:
+                stack.pop()
+                postOrder.append(node)
+        postOrder.reverse()
+        return postOrder
+
+    def getVarId(self, var: str) -> int:
+        varId = self.varIds.get(var)
+        if varId is None:
+            varId = len(self.varDefs)
+            self.varIds[var] = varId
+            self.varDefs.append(0)
+        return varId
+
+    def initSets(self):
+        for cfNode in self.order:
+            dfNode = self.getDFNode(cfNode)
+            gen = 0
+            if dfNode is not None:
+                for var in sorted(dfNode.getAllDEFs()):
+                    bit = 1 << len(self.defs)
+                    self.defs.append((cfNode, var))
+                    self.varDefs[self.getVarId(var)] |= bit
+                    gen |= bit
+            self.gen[cfNode.Id] = gen
+            self.IN[cfNode.Id] = 0
+            self.OUT[cfNode.Id] = gen
+
+        for cfNode in self.order:
+            dfNode = self.getDFNode(cfNode)
+            kill = 0
+            if dfNode is not None:
+                for var in dfNode.getAllDEFs():
+                    kill |= self.varDefs[self.varIds[var]]
+            self.kill[cfNode.Id] = kill & ~self.gen[cfNode.Id]
+
+    def solve(self):
+        self.initSets()
+        preds: Dict[int, List[int]] = {cfNode.Id: [] for cfNode in self.order}
+        for cfNode in self.order:
+            for edge in self.cfg.outEdges[cfNode.Id]:
+                preds[edge.target.Id].append(cfNode.Id)
+
+        worklist = deque(self.order)
+        inWorklist = {cfNode.Id for cfNode in self.order}
+        while len(worklist) != 0:
+            cfNode = worklist.popleft()
+            inWorklist.discard(cfNode.Id)
+            IN = 0
+            for pred in preds[cfNode.Id]:
+                IN |= self.OUT[pred]
+            self.IN[cfNode.Id] = IN
+            OUT = self.gen[cfNode.Id] | (IN & ~self.kill[cfNode.Id])
+            if OUT != self.OUT[cfNode.Id]:
+                self.OUT[cfNode.Id] = OUT
+                for edge in self.cfg.outEdges[cfNode.Id]:
+                    if edge.target.Id not in inWorklist:
+                        inWorklist.add(edge.target.Id)
+                        worklist.append(edge.target)
+
+    def getDefUses(self) -> List[Tuple[DFNode, str, DFNode]]:
+        """(DEF node, variable, USE node) for every definition that reaches a USE of its variable."""
+        defUses = []
+        seen = set()
+        for cfNode in self.order:
+            useNode = self.getDFNode(cfNode)
+            if useNode is None:
+                continue
+            for var in sorted(useNode.getAllUSEs()):
+                varId = self.varIds.get(var)
+                if varId is None:
+                    continue
+                reaching = self.IN[cfNode.Id] & self.varDefs[varId]
+                while reaching != 0:
+                    bit = reaching & -reaching
+                    reaching ^= bit
+                    defCFNode = self.defs[bit.bit_length() - 1][0]
+                    # Определение, вернувшееся по циклу в свой же узел, не даёт ребра
+                    if defCFNode.Id == cfNode.Id:
+                        continue
+                    defNode = self.getDFNode(defCFNode)
+                    key = (id(defNode), var, id(useNode))
+                    if key not in seen:
+                        seen.add(key)
+                        defUses.append((defNode, var, useNode))
+        return defUses
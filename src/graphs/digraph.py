@@ -1,4 +1,24 @@
+import sys
+from typing import Dict, FrozenSet, Iterable, List, ValuesView
+
+from NodeIdentity import parseSharedId
+
+
+def internString(value):
+    # Имена файлов, методов и sharedId повторяются во всех узлах файла, метода и слоя
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def internStrings(values: Iterable[str]) -> FrozenSet[str]:
+    # Интернируются только имена переменных: общая таблица множеств жила бы до конца процесса
+    if not values:
+        return frozenset()
+    return frozenset(internString(value) for value in values)
+
+
 class Node:
+    __slots__ = ("Id",)
+
     def __init__(self):
         self.Id = None
 
@@ -10,43 +30,123 @@ class Edge:
 
 
 class Digraph:
+    """Directed graph with hash indexes over its nodes and edges.
+
+    Edges are kept in an insertion-ordered dict by their dedupe key, nodes are indexed
+    by Id, by global identifier and by kind, so adding, looking up and deduplicating are O(1)
+    and removing a vertex is O(degree). `nodes` and `allEdges` are views over the Id and edge
+    indexes in insertion order, not copies. `inEdges` and `outEdges` keep their dict form,
+    a graph that gets them, `nodes` or `allEdges` assigned directly (e.g. by a schema)
+    has to call `reindex()`.
+    """
+
     def __init__(self):
-        self.nodes = list()
+        # Узлы в порядке добавления, то есть по возрастанию Id
+        self.nodesById: Dict[int, Node] = dict()
         self.entry_node = None
-        self.allEdges = list()
+        self.edges = dict()
         self.inEdges = dict()
         self.outEdges = dict()
+        # globalId -> {Id: node}, при совпадении globalId поиск возвращает последний добавленный узел
+        self.nodesByGlobalId: Dict[int, Dict[int, Node]] = dict()
+        self.nodesByKind: Dict[object, Dict[int, Node]] = dict()
+
+    @property
+    def nodes(self) -> ValuesView[Node]:
+        return self.nodesById.values()
+
+    @nodes.setter
+    def nodes(self, nodes: Iterable[Node]):
+        self.nodesById = {node.Id: node for node in nodes}
+
+    @property
+    def allEdges(self) -> ValuesView[Edge]:
+        # Представление без копирования, граф нельзя менять, пока по нему идёт обход
+        return self.edges.values()
+
+    @allEdges.setter
+    def allEdges(self, edges: List[Edge]):
+        self.edges = dict()
+        for e in edges:
+            self.edges.setdefault(Digraph.getEdgeKey(e), e)
+
+    @staticmethod
+    def getEdgeKey(e):
+        # Рёбра без собственного __eq__ сравнивались по ссылке, CFEdge - по метке и концам
+        if type(e).__eq__ is object.__eq__:
+            return id(e)
+        return e.source.Id, e.label, e.target.Id
+
+    def reindex(self):
+        self.nodesByGlobalId.clear()
+        self.nodesByKind.clear()
+        for node in self.nodes:
+            self.indexNode(node)
+
+    def indexNode(self, node: Node):
+        self.nodesById[node.Id] = node
+        self.nodesByGlobalId.setdefault(getattr(node, "globalId", None), dict())[node.Id] = node
+        self.nodesByKind.setdefault(getattr(node, "kind", None), dict())[node.Id] = node
+
+    def unindexNode(self, node: Node):
+        del self.nodesById[node.Id]
+        for index, key in ((self.nodesByGlobalId, getattr(node, "globalId", None)),
+                           (self.nodesByKind, getattr(node, "kind", None))):
+            bucket = index[key]
+            del bucket[node.Id]
+            if len(bucket) == 0:
+                del index[key]
 
     def addVertex(self, node: Node):
-        node.Id = 1 if self.size() == 0 else (self.nodes[-1].Id + 1)
-        self.nodes.append(node)
+        node.Id = 1 if self.size() == 0 else (next(reversed(self.nodesById)) + 1)
         self.inEdges[node.Id] = list()
         self.outEdges[node.Id] = list()
+        self.indexNode(node)
+
+    def isInEdge(self, e: Edge) -> bool:
+        return True
 
     def addEdge(self, e: Edge):
-        if e not in self.allEdges:
-            self.allEdges.append(e)
-            self.inEdges.get(e.target.Id).append(e)
+        key = Digraph.getEdgeKey(e)
+        if key not in self.edges:
+            self.edges[key] = e
+            if self.isInEdge(e):
+                self.inEdges.get(e.target.Id).append(e)
             self.outEdges.get(e.source.Id).append(e)
 
     def removeVertex(self, nodeId: int):
-        vertex = [v for v in self.nodes if v.Id == nodeId]
-        if len(vertex) > 0:
-            vertex = vertex[0]
-            self.nodes.remove(vertex)
+        vertex = self.nodesById.get(nodeId)
+        if vertex is not None:
+            self.unindexNode(vertex)
+
             inEdges = self.inEdges[nodeId]
             outEdges = self.outEdges[nodeId]
-            # for e in list(set(inEdges) | set(outEdges)):
-            #     self.allEdges.remove(e)
             for e in inEdges:
-                if e in self.allEdges:
-                    self.allEdges.remove(e)
+                self.edges.pop(Digraph.getEdgeKey(e), None)
+                if e.source is not None and e.source.Id != nodeId and e.source.Id in self.outEdges:
+                    self.outEdges[e.source.Id] = [o for o in self.outEdges[e.source.Id] if o is not e]
             for e in outEdges:
-                if e in self.allEdges:
-                    self.allEdges.remove(e)
+                self.edges.pop(Digraph.getEdgeKey(e), None)
+                if e.target is not None and e.target.Id != nodeId and e.target.Id in self.inEdges:
+                    self.inEdges[e.target.Id] = [i for i in self.inEdges[e.target.Id] if i is not e]
             del self.inEdges[nodeId]
             del self.outEdges[nodeId]
 
+    def getNodeById(self, nodeId: int) -> Node:
+        return self.nodesById.get(nodeId)
+
+    def getNodeByGlobalId(self, globalId: int) -> Node:
+        bucket = self.nodesByGlobalId.get(globalId)
+        if not bucket:
+            return None
+        return next(reversed(bucket.values()))
+
+    def getNodeBySharedId(self, sharedId: str) -> Node:
+        return self.getNodeByGlobalId(parseSharedId(sharedId))
+
+    def getNodesByKind(self, kind) -> List[Node]:
+        return list(self.nodesByKind.get(kind, dict()).values())
+
     def outNodes(self, n: Node):
         return [e.target for e in self.outEdges.get(n.Id)]
 
@@ -60,4 +160,11 @@ class Digraph:
         return len(self.inEdges.get(v.Id))
 
     def size(self):
-        return len(self.nodes)
\ No newline at end of file
+        return len(self.nodes)
+
+    def edgeCount(self) -> int:
+        return len(self.edges)
+
+    def freeze(self):
+        from graphs.FrozenDigraph import FrozenDigraph
+        return FrozenDigraph(self)
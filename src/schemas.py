@@ -1,7 +1,11 @@
-from marshmallow import Schema, fields, post_load
+from abc import ABCMeta, abstractmethod
+
+from marshmallow import Schema, ValidationError, fields, post_dump, post_load, pre_load
+from marshmallow.schema import SchemaMeta
 from marshmallow_enum import EnumField
 
 from JavaStructures import JavaField, JavaMethod, JavaClass
+from config import Config
 from graphs.ast.ASEdge import ASEdge
 from graphs.ast.ASNode import ASNodeKind, ASNode
 from graphs.ast.AbstractSyntaxTree import AbstractSyntaxTree
@@ -15,15 +19,114 @@ from graphs.cfg.ControlFlowGraph import ControlFlowGraph
 from graphs.ddg.DFEdge import DFEdge, DFEdgeKind
 from graphs.ddg.DFNode import DFNode
 from graphs.ddg.DataFlowGraph import DataFlowGraph
+from graphs.digraph import Digraph, internString
+
+
+class OrderedSchema(Schema):
+    # Fields are dumped in the order of declaration, so the output doesn't depend on the hash seed of the process
+    class Meta:
+        ordered = True
+
+
+class StringSet(fields.List):
+    # Sets are dumped sorted for the same reason
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        return super()._serialize(sorted(value), attr, obj, **kwargs)
+
+
+class GraphSchemaMeta(SchemaMeta, ABCMeta):
+    # Метакласс схем marshmallow не наследует ABCMeta, абстрактным методам нужны оба
+    pass
+
+
+class GraphSchema(OrderedSchema, metaclass=GraphSchemaMeta):
+    """Graph with every node written once and edges written as references to the nodes.
+
+    An edge is a row [source, label, target] (a DFG edge adds its kind). A reference is the Id
+    of a node of the graph, or -1 - index in externalNodes for an endpoint from another graph,
+    e.g. the target of an inter-procedural flow. Adjacency lists are rebuilt on load by adding
+    the edges in their order, so the loaded graph shares node objects like a built one.
+    """
+    nodeSchema = None
+
+    format = fields.Constant(Config.GRAPH_FORMAT_VERSION)
+    properties = fields.Dict()
+    externalNodes = fields.Raw(load_only=True)
+    edges = fields.Raw(load_only=True)
+
+    @abstractmethod
+    def makeGraph(self) -> Digraph:
+        pass
+
+    def dumpEdge(self, edge, source, target) -> list:
+        return [source, edge.label, target]
+
+    @abstractmethod
+    def loadEdge(self, row, source, target):
+        pass
+
+    @pre_load
+    def checkFormat(self, data, **kwargs):
+        if data.get("format") != Config.GRAPH_FORMAT_VERSION:
+            raise ValidationError(f"Unsupported graph format {data.get('format')} "
+                                  f"(expected {Config.GRAPH_FORMAT_VERSION}), run a full build")
+        return data
+
+    @post_dump(pass_original=True)
+    def dumpEdges(self, data, graph, **kwargs):
+        externalNodes = []
+        externalRefs = dict()
+
+        def getRef(node):
+            if node is None:
+                return None
+            # У графа, загруженного в старом формате, концы рёбер - копии узлов
+            local = graph.getNodeById(node.Id)
+            if local is node or (local is not None and local == node):
+                return node.Id
+            ref = externalRefs.get(id(node))
+            if ref is None:
+                ref = -1 - len(externalNodes)
+                externalRefs[id(node)] = ref
+                externalNodes.append(node)
+            return ref
+
+        data["edges"] = [self.dumpEdge(edge, getRef(edge.source), getRef(edge.target)) for edge in graph.allEdges]
+        data["externalNodes"] = self.nodeSchema.dump(externalNodes, many=True)
+        return data
+
+    @post_load
+    def makeGraphFromRows(self, data, **kwargs):
+        graph = self.makeGraph()
+        graph.nodes = data["nodes"]
+        graph.inEdges = {node.Id: list() for node in graph.nodes}
+        graph.outEdges = {node.Id: list() for node in graph.nodes}
+        graph.reindex()
+        graph.properties = data["properties"]
+
+        externalNodes = self.nodeSchema.load(data["externalNodes"], many=True)
+
+        def getNode(ref):
+            if ref is None:
+                return None
+            return graph.getNodeById(ref) if ref >= 0 else externalNodes[-1 - ref]
+
+        for row in data["edges"]:
+            graph.addEdge(self.loadEdge(row, getNode(row[0]), getNode(row[2])))
+        return graph
 
 
-class ASNodeSchema(Schema):
+class ASNodeSchema(OrderedSchema):
     Id = fields.Integer()
     kind = EnumField(ASNodeKind)
     line = fields.Integer()
     code = fields.String()
-    sharedId = fields.String(allow_none=True)
+    globalId = fields.Integer(allow_none=True)
     file = fields.String(allow_none=True)
+    cfgGlobalId = fields.Integer(allow_none=True, load_default=None)
+    dfgGlobalId = fields.Integer(allow_none=True, load_default=None)
     optionalProperties = fields.Dict()
 
     @post_load
@@ -32,38 +135,24 @@ class ASNodeSchema(Schema):
         asNode.Id = data["Id"]
         asNode.line = data["line"]
         asNode.code = data["code"]
-        asNode.sharedId = data["sharedId"]
-        asNode.file = data["file"]
+        asNode.globalId = data["globalId"]
+        asNode.file = internString(data["file"])
+        asNode.cfgGlobalId = data["cfgGlobalId"]
+        asNode.dfgGlobalId = data["dfgGlobalId"]
         asNode.optionalProperties = data["optionalProperties"]
         return asNode
 
 
-class ASEdgeSchema(Schema):
-    source = fields.Nested(ASNodeSchema())
-    label = fields.String(allow_none=True)
-    target = fields.Nested(ASNodeSchema())
+class AbstractSyntaxTreeSchema(GraphSchema):
+    nodeSchema = ASNodeSchema()
 
-    @post_load
-    def makeASEdge(self, data, **kwargs):
-        return ASEdge(**data)
-
-
-class AbstractSyntaxTreeSchema(Schema):
     nodes = fields.List(fields.Nested(ASNodeSchema()))
-    allEdges = fields.List(fields.Nested(ASEdgeSchema()))
-    inEdges = fields.Dict(keys=fields.Int(), values=fields.List(fields.Nested(ASEdgeSchema())))
-    outEdges = fields.Dict(keys=fields.Int(), values=fields.List(fields.Nested(ASEdgeSchema())))
-    properties = fields.Dict()
 
-    @post_load
-    def makeAbstractSyntaxTree(self, data, **kwargs):
-        AST = AbstractSyntaxTree()
-        AST.nodes = data["nodes"]
-        AST.allEdges = data["allEdges"]
-        AST.inEdges = data["inEdges"]
-        AST.outEdges = data["outEdges"]
-        AST.properties = data["properties"]
-        return AST
+    def makeGraph(self) -> AbstractSyntaxTree:
+        return AbstractSyntaxTree()
+
+    def loadEdge(self, row, source, target) -> ASEdge:
+        return ASEdge(source, row[1], target)
 
 
 # ****************************************************
@@ -71,12 +160,12 @@ class AbstractSyntaxTreeSchema(Schema):
 # ****************************************************
 
 
-class CFNodeSchema(Schema):
+class CFNodeSchema(OrderedSchema):
     Id = fields.Integer()
     kind = EnumField(CFNodeKind)
     line = fields.Integer()
     code = fields.String()
-    sharedId = fields.String(allow_none=True)
+    globalId = fields.Integer(allow_none=True)
     method = fields.String(allow_none=True)
     file = fields.String()
     optionalProperties = fields.Dict()
@@ -87,55 +176,42 @@ class CFNodeSchema(Schema):
         cfNode.Id = data["Id"]
         cfNode.line = data["line"]
         cfNode.code = data["code"]
-        cfNode.sharedId = data["sharedId"]
-        cfNode.method = data["method"]
-        cfNode.file = data["file"]
+        cfNode.globalId = data["globalId"]
+        cfNode.method = internString(data["method"])
+        cfNode.file = internString(data["file"])
         cfNode.optionalProperties = data["optionalProperties"]
         return cfNode
 
 
-class CFEdgeSchema(Schema):
-    source = fields.Nested(CFNodeSchema())
-    label = EnumField(CFEdgeKind)
-    target = fields.Nested(CFNodeSchema())
+class ControlFlowGraphSchema(GraphSchema):
+    nodeSchema = CFNodeSchema()
 
-    @post_load
-    def makeCFEdge(self, data, **kwargs):
-        return CFEdge(**data)
+    nodes = fields.List(fields.Nested(CFNodeSchema()))
 
+    def makeGraph(self) -> ControlFlowGraph:
+        return ControlFlowGraph()
 
-class ControlFlowGraphSchema(Schema):
-    nodes = fields.List(fields.Nested(CFNodeSchema()))
-    allEdges = fields.List(fields.Nested(CFEdgeSchema()))
-    inEdges = fields.Dict(keys=fields.Int(), values=fields.List(fields.Nested(CFEdgeSchema())))
-    outEdges = fields.Dict(keys=fields.Int(), values=fields.List(fields.Nested(CFEdgeSchema())))
-    properties = fields.Dict()
+    def dumpEdge(self, edge, source, target) -> list:
+        return [source, edge.label.name, target]
 
-    @post_load
-    def makeControlFlowGraph(self, data, **kwargs):
-        cfg = ControlFlowGraph()
-        cfg.nodes = data["nodes"]
-        cfg.allEdges = data["allEdges"]
-        cfg.inEdges = data["inEdges"]
-        cfg.outEdges = data["outEdges"]
-        cfg.properties = data["properties"]
-        return cfg
+    def loadEdge(self, row, source, target) -> CFEdge:
+        return CFEdge(source, CFEdgeKind[row[1]], target)
 
 # ************************************************
 # ***            Data Flow Graph               ***
 # ************************************************
 
 
-class DFNodeSchema(Schema):
+class DFNodeSchema(OrderedSchema):
     Id = fields.Integer()
     line = fields.Integer()
     code = fields.String()
-    sharedId = fields.String(allow_none=True)
+    globalId = fields.Integer(allow_none=True)
     method = fields.String(allow_none=True)
     file = fields.String()
-    DEFs = fields.List(fields.String())
-    USEs = fields.List(fields.String())
-    selfFlows = fields.List(fields.String())
+    DEFs = StringSet(fields.String())
+    USEs = StringSet(fields.String())
+    selfFlows = StringSet(fields.String())
     IP_DEFs = fields.Dict(allow_none=True)
     optionalProperties = fields.Dict()
 
@@ -145,9 +221,9 @@ class DFNodeSchema(Schema):
         dfNode.Id = data["Id"]
         dfNode.line = data["line"]
         dfNode.code = data["code"]
-        dfNode.sharedId = data["sharedId"]
-        dfNode.method = data["method"]
-        dfNode.file = data["file"]
+        dfNode.globalId = data["globalId"]
+        dfNode.method = internString(data["method"])
+        dfNode.file = internString(data["file"])
         dfNode.DEFs = data["DEFs"]
         dfNode.USEs = data["USEs"]
         dfNode.selfFlows = data["selfFlows"]
@@ -156,33 +232,19 @@ class DFNodeSchema(Schema):
         return dfNode
 
 
-class DFEdgeSchema(Schema):
-    source = fields.Nested(DFNodeSchema())
-    label = fields.String()
-    target = fields.Nested(DFNodeSchema(), allow_none=True)
-    kind = EnumField(DFEdgeKind)
+class DataFlowGraphSchema(GraphSchema):
+    nodeSchema = DFNodeSchema()
 
-    @post_load
-    def makeDFEdge(self, data, **kwargs):
-        return DFEdge(**data)
+    nodes = fields.List(fields.Nested(DFNodeSchema()))
 
+    def makeGraph(self) -> DataFlowGraph:
+        return DataFlowGraph()
 
-class DataFlowGraphSchema(Schema):
-    nodes = fields.List(fields.Nested(DFNodeSchema()))
-    allEdges = fields.List(fields.Nested(DFEdgeSchema()))
-    inEdges = fields.Dict(keys=fields.Int(), values=fields.List(fields.Nested(DFEdgeSchema())))
-    outEdges = fields.Dict(keys=fields.Int(), values=fields.List(fields.Nested(DFEdgeSchema())))
-    properties = fields.Dict()
+    def dumpEdge(self, edge, source, target) -> list:
+        return [source, edge.label, target, edge.kind.name]
 
-    @post_load
-    def makeDataFlowGraph(self, data, **kwargs):
-        dfg = DataFlowGraph()
-        dfg.nodes = data["nodes"]
-        dfg.allEdges = data["allEdges"]
-        dfg.inEdges = data["inEdges"]
-        dfg.outEdges = data["outEdges"]
-        dfg.properties = data["properties"]
-        return dfg
+    def loadEdge(self, row, source, target) -> DFEdge:
+        return DFEdge(source, row[1], target, DFEdgeKind[row[3]])
 
 
 # ****************************************************
@@ -190,7 +252,7 @@ class DataFlowGraphSchema(Schema):
 # ****************************************************
 
 
-class JavaFieldSchema(Schema):
+class JavaFieldSchema(OrderedSchema):
     name = fields.String()
     type = fields.String()
     isStatic = fields.String()
@@ -201,7 +263,7 @@ class JavaFieldSchema(Schema):
         return JavaField(**data)
 
 
-class JavaMethodSchema(Schema):
+class JavaMethodSchema(OrderedSchema):
     name = fields.String()
     isStatic = fields.Boolean()
     isAbstract = fields.Boolean()
@@ -217,7 +279,7 @@ class JavaMethodSchema(Schema):
         return JavaMethod(**data)
 
 
-class JavaClassSchema(Schema):
+class JavaClassSchema(OrderedSchema):
     name = fields.String()
     package = fields.String()
     filePath = fields.String()
@@ -251,7 +313,7 @@ class JavaClassSchema(Schema):
         return javaClass
 
 
-class TaintFlowSchema(Schema):
+class TaintFlowSchema(OrderedSchema):
     source = fields.Nested(DFNodeSchema())
     vulnerability = fields.String()
     sink = fields.Nested(DFNodeSchema())
@@ -1,15 +1,13 @@
+import os
 from antlr4 import *
 from typing import List
-from hashlib import md5
-
-from antlr4.tree.Tree import TerminalNodeImpl
 
+from antlr.JavaLexer import JavaLexer
+from antlr.JavaParser import JavaParser
+from NodeIdentity import formatSharedId, getGlobalIdByCtx
 from db import Database
 
 
-def md5sum(s: str):
-    return md5(s.encode()).hexdigest()
-
 class Stack:
     def __init__(self):
         self.items = []
@@ -65,10 +63,21 @@ class Queue:
         return el
 
 
+def parseJavaFile(filePath: str) -> JavaParser.CompilationUnitContext:
+    inputStream = FileStream(filePath)
+    lexer = JavaLexer(inputStream)
+    tokens = CommonTokenStream(lexer)
+    parser = JavaParser(tokens)
+    return parser.compilationUnit()
 
 
-
-
+def findJavaFiles(targetDir: str) -> List[str]:
+    filePaths = []
+    for dirname, dirnames, filenames in os.walk(targetDir):
+        for filename in filenames:
+            if filename.endswith(".java"):
+                filePaths.append(os.path.join(dirname, filename))
+    return filePaths
 
 
 def getOriginalCodeText(ctx: ParserRuleContext):
@@ -103,11 +112,8 @@ def isUsableExpression(expr: str) -> bool:
     return True
 
 
-def getIdByCtx(ctx):
-    if isinstance(ctx, TerminalNodeImpl):
-        return md5sum(ctx.__class__.__name__ + str(ctx.symbol.start) + str(ctx.symbol.stop))
-    else:
-        return md5sum(ctx.__class__.__name__ + str(ctx.start.start) + str(ctx.stop.stop))
+def getIdByCtx(ctx) -> str:
+    return formatSharedId(getGlobalIdByCtx(ctx))
 
 
 def escapeForHtml(code):
@@ -133,14 +139,9 @@ def doesMethodStateDef(name: str):
     return False
 
 def nodeContainsCall(node):
-    from db import Database
+    from db import Database, DBCollections
     from graphs.ast.ASNode import ASNodeKind
-    astNode = None
-    currentAST = None
-    for AST in Database().getAllASTs().values():
-        astNode = AST.getNodeByID(node.sharedId)
-        currentAST = AST
-        break
+    currentAST, astNode = Database().getIndexedNode(DBCollections.ASTs, node.getGlobalId())
 
     if astNode is None:
         return False
@@ -162,14 +163,9 @@ def nodeContainsCall(node):
     return containsCall
 
 def getCallName(node):
-    from db import Database
+    from db import Database, DBCollections
     from graphs.ast.ASNode import ASNodeKind
-    astNode = None
-    currentAST = None
-    for AST in Database().getAllASTs().values():
-        astNode = AST.getNodeByID(node.sharedId)
-        currentAST = AST
-        break
+    currentAST, astNode = Database().getIndexedNode(DBCollections.ASTs, node.getGlobalId())
     if astNode is None:
         return None
     queue = Queue()
@@ -213,13 +209,9 @@ def getCallArgs(node, ast):
 
 
 def nodeContainsReturn(node):
-    from db import Database
+    from db import Database, DBCollections
     from graphs.ast.ASNode import ASNodeKind
-    astNode = None
-
-    for AST in Database().getAllASTs().values():
-        astNode = AST.getNodeByID(node.sharedId)
-        break
+    astNode = Database().getIndexedNode(DBCollections.ASTs, node.getGlobalId())[1]
 
     if astNode is None:
         return False
@@ -264,17 +256,11 @@ def preToInfix(pre_exp_list):
 
 
 def hasSuperClass(childJavaClassName, superJavaClassName, db: Database) -> bool:
-    current = childJavaClassName
-    while True:
-        jc = db.getJavaClass(current)
-        if jc.extends is None:
-            break
-
-        if jc.extends == superJavaClassName:
+    index = db.getResolutionIndex()
+    for qn in index.getClassHierarchy(childJavaClassName):
+        if index.getJavaClass(qn).extends == superJavaClassName:
             return True
 
-        current = jc.package + "." + jc.extends
-
     return False
 
 def findCallers(methodQN: str) -> List[str]:
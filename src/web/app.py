@@ -1,18 +1,39 @@
 import os.path
+from typing import Optional
+
 from flask_cors import CORS
 from flask import Flask, render_template, send_from_directory, send_file, Response, make_response, url_for, abort
-import json
 
 from werkzeug.utils import redirect
 
 from config import Config
-from db import Database
+from MappedGraphStore import MappedGraphStore
+from db import Database, DBCollections
 from schemas import JavaClassSchema, JavaMethodSchema
 
 app = Flask(__name__)
 CORS(app)
 
 
+def getDatabase() -> Database:
+    # Страницы читают базу через Database, так что работают с любым хранилищем из config.json
+    return Database(app.config["PROJECT_CONFIG"])
+
+
+def getMappedStore() -> Optional[MappedGraphStore]:
+    path = app.config["PROJECT_CONFIG"].get("mapped-store")
+    if path is None or not os.path.exists(path):
+        return None
+    # writeMappedStore подменяет файл через os.replace, у нового файла другой inode - хранилище открывается
+    # заново. Прежнее не закрывается: его могут читать текущие запросы, отображение освободится вместе с ним
+    stat = os.stat(path)
+    version = (stat.st_ino, stat.st_mtime_ns)
+    if app.config.get("MAPPED_STORE_VERSION") != version:
+        app.config["MAPPED_STORE"] = MappedGraphStore(path)
+        app.config["MAPPED_STORE_VERSION"] = version
+    return app.config["MAPPED_STORE"]
+
+
 @app.route('/')
 def index():
     return redirect(url_for("showJavaClasses"))
@@ -20,8 +41,7 @@ def index():
 
 @app.route('/java-classes')
 def showJavaClasses():
-    with open(app.config["DB"], "r") as f:
-        javaClassesJson = json.load(f)["javaClasses"]
+    javaClassesJson = getDatabase().getAllSerialized(DBCollections.JavaClasses)
 
     javaClasses = dict()
     for qn, jc in javaClassesJson.items():
@@ -33,10 +53,7 @@ def showJavaClasses():
 
 @app.route("/methods/<string:qualifiedClassName>")
 def showMethods(qualifiedClassName):
-    with open(app.config["DB"], "r") as f:
-        javaClassesJson = json.load(f)["javaClasses"]
-
-    javaClass = javaClassesJson[qualifiedClassName]
+    javaClass = getDatabase().getSerialized(DBCollections.JavaClasses, qualifiedClassName)
     methods = javaClass["methods"]
     methods = JavaMethodSchema(many=True).load(methods)
 
@@ -45,10 +62,7 @@ def showMethods(qualifiedClassName):
 
 @app.route("/ast/<string:qualifiedClassName>")
 def showAST(qualifiedClassName):
-    with open(app.config["DB"], "r") as f:
-        javaClassesJson = json.load(f)["javaClasses"]
-
-    javaClass = JavaClassSchema().load(javaClassesJson[qualifiedClassName])
+    javaClass = JavaClassSchema().load(getDatabase().getSerialized(DBCollections.JavaClasses, qualifiedClassName))
     filename = os.path.splitext(os.path.basename(javaClass.filePath))[0]
 
     plotFilename = f"ast-{javaClass.package}.{filename}.svg"
@@ -88,10 +102,7 @@ def getPlot(kind, filename):
 
 @app.route("/source-code/<string:qualifiedClassName>")
 def getSourceCode(qualifiedClassName):
-    with open(app.config["DB"], "r") as f:
-        javaClassesJson = json.load(f)["javaClasses"]
-
-    javaClass = javaClassesJson.get(qualifiedClassName)
+    javaClass = getDatabase().getSerialized(DBCollections.JavaClasses, qualifiedClassName)
     filePath = javaClass["filePath"]
 
     with open(filePath) as f:
@@ -100,56 +111,42 @@ def getSourceCode(qualifiedClassName):
     return render_template("show-source-code.html", filePath=filePath, code=code)
 
 
-@app.route("/node/ast/<string:fileQN>/<int:nodeId>")
-def getAstNodeInfo(fileQN, nodeId):
-    with open(app.config["DB"]) as f:
-        ASTsJson = json.load(f)["asts"]
+def getNodeInfo(collection: str, qualifiedName: str, nodeId: int):
+    # Если задано отображаемое хранилище графов, узел читается из него без загрузки графа
+    store = getMappedStore()
+    if store is not None:
+        graph = store.getGraph(collection, qualifiedName)
+        node = graph.getNodeDataById(nodeId) if graph is not None else None
+        return node if node is not None else abort(404)
 
-    AST = ASTsJson.get(fileQN)
-    if AST is None:
+    graph = getDatabase().getSerialized(collection, qualifiedName)
+    if graph is None:
         return abort(404)
 
-    for node in AST["nodes"]:
+    for node in graph["nodes"]:
         if node["Id"] == nodeId:
             return node
 
     return abort(404)
 
 
-@app.route("/node/cfg/<string:methodQn>/<int:nodeId>")
-def getCfgNodeInfo(methodQn, nodeId):
-    with open(app.config["DB"]) as f:
-        CFGsJson = json.load(f)["cfgs"]
-
-    CFG = CFGsJson.get(methodQn)
-    if CFG is None:
-        return abort(404)
+@app.route("/node/ast/<string:fileQN>/<int:nodeId>")
+def getAstNodeInfo(fileQN, nodeId):
+    return getNodeInfo(DBCollections.ASTs, fileQN, nodeId)
 
-    for node in CFG["nodes"]:
-        if node["Id"] == nodeId:
-            return node
 
-    return abort(404)
+@app.route("/node/cfg/<string:methodQn>/<int:nodeId>")
+def getCfgNodeInfo(methodQn, nodeId):
+    return getNodeInfo(DBCollections.CFGs, methodQn, nodeId)
 
 
 @app.route("/node/dfg/<string:methodQn>/<int:nodeId>")
 def getDfgNodeInfo(methodQn, nodeId):
-    with open(app.config["DB"]) as f:
-        DFGsJson = json.load(f)["dfgs"]
-
-    DFG = DFGsJson.get(methodQn)
-    if DFG is None:
-        return abort(404)
-
-    for node in DFG["nodes"]:
-        if node["Id"] == nodeId:
-            return node
-
-    return abort(404)
+    return getNodeInfo(DBCollections.DFGs, methodQn, nodeId)
 
 
 def runWebApp(projectConfig):
-    app.config["DB"] = projectConfig["DB"]
+    app.config["PROJECT_CONFIG"] = projectConfig
     app.run()
 
 